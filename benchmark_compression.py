@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк сжатия PDF перед загрузкой в CloudConvert
+
+Для каждого PDF из каталога корпуса показывает сэкономленный объем, время сжатия
+и оценку выигрыша по времени загрузки. С флагом --ocr оба варианта файла
+конвертируются в CloudConvert и сравнивается распознанный текст.
+
+Использование:
+    python benchmark_compression.py corpus/ --bandwidth 10
+    python benchmark_compression.py corpus/ --ocr --min-similarity 0.98
+"""
+
+import sys
+import asyncio
+import argparse
+import difflib
+import tempfile
+from io import BytesIO
+from pathlib import Path
+
+import openpyxl
+
+from services.pdf_compressor import PdfCompressor
+
+
+def extract_text(xlsx_data: bytes) -> str:
+    """Текст всех ячеек книги в порядке листов и строк"""
+    workbook = openpyxl.load_workbook(BytesIO(xlsx_data), read_only=True)
+    parts = []
+    for sheet in workbook.worksheets:
+        for row in sheet.iter_rows(values_only=True):
+            parts.extend(str(value) for value in row if value is not None)
+    workbook.close()
+    return "\n".join(parts)
+
+
+async def convert(service, file_path: str, file_name: str, strategy: str):
+    """Конвертация файла в CloudConvert, возвращает XLSX или None"""
+    job_id = await service.start_conversion(file_path, file_name, strategy)
+    if not job_id:
+        return None
+    return await service.finish_conversion(job_id, file_name, strategy)
+
+
+async def run_benchmark(args) -> int:
+    corpus = sorted(Path(args.corpus).glob("*.pdf"))
+    if not corpus:
+        print(f"❌ В {args.corpus} нет PDF файлов")
+        return 1
+
+    # min_saving=0: в бенчмарке сжатый файл сохраняется при любом выигрыше
+    compressor = PdfCompressor(args.tool, dpi=args.dpi, min_saving=0, timeout=args.timeout)
+    if not compressor.available:
+        print("❌ Не найден ни Ghostscript (gs), ни qpdf")
+        return 1
+
+    service = None
+    if args.ocr:
+        from services.cloudconvert import CloudConvertService, STRATEGY_STANDARD
+        service = CloudConvertService()
+        strategy = args.strategy or STRATEGY_STANDARD
+
+    bytes_per_second = args.bandwidth * 1024 * 1024 / 8
+    print(f"🔧 {compressor.tool}, {args.dpi} dpi, загрузка {args.bandwidth} Мбит/с")
+    print(f"{'Файл':40} {'Было МБ':>8} {'Стало МБ':>8} {'Экон.':>6} {'Сжатие':>7} {'Выигрыш':>8}"
+          + (f" {'OCR':>6}" if args.ocr else ""))
+
+    total_original = total_compressed = 0
+    total_saved_time = 0.0
+    failed_quality = []
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for path in corpus:
+            target = str(Path(temp_dir) / f"{path.stem}_compressed.pdf")
+            result = await compressor.compress(str(path), target)
+            if result is None:
+                print(f"{path.name[:40]:40} ❌ ошибка сжатия")
+                continue
+
+            compressed_size = result.compressed_size if result.path else result.original_size
+            saved_time = result.upload_time_saved(bytes_per_second)
+            total_original += result.original_size
+            total_compressed += compressed_size
+            total_saved_time += saved_time
+
+            line = (f"{path.name[:40]:40} {result.original_size / 1048576:8.2f} {compressed_size / 1048576:8.2f} "
+                    f"{result.ratio:6.0%} {result.duration:6.1f}s {saved_time:+7.1f}s")
+
+            if service is not None:
+                original = await convert(service, str(path), path.name, strategy)
+                compressed = await convert(service, result.path or str(path), path.name, strategy)
+                if original is None or compressed is None:
+                    line += "      ❌"
+                    failed_quality.append(path.name)
+                else:
+                    similarity = difflib.SequenceMatcher(
+                        None, extract_text(original), extract_text(compressed)
+                    ).ratio()
+                    line += f" {similarity:6.1%}"
+                    if similarity < args.min_similarity:
+                        failed_quality.append(path.name)
+
+            print(line)
+
+    if total_original:
+        print("=" * 80)
+        print(f"Итого: {total_original / 1048576:.1f} МБ -> {total_compressed / 1048576:.1f} МБ "
+              f"(-{1 - total_compressed / total_original:.0%}), выигрыш по времени {total_saved_time:+.1f}s")
+
+    if failed_quality:
+        print(f"⚠️ Качество OCR ниже {args.min_similarity:.0%}: {', '.join(failed_quality)}")
+        return 1
+    return 0
+
+
+def main():
+    """Главная функция CLI"""
+    parser = argparse.ArgumentParser(description="Бенчмарк сжатия PDF перед загрузкой")
+    parser.add_argument('corpus', help='Каталог с PDF файлами')
+    parser.add_argument('--tool', default='auto', choices=['auto', 'ghostscript', 'qpdf'], help='Утилита сжатия')
+    parser.add_argument('--dpi', type=int, default=300, help='Разрешение изображений страниц')
+    parser.add_argument('--bandwidth', type=float, default=10, help='Скорость загрузки для оценки (Мбит/с)')
+    parser.add_argument('--timeout', type=float, default=300, help='Таймаут сжатия одного файла (секунды)')
+    parser.add_argument('--ocr', action='store_true', help='Сравнить результат OCR CloudConvert (расходует кредиты)')
+    parser.add_argument('--strategy', help='Стратегия конвертации для --ocr')
+    parser.add_argument('--min-similarity', type=float, default=0.98, help='Минимальное совпадение текста OCR')
+    args = parser.parse_args()
+
+    sys.exit(asyncio.run(run_benchmark(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,52 @@
 import asyncio
 import logging
+import os
+import socket
+import time
+import uuid
 from io import BytesIO
+from typing import Optional
 from telegram import Update
 from telegram.ext import ContextTypes
 from telegram.constants import ParseMode
 
-from services.cloudconvert import CloudConvertService
-from services.file_handler import FileHandler
-from services.database import Database
+from services.cloudconvert import CloudConvertService, CONVERSION_STRATEGIES, STRATEGY_STANDARD, STRATEGY_HIGH_QUALITY
+from services.pdf_inspector import inspect_pdf
+from services.pdf_compressor import PdfCompressor
+from services.circuit_breaker import CircuitOpenError
+from services.file_handler import FileHandler, FileTooLargeError, LocalFileUnavailableError
+from services.database import Database, AsyncDatabase
+from services.workbook_processor import WorkbookProcessor
+from services.claude_service import ClaudeService
+from services.text_enhancer import TextEnhancer
+from services.lazy_import import preload
+from services.pipeline import Pipeline, StageError
+from services.job_queue import WorkerPool, ConversionJob, QueueFullError
+from services.singleflight import SingleFlight
+from services.operation_log import OperationLogger
+from services.rate_limiter import RateLimiter
+from services.log_retention import LogRetention
+from services.temp_storage import TempStorage, StorageQuotaExceeded
+from services.metrics import (
+    CONVERSIONS, STAGE_DURATION, JOB_QUEUE_DEPTH, JOBS_IN_FLIGHT, CACHE_REQUESTS,
+    TEMP_STORAGE_BYTES, TEMP_STORAGE_QUOTA, TEMP_STORAGE_JOBS, PDF_COMPRESSIONS, PDF_COMPRESSION_SAVED_BYTES
+)
 from bot import messages
+from bot.progress import ProgressReporter
 from bot.keyboards import *
-from config.settings import MAX_FILE_SIZE, ERROR_MESSAGES, CLAUDE_ENABLED
-
-# Импортируем Claude сервис только если он включен
-if CLAUDE_ENABLED:
-    from services.claude_service import ClaudeService
+from config.settings import (
+    MAX_FILE_SIZE, ERROR_MESSAGES, JOB_INITIAL_DURATION_ESTIMATE,
+    JOB_LEASE_SECONDS, JOB_RECOVERY_INTERVAL, PROGRESS_EDITS_PER_SECOND,
+    OPERATION_LOG_MAX_QUEUE, OPERATION_LOG_SYNC,
+    USER_REQUEST_LIMIT, RATE_LIMIT_WINDOW, RATE_LIMIT_FILES_BURST, RATE_LIMIT_BYTES_PER_WINDOW,
+    RATE_LIMIT_PAGES_PER_WINDOW, RATE_LIMIT_SNAPSHOT_INTERVAL,
+    LOG_RETENTION_DAYS, LOG_ROLLUP_INTERVAL,
+    READY_MAX_QUEUE_DEPTH, READY_MAX_DB_PENDING,
+    TEMP_STORAGE_DIR, TEMP_STORAGE_QUOTA_MB, TEMP_STORAGE_WAIT_TIMEOUT, TEMP_STORAGE_SWEEP_INTERVAL,
+    TEMP_STORAGE_MAX_AGE, PDF_COMPRESSION_TOOL, ADMIN_USER_IDS
+)
+# Настраиваемые параметры (лимиты, интервалы, таймауты) читаются из runtime и перечитываются без перезапуска
+from config.runtime import runtime
 
 logger = logging.getLogger(__name__)
 
@@ -22,20 +54,92 @@ class BotHandlers:
     def __init__(self):
         self.cloudconvert = CloudConvertService()
         self.file_handler = FileHandler()
-        self.db = Database()
+        # Скачанные файлы лежат в директориях задач; при заполнении квоты воркеры ждут места
+        self.storage = TempStorage(
+            TEMP_STORAGE_DIR,
+            quota_bytes=TEMP_STORAGE_QUOTA_MB * 1024 * 1024,
+            sweep_interval=TEMP_STORAGE_SWEEP_INTERVAL,
+            max_age=TEMP_STORAGE_MAX_AGE,
+            wait_timeout=TEMP_STORAGE_WAIT_TIMEOUT
+        )
+        TEMP_STORAGE_BYTES.set_function(lambda: self.storage.used)
+        TEMP_STORAGE_QUOTA.set_function(lambda: self.storage.quota_bytes)
+        TEMP_STORAGE_JOBS.set_function(lambda: self.storage.jobs)
         
-        # Инициализируем Claude только если он включен
-        if CLAUDE_ENABLED:
-            self.claude = ClaudeService()
-        else:
-            self.claude = None
+        # Сжатие сканов перед загрузкой (опционально, только при наличии Ghostscript или qpdf)
+        self.compressor = self._build_compressor(runtime.current)
+        # Запросы к базе выполняются в отдельном потоке и не блокируют event loop
+        self.db = AsyncDatabase(Database())
+        # Журнал операций пишется пачками в фоне и не входит во время обработки
+        self.oplog = OperationLogger(
+            self.db,
+            flush_interval=runtime.operation_log_flush_interval_ms / 1000,
+            batch_size=runtime.operation_log_batch_size,
+            max_queue=OPERATION_LOG_MAX_QUEUE,
+            sync=OPERATION_LOG_SYNC
+        )
+        
+        # Лимиты пользователей проверяются в памяти, состояние периодически сохраняется в базу
+        self.rate_limiter = RateLimiter(
+            self.db,
+            {
+                'files': (USER_REQUEST_LIMIT, RATE_LIMIT_FILES_BURST),
+                'bytes': (RATE_LIMIT_BYTES_PER_WINDOW, RATE_LIMIT_BYTES_PER_WINDOW),
+                'pages': (RATE_LIMIT_PAGES_PER_WINDOW, RATE_LIMIT_PAGES_PER_WINDOW),
+            },
+            window=RATE_LIMIT_WINDOW,
+            snapshot_interval=RATE_LIMIT_SNAPSHOT_INTERVAL
+        )
+        self.log_retention = LogRetention(
+            self.db,
+            retention_days=LOG_RETENTION_DAYS,
+            interval=LOG_ROLLUP_INTERVAL,
+            batch_size=runtime.log_prune_batch_size
+        )
+        
+        # Claude включается и выключается без перезапуска (runtime.claude_enabled проверяется
+        # для каждой задачи), клиент Anthropic создается при первом запросе
+        self.claude = ClaudeService()
+        self.text_enhancer = TextEnhancer()
+        
+        self.pipeline = self._build_pipeline()
+        
+        # Конвертации выполняются фоновыми воркерами, обработчик только ставит задачу в очередь
+        self.worker_pool = WorkerPool(
+            self._run_job,
+            workers=runtime.worker_pool_size,
+            max_size=runtime.job_queue_max_size,
+            max_per_user=runtime.job_queue_max_per_user,
+            initial_job_duration=JOB_INITIAL_DURATION_ESTIMATE
+        )
+        JOB_QUEUE_DEPTH.set_function(self.worker_pool.queue.qsize)
+        JOBS_IN_FLIGHT.set_function(lambda: len(self.worker_pool.in_flight))
+        
+        # Правки статусных сообщений объединяются и ограничиваются по частоте
+        self.progress = ProgressReporter(runtime.progress_min_interval, PROGRESS_EDITS_PER_SECOND)
+        
+        # Перечитанные настройки применяются к компонентам, которые хранят значения у себя
+        runtime.add_listener(self._apply_settings)
+        
+        # Идентификатор процесса-владельца аренды задач в conversion_jobs
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.bot = None
+        self._known_jobs = set()
+        self._recovery_task = None
+        self._preload_task = None
+        
+        # Одинаковые файлы, присланные одновременно, конвертируются один раз
+        self.singleflight = SingleFlight()
+        self._flights = {}  # id задачи -> future, результат которой ждут дубликаты
+        self._joined = {}  # id задачи-дубликата -> future лидера
+        self._follower_tasks = set()
     
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /start"""
         user = update.effective_user
         
         # Логируем старт
-        self.db.log_operation(user.id, user.username, "start", "completed")
+        await self.oplog.log_operation(user.id, user.username, "start", "completed")
         
         await update.message.reply_text(
             messages.START_MESSAGE,
@@ -61,9 +165,19 @@ class BotHandlers:
     async def status_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /status"""
         user_id = update.effective_user.id
-        active_task = self.db.get_active_task(user_id)
+        active_task = await self.db.get_active_task(user_id)
+        queue_position = self.worker_pool.queue.first_position(user_id)
         
-        if not active_task:
+        if not active_task and queue_position is not None:
+            await update.message.reply_text(
+                messages.STATUS_QUEUED_TASK.format(
+                    position=queue_position,
+                    eta=messages.format_eta(self.worker_pool.estimate_wait(queue_position))
+                ),
+                parse_mode=ParseMode.MARKDOWN,
+                reply_markup=get_status_keyboard()
+            )
+        elif not active_task:
             await update.message.reply_text(
                 messages.STATUS_NO_ACTIVE_TASKS,
                 parse_mode=ParseMode.MARKDOWN
@@ -80,24 +194,99 @@ class BotHandlers:
                 reply_markup=get_status_keyboard()
             )
     
-    async def handle_document(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Обработчик получения документа"""
+    async def reload_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /reload (только для ADMIN_USER_IDS)"""
         user = update.effective_user
-        document = update.message.document
+        if user.id not in ADMIN_USER_IDS:
+            await update.message.reply_text(messages.ADMIN_ONLY)
+            return
         
-        # Проверяем лимит запросов
-        if not self.db.check_user_rate_limit(user.id):
+        try:
+            changes = runtime.reload()
+        except ValueError as e:
+            logger.error(f"Settings reload failed: {e}")
+            await self.oplog.log_operation(user.id, user.username, "reload", "failed", error_message=str(e))
             await update.message.reply_text(
-                messages.ERROR_RATE_LIMIT,
+                messages.RELOAD_FAILED.format(error=e),
                 parse_mode=ParseMode.MARKDOWN
             )
             return
         
+        await self.oplog.log_operation(user.id, user.username, "reload", "completed")
+        if changes:
+            text = messages.RELOAD_SUCCESS.format(
+                version=runtime.version,
+                changes="\n".join(f"• `{name}`: {old} → {value}" for name, (old, value) in changes.items())
+            )
+        else:
+            text = messages.RELOAD_NO_CHANGES.format(version=runtime.version)
+        await update.message.reply_text(text, parse_mode=ParseMode.MARKDOWN)
+    
+    def reload_settings(self):
+        """Перечитывание настроек по SIGHUP"""
+        try:
+            runtime.reload()
+        except ValueError as e:
+            logger.error(f"Settings reload failed, keeping version {runtime.version}: {e}")
+    
+    def _apply_settings(self, settings, changes: dict):
+        """Применение перечитанных настроек к компонентам, которые хранят значения у себя"""
+        if not changes:
+            return
+        
+        queue = self.worker_pool.queue
+        queue.max_size = settings.job_queue_max_size
+        queue.max_per_user = settings.job_queue_max_per_user
+        if settings.worker_pool_size != self.worker_pool.workers:
+            try:
+                asyncio.get_running_loop().create_task(self.worker_pool.resize(settings.worker_pool_size))
+            except RuntimeError:
+                # Пул еще не запущен: start() создаст нужное число воркеров
+                self.worker_pool.workers = settings.worker_pool_size
+        
+        self.progress.min_interval = settings.progress_min_interval
+        self.oplog.flush_interval = settings.operation_log_flush_interval_ms / 1000
+        self.oplog.batch_size = settings.operation_log_batch_size
+        self.log_retention.batch_size = settings.log_prune_batch_size
+        
+        if any(name.startswith('pdf_compression_') or name == 'stage_timeouts.compress' for name in changes):
+            self.compressor = self._build_compressor(settings)
+        
+        # Claude включен после запуска без него: anthropic импортируется в фоне, а не в event loop
+        if 'claude_manual_enabled' in changes and settings.claude_enabled:
+            try:
+                self._preload_task = asyncio.get_running_loop().create_task(
+                    asyncio.to_thread(preload, 'anthropic')
+                )
+            except RuntimeError:
+                pass
+    
+    @staticmethod
+    def _build_compressor(settings) -> Optional[PdfCompressor]:
+        """Компрессор PDF по настройкам или None, если сжатие выключено или утилиты нет"""
+        if not settings.pdf_compression_enabled:
+            return None
+        compressor = PdfCompressor(
+            PDF_COMPRESSION_TOOL,
+            dpi=settings.pdf_compression_dpi,
+            min_saving=settings.pdf_compression_min_saving,
+            timeout=settings.stage_timeouts['compress']
+        )
+        if not compressor.available:
+            logger.warning("PDF compression is enabled but neither Ghostscript nor qpdf is installed")
+            return None
+        return compressor
+    
+    async def handle_document(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик получения документа"""
+        user = update.effective_user
+        document = update.message.document
+        
         # Проверяем размер файла
         if document.file_size > MAX_FILE_SIZE:
             size_mb = round(document.file_size / (1024*1024), 2)
             await update.message.reply_text(
-                messages.ERROR_FILE_TOO_LARGE.format(size=size_mb),
+                messages.ERROR_FILE_TOO_LARGE.format(size=size_mb, max_size=MAX_FILE_SIZE // (1024*1024)),
                 parse_mode=ParseMode.MARKDOWN
             )
             return
@@ -110,171 +299,837 @@ class BotHandlers:
             )
             return
         
-        # Начинаем обработку файла
-        await self._process_file(update, context, document)
+        # CloudConvert недоступен - не принимаем файлы, которые все равно не удастся конвертировать
+        if self.cloudconvert.breaker.is_open:
+            await update.message.reply_text(
+                messages.ERROR_API_UNAVAILABLE,
+                parse_mode=ParseMode.MARKDOWN
+            )
+            return
+        
+        # Очередь заполнена - отказываем до списания лимитов, чтобы отклоненный файл их не расходовал
+        try:
+            self.worker_pool.queue.ensure_capacity(user.id)
+        except QueueFullError as e:
+            logger.warning(f"Rejected file from user {user.id}: {e}")
+            await update.message.reply_text(
+                messages.ERROR_QUEUE_FULL,
+                parse_mode=ParseMode.MARKDOWN
+            )
+            return
+        
+        # Проверяем лимит запросов (после проверок файла, чтобы отклоненный файл не расходовал лимит)
+        allowed, retry_after = self.rate_limiter.check(user.id, files=1, size=document.file_size or 0)
+        if not allowed:
+            await update.message.reply_text(
+                messages.ERROR_RATE_LIMIT.format(retry_after=messages.format_wait(retry_after)),
+                parse_mode=ParseMode.MARKDOWN
+            )
+            return
+        
+        # Ставим файл в очередь конвертации
+        await self._enqueue_file(update, context, document)
     
-    async def _process_file(self, update: Update, context: ContextTypes.DEFAULT_TYPE, document):
-        """Обработка PDF файла"""
+    async def _enqueue_file(self, update: Update, context: ContextTypes.DEFAULT_TYPE, document):
+        """Постановка файла в очередь; конвертацию выполняют фоновые воркеры"""
         user = update.effective_user
+        self.bot = context.bot
         
-        # Отправляем сообщение о начале обработки
-        size_mb = round(document.file_size / (1024*1024), 2)
+        # Сообщение с позицией отправляем до постановки, чтобы воркер всегда мог его редактировать
+        position = self.worker_pool.queue.next_position(user.id)
         processing_msg = await update.message.reply_text(
-            messages.PROCESSING_START.format(filename=document.file_name, size=size_mb),
+            messages.QUEUED_MESSAGE.format(
+                filename=document.file_name,
+                position=position,
+                eta=messages.format_eta(self.worker_pool.estimate_wait(position))
+            ),
             parse_mode=ParseMode.MARKDOWN
         )
         
+        # Логируем операцию
+        operation_id = await self.oplog.log_operation(
+            user.id, user.username, "conversion", "processing",
+            document.file_name, document.file_size
+        )
+        
+        # Задача сохраняется в базе до постановки в очередь и переживает рестарт процесса
+        db_job_id = await self.db.create_job(
+            user.id, user.username, update.effective_chat.id, update.message.message_id,
+            processing_msg.message_id, document.file_id, document.file_unique_id,
+            document.file_name, document.file_size, operation_id
+        )
+        
         try:
-            # Логируем операцию
-            operation_id = self.db.log_operation(
-                user.id, user.username, "conversion", "processing",
-                document.file_name, document.file_size
+            await self._submit_job(await self.db.get_job(db_job_id))
+        except QueueFullError as e:
+            logger.warning(f"Rejected file from user {user.id}: {e}")
+            # Очередь заполнилась, пока сохранялась задача - списанные лимиты возвращаются
+            self.rate_limiter.refund(user.id, files=1, size=document.file_size or 0)
+            await self.db.finish_job(db_job_id, "failed", "Queue is full")
+            self.oplog.update_operation_status(operation_id, "error", "Queue is full")
+            await processing_msg.edit_text(
+                messages.ERROR_QUEUE_FULL,
+                parse_mode=ParseMode.MARKDOWN
             )
+    
+    async def _submit_job(self, job_row: dict, enforce_limits: bool = True):
+        """Постановка записи conversion_jobs в очередь воркеров"""
+        job = ConversionJob(job_row['user_id'], job_row)
+        file_key = f"file:{job_row['file_unique_id']}" if job_row['file_unique_id'] else None
+        
+        # Тот же файл уже конвертируется - ждем общий результат вместо новой задачи CloudConvert
+        flight = self.singleflight.get(file_key) if file_key else None
+        if flight is not None:
+            self._follow(job, flight)
+            return
+        
+        self._known_jobs.add(job_row['id'])
+        if file_key:
+            self._flights[job_row['id']] = self.singleflight.lead(file_key)
+        try:
+            await self.worker_pool.submit(job, enforce_limits=enforce_limits)
+        except QueueFullError:
+            self._known_jobs.discard(job_row['id'])
+            self._release_flight(job_row['id'])
+            raise
+    
+    async def _cancel_queued_jobs(self, user_id: int) -> int:
+        """Отмена ожидающих задач пользователя.
+        
+        Запись conversion_jobs закрывается, иначе recover_jobs выполнит отмененную задачу после рестарта.
+        """
+        jobs = self.worker_pool.cancel_user_jobs(user_id)
+        for job in jobs:
+            db_job_id = job.payload['id']
+            await self.db.finish_job(db_job_id, "cancelled")
+            if job.payload['operation_id']:
+                self.oplog.update_operation_status(job.payload['operation_id'], "cancelled")
+            self._known_jobs.discard(db_job_id)
+            # Дубликаты, ждущие отмененного лидера, конвертируют файл сами, ключ освобождается для новых загрузок
+            self._release_flight(db_job_id)
+        
+        if jobs:
+            logger.info(f"Cancelled {len(jobs)} queued jobs of user {user_id}")
+        return len(jobs)
+    
+    def _follow(self, job: ConversionJob, flight):
+        """Задача-дубликат: не занимает воркер, ждет результат лидера и отправляет свой ответ"""
+        logger.info(f"Job {job.payload['id']} of user {job.user_id} joins in-flight conversion "
+                    f"of {job.payload['file_name']}")
+        self._known_jobs.add(job.payload['id'])
+        self._joined[job.payload['id']] = flight
+        
+        task = asyncio.create_task(self._run_follower(job, flight))
+        self._follower_tasks.add(task)
+        task.add_done_callback(self._follower_tasks.discard)
+    
+    async def _run_follower(self, job: ConversionJob, flight):
+        """Ожидание лидера: пока он в очереди - без ограничения, после старта - не дольше всех его стадий.
+        
+        Лидер завершился без результата (ошибка, отмена его владельцем) - задача ставится
+        в очередь и конвертирует файл сама.
+        """
+        db_job_id = job.payload['id']
+        await self.singleflight.wait_started(flight)
+        if not flight.done():
+            await self._edit_status(dict(job.payload, bot=self.bot), messages.CONVERSION_MESSAGES['processing'])
+        try:
+            await asyncio.wait_for(asyncio.shield(flight), timeout=sum(runtime.current.stage_timeouts.values()))
+        except asyncio.TimeoutError:
+            # Стадия join завершит задачу ошибкой таймаута
+            pass
+        
+        if flight.done() and flight.result() is None:
+            logger.info(f"Leader of job {db_job_id} finished without result, converting "
+                        f"{job.payload['file_name']} separately")
+            self._joined.pop(db_job_id, None)
+            self._known_jobs.discard(db_job_id)
+            try:
+                await self._submit_job(job.payload, enforce_limits=False)
+            except QueueFullError:
+                # Очередь заполнена - задачу подхватит recover_jobs
+                logger.warning(f"Queue is full, job {db_job_id} will be recovered later")
+            return
+        
+        await self._run_job(job)
+    
+    def _release_flight(self, db_job_id: int):
+        """Завершение работы лидера без результата (дубликаты конвертируют файл сами)"""
+        flight = self._flights.pop(db_job_id, None)
+        if flight is not None:
+            self.singleflight.resolve(flight, None)
+    
+    def get_readiness_checks(self) -> dict:
+        """Проверки готовности принимать новые файлы: имя -> функция, возвращающая (ok, значение)"""
+        queue = self.worker_pool.queue
+        return {
+            'job_queue': lambda: (READY_MAX_QUEUE_DEPTH <= 0 or queue.qsize() < READY_MAX_QUEUE_DEPTH, queue.qsize()),
+            'cloudconvert': lambda: (not self.cloudconvert.breaker.is_open, self.cloudconvert.breaker.state),
+            'db_writer': lambda: (self.db.pending <= READY_MAX_DB_PENDING, self.db.pending),
+            'operation_log': lambda: (self.oplog.get_stats()['queued'] < self.oplog.max_queue // 2,
+                                      self.oplog.get_stats()['queued']),
+        }
+    
+    async def on_startup(self, application):
+        """Запуск воркеров и восстановление незавершенных задач после рестарта"""
+        self.bot = application.bot
+        await self.oplog.start()
+        await self.rate_limiter.start()
+        await self.log_retention.start()
+        await self.storage.start()
+        await self.worker_pool.start()
+        await self.recover_jobs()
+        self._recovery_task = asyncio.create_task(self._recovery_loop())
+        # Тяжелые модули импортируются в фоне после запуска, а не при первой конвертации в event loop
+        modules = ['openpyxl', 'anthropic'] if runtime.claude_enabled else ['openpyxl']
+        self._preload_task = asyncio.create_task(asyncio.to_thread(preload, *modules))
+    
+    async def on_shutdown(self, application):
+        """Остановка воркеров; незавершенные задачи останутся в базе и будут подхвачены после рестарта"""
+        if self._recovery_task:
+            self._recovery_task.cancel()
+        for task in list(self._follower_tasks):
+            task.cancel()
+        await self.log_retention.stop()
+        await self.storage.stop()
+        await self.worker_pool.stop()
+        await self.oplog.stop()
+        await self.rate_limiter.stop()
+        await self.db.close()
+    
+    async def recover_jobs(self) -> int:
+        """Повторная постановка задач без действующей аренды (visibility timeout истек)"""
+        recovered = 0
+        for job_row in await self.db.get_recoverable_jobs():
+            if job_row['id'] in self._known_jobs:
+                continue
             
-            # Скачиваем файл
-            file = await context.bot.get_file(document.file_id)
-            file_data = await file.download_as_bytearray()
+            await self._submit_job(job_row, enforce_limits=False)
+            recovered += 1
+            if job_row['cc_job_id']:
+                logger.info(f"Reattaching job {job_row['id']} to CloudConvert job {job_row['cc_job_id']}")
+        
+        if recovered:
+            logger.info(f"Recovered {recovered} unfinished conversion jobs")
+        return recovered
+    
+    async def _recovery_loop(self):
+        """Периодический поиск задач с истекшей арендой"""
+        while True:
+            await asyncio.sleep(JOB_RECOVERY_INTERVAL)
+            try:
+                await self.recover_jobs()
+            except Exception as e:
+                logger.error(f"Error recovering jobs: {e}")
+    
+    async def _run_job(self, job: ConversionJob):
+        """Выполнение задачи из очереди воркером под арендой"""
+        job_row = job.payload
+        db_job_id = job_row['id']
+        
+        try:
+            # Аренда защищает от двойной обработки (например, при пересечении старого и нового процесса)
+            if not await self.db.claim_job(db_job_id, self.worker_id, JOB_LEASE_SECONDS):
+                logger.info(f"Job {db_job_id} is leased by another worker, skipping")
+                return
             
-            # Сохраняем в базу активную задачу
-            self.db.save_active_task(user.id, f"temp_{user.id}", document.file_name)
+            # Дубликаты начинают отсчет ожидания с момента старта лидера
+            if db_job_id in self._flights:
+                self.singleflight.mark_started(self._flights[db_job_id])
             
-            # Обновляем сообщение
-            await processing_msg.edit_text(
-                messages.CONVERSION_MESSAGES['uploading'],
-                parse_mode=ParseMode.MARKDOWN
-            )
+            heartbeat = asyncio.create_task(self._renew_lease(db_job_id))
+            try:
+                error = await self._process_file(job_row, queue_wait=time.monotonic() - job.enqueued_at)
+            finally:
+                heartbeat.cancel()
             
-            # Конвертируем файл
-            await processing_msg.edit_text(
-                messages.CONVERSION_MESSAGES['processing'],
-                parse_mode=ParseMode.MARKDOWN
-            )
+            if error is None:
+                await self.db.finish_job(db_job_id, "done")
+            else:
+                await self.db.finish_job(db_job_id, "failed", error)
+        finally:
+            self._known_jobs.discard(db_job_id)
+            self._joined.pop(db_job_id, None)
+            self._release_flight(db_job_id)
+    
+    async def _renew_lease(self, db_job_id: int):
+        """Продление аренды задачи, пока она обрабатывается"""
+        while True:
+            await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+            if not await self.db.renew_job_lease(db_job_id, self.worker_id, JOB_LEASE_SECONDS):
+                logger.warning(f"Lost lease for job {db_job_id}")
+    
+    def _build_pipeline(self) -> Pipeline:
+        """Конвейер обработки PDF: каждая стадия выполняется ровно один раз"""
+        # Задача, восстановленная после рестарта с уже известным id CloudConvert,
+        # не скачивается и не загружается повторно - сразу переходим к ожиданию результата
+        reattached = lambda ctx: bool(ctx.get('cc_job_id'))
+        # Дубликат получил готовый результат лидера (или файл уже отправлен из кеша) -
+        # конвертационные стадии не нужны
+        deduplicated = lambda ctx: bool(ctx.get('deduplicated') or ctx.get('delivered'))
+        # Таймауты и переключатели стадий берутся из настроек, с которыми задача началась
+        timeout = lambda stage: (lambda ctx: ctx['settings'].stage_timeouts[stage])
+        # Ожидание выполняющегося лидера не дольше, чем лидер может выполнять все свои стадии
+        # (дубликат по file_unique_id ждет лидера до запуска конвейера, в _run_follower)
+        join_timeout = lambda ctx: sum(ctx['settings'].stage_timeouts.values())
+        
+        pipeline = Pipeline("conversion")
+        pipeline.add_stage("cached", self._stage_cached, timeout('reply'),
+                           skip_if=lambda ctx: not ctx.get('file_unique_id'))
+        pipeline.add_stage("join", self._stage_join, timeout('reply'),
+                           skip_if=lambda ctx: ctx.get('joined_flight') is None or deduplicated(ctx))
+        pipeline.add_stage("download", self._stage_download, timeout('download'),
+                           skip_if=lambda ctx: reattached(ctx) or deduplicated(ctx))
+        # Лимит страниц проверяется по разбору PDF, поэтому при нем проверка выполняется всегда
+        pipeline.add_stage("inspect", self._stage_inspect, timeout('inspect'),
+                           skip_if=lambda ctx: not (ctx['settings'].pdf_inspection_enabled
+                                                    or 'pages' in self.rate_limiter.limits)
+                           or 'file_path' not in ctx)
+        pipeline.add_stage("dedup", self._stage_dedup, join_timeout, skip_if=lambda ctx: 'file_path' not in ctx)
+        pipeline.add_stage("compress", self._stage_compress, timeout('compress'),
+                           skip_if=lambda ctx: not ctx['settings'].pdf_compression_enabled
+                           or self.compressor is None or 'file_path' not in ctx
+                           or reattached(ctx) or deduplicated(ctx))
+        pipeline.add_stage("upload", self._stage_upload, timeout('upload'),
+                           skip_if=lambda ctx: reattached(ctx) or deduplicated(ctx))
+        pipeline.add_stage("ocr", self._stage_ocr, timeout('ocr'), skip_if=deduplicated)
+        # Постобработка не критична: при ошибке или таймауте отправляется результат CloudConvert как есть
+        # (книгу, которую еще может менять поток прерванной стадии, не сериализуем)
+        def unprocessed(ctx):
+            ctx['processor'] = None
+            ctx['enhancement_stats'] = None
+            ctx['result_data'] = ctx['converted_data']
+        
+        pipeline.add_stage("forced_replacement", self._stage_forced_replacement,
+                           timeout('forced_replacement'), skip_if=deduplicated,
+                           critical=False, fallback=unprocessed)
+        pipeline.add_stage("enhancement", self._stage_enhancement, timeout('enhancement'),
+                           skip_if=lambda ctx: not ctx['settings'].claude_enabled or ctx.get('processor') is None,
+                           critical=False, fallback=unprocessed)
+        pipeline.add_stage("stats", self._stage_stats, timeout('stats'), skip_if=deduplicated,
+                           critical=False, fallback=unprocessed)
+        pipeline.add_stage("reply", self._stage_reply, timeout('reply'),
+                           skip_if=lambda ctx: bool(ctx.get('delivered')))
+        return pipeline
+    
+    async def _process_file(self, job_row: dict, queue_wait: float = 0.0) -> Optional[str]:
+        """Обработка PDF файла, возвращает текст ошибки или None при успехе"""
+        user_id = job_row['user_id']
+        operation_id = job_row['operation_id']
+        
+        ctx = dict(job_row)
+        # Снимок настроек на всю задачу: перечитанные значения действуют со следующей задачи
+        ctx['settings'] = runtime.current
+        ctx['bot'] = self.bot
+        ctx['flight'] = self._flights.get(job_row['id'])
+        ctx['joined_flight'] = self._joined.get(job_row['id'])
+        # Длительности попыток внутри стадий: (стадия, секунды, стратегия)
+        ctx['stage_details'] = []
+        
+        try:
+            # Активная задача; id задачи CloudConvert появится после загрузки файла
+            await self.db.save_active_task(user_id, job_row['cc_job_id'], job_row['file_name'])
             
-            # Выполняем конвертацию
-            converted_data = await self.cloudconvert.convert_pdf_to_xlsx(
-                bytes(file_data), document.file_name
+            # Сообщаем о начале обработки
+            size_mb = round((job_row['file_size'] or 0) / (1024*1024), 2)
+            await self._edit_status(
+                ctx, messages.PROCESSING_START.format(filename=job_row['file_name'], size=size_mb)
             )
             
-            if converted_data:
-                # Успешная конвертация
-                await processing_msg.edit_text(
-                    messages.CONVERSION_SUCCESS,
-                    parse_mode=ParseMode.MARKDOWN
-                )
-                
-                # Анализ и улучшение качества с помощью Claude AI (если включен)
-                enhanced_data = converted_data
-                enhancement_stats = None
-                
-                try:
-                    from config.settings import CLAUDE_ENABLED
-                    from services.text_enhancer import TextEnhancer
-                    
-                    if CLAUDE_ENABLED:
-                        await processing_msg.edit_text(
-                            messages.CONVERSION_MESSAGES['enhancing'],
-                            parse_mode=ParseMode.MARKDOWN
-                        )
-                        
-                        enhancer = TextEnhancer()
-                        
-                        # Анализируем оригинальный файл
-                        try:
-                            import openpyxl
-                            from io import BytesIO
-                            
-                            workbook = openpyxl.load_workbook(BytesIO(converted_data))
-                            original_text = ""
-                            for sheet in workbook.worksheets:
-                                for row in sheet.iter_rows():
-                                    for cell in row:
-                                        if cell.value and isinstance(cell.value, str):
-                                            original_text += cell.value + " "
-                            
-                            # Улучшаем файл
-                            enhanced_data = await enhancer.process_xlsx_file(converted_data, document.file_name)
-                            
-                            # Анализируем улучшенный файл
-                            if enhanced_data != converted_data:
-                                workbook_enhanced = openpyxl.load_workbook(BytesIO(enhanced_data))
-                                enhanced_text = ""
-                                for sheet in workbook_enhanced.worksheets:
-                                    for row in sheet.iter_rows():
-                                        for cell in row:
-                                            if cell.value and isinstance(cell.value, str):
-                                                enhanced_text += cell.value + " "
-                                
-                                enhancement_stats = enhancer.get_enhancement_stats(original_text, enhanced_text)
-                                logger.info(f"Text enhancement stats: {enhancement_stats}")
-                            
-                        except Exception as analysis_error:
-                            logger.error(f"Error in text analysis: {analysis_error}")
-                            
-                except ImportError:
-                    logger.info("Claude AI enhancement not available")
-                except Exception as claude_error:
-                    logger.error(f"Error in Claude AI enhancement: {claude_error}")
-                
-                # Отправляем файл
-                await processing_msg.edit_text(
-                    messages.CONVERSION_MESSAGES['finalizing'],
-                    parse_mode=ParseMode.MARKDOWN
-                )
-                
-                # Генерируем имя XLSX файла
-                xlsx_name = document.file_name.replace('.pdf', '.xlsx')
-                
-                # Формируем caption с информацией о качестве
-                caption = "✅ Конвертация завершена успешно!"
-                
-                if enhancement_stats and enhancement_stats['improvement'] > 0:
-                    caption += f"\n🤖 Текст улучшен с помощью Claude AI"
-                    caption += f"\n📈 Качество: {enhancement_stats['original_score']:.0f}% → {enhancement_stats['enhanced_score']:.0f}%"
-                    if enhancement_stats['ukrainian_chars_fixed'] > 0:
-                        caption += f"\n🔧 Исправлено украинских символов: {enhancement_stats['ukrainian_chars_fixed']}"
-                    if enhancement_stats['ocr_errors_fixed'] > 0:
-                        caption += f"\n🔧 Исправлено OCR ошибок: {enhancement_stats['ocr_errors_fixed']}"
-                elif CLAUDE_ENABLED:
-                    caption += "\n✅ Качество проверено - улучшения не требуются"
-                
-                # Отправляем файл
-                await update.message.reply_document(
-                    document=BytesIO(enhanced_data),
-                    filename=xlsx_name,
-                    caption=caption,
-                    reply_markup=get_success_keyboard()
-                )
-                
+            run = await self.pipeline.run(ctx)
+            logger.info(f"Pipeline timings for {job_row['file_name']}: {run.format_timings()}")
+            self._record_timings(ctx, run, queue_wait)
+            
+            # Результат (и file_id отправленного XLSX) передается задачам-дубликатам
+            self._publish_result(ctx)
+            
+            if run.succeeded:
                 # Обновляем статус в базе
-                self.db.update_operation_status(operation_id, "completed")
-                
+                self.oplog.update_operation_status(operation_id, "completed")
+                if ctx.get('delivered'):
+                    CONVERSIONS.inc(outcome='cached')
+                elif ctx.get('deduplicated'):
+                    CONVERSIONS.inc(outcome='deduplicated')
+                else:
+                    CONVERSIONS.inc(outcome='success')
+                return None
+            
+            CONVERSIONS.inc(outcome=run.error.reason if isinstance(run.error, StageError) else 'error')
+            
+            await self._report_pipeline_error(ctx, run.error)
+            
+            # Обновляем статус в базе
+            if isinstance(run.error, StageError) and run.error.reason == "conversion_failed":
+                error = "Conversion failed"
             else:
-                # Ошибка конвертации
-                await processing_msg.edit_text(
-                    messages.ERROR_CONVERSION_FAILED,
-                    parse_mode=ParseMode.MARKDOWN,
-                    reply_markup=get_error_keyboard()
-                )
-                
-                # Обновляем статус в базе
-                self.db.update_operation_status(operation_id, "error", "Conversion failed")
+                error = f"{run.failed_stage}: {run.error}"
+            self.oplog.update_operation_status(operation_id, "error", error)
+            return error
         
         except Exception as e:
             logger.error(f"Error processing file: {e}")
             
-            await processing_msg.edit_text(
-                messages.ERROR_API_UNAVAILABLE,
-                parse_mode=ParseMode.MARKDOWN,
-                reply_markup=get_error_keyboard()
-            )
+            await self._edit_status(ctx, messages.ERROR_API_UNAVAILABLE, final=True,
+                                    reply_markup=get_error_keyboard())
             
             # Обновляем статус в базе
-            if 'operation_id' in locals():
-                self.db.update_operation_status(operation_id, "error", str(e))
+            self.oplog.update_operation_status(operation_id, "error", str(e))
+            CONVERSIONS.inc(outcome='error')
+            return str(e)
         
         finally:
-            # Удаляем активную задачу
-            self.db.remove_active_task(user.id)
+            # Удаляем активную задачу и директорию задачи со скачанным PDF;
+            # файл локального сервера Bot API принадлежит серверу и не удаляется
+            await self.db.remove_active_task(user_id)
+            await self.storage.release(ctx['id'])
+    
+    def _record_timings(self, ctx: dict, run, queue_wait: float):
+        """Сохранение длительностей стадий операции (стадии помечаются итоговой стратегией)"""
+        strategy = ctx.get('strategy')
+        stages = [('queue', queue_wait, None)]
+        stages.extend((name, duration, strategy) for name, duration in run.timings.items())
+        stages.extend(ctx['stage_details'])
+        stages.append(('total', run.total_time, strategy))
+        for name, duration, _ in stages:
+            STAGE_DURATION.observe(duration, stage=name)
+        self.oplog.log_stage_timings(ctx['operation_id'], stages, ctx.get('file_size'))
+    
+    async def _edit_status(self, ctx: dict, text: str, percent: Optional[float] = None,
+                           final: bool = False, **kwargs):
+        """Обновление статусного сообщения задачи (работает и для задач, восстановленных после рестарта).
+        
+        Промежуточные состояния объединяются ProgressReporter, final=True отправляется сразу.
+        """
+        await self.progress.update(
+            ctx['bot'], ctx['chat_id'], ctx['status_message_id'], text,
+            percent=percent, final=final, **kwargs
+        )
+    
+    async def _report_pipeline_error(self, ctx: dict, error: BaseException):
+        """Сообщение пользователю об ошибке стадии конвейера"""
+        reason = error.reason if isinstance(error, StageError) else "error"
+        
+        if reason == "conversion_failed":
+            text = messages.ERROR_CONVERSION_FAILED
+        elif reason == "timeout":
+            text = messages.ERROR_TIMEOUT
+        elif reason == "invalid_pdf":
+            text = messages.ERROR_INVALID_PDF
+        elif reason == "too_many_pages":
+            text = messages.ERROR_TOO_MANY_PAGES.format(
+                max_pages=ctx['settings'].pdf_max_pages, pages=ctx['pdf_info'].pages
+            )
+        elif reason == "rate_limited":
+            text = messages.ERROR_RATE_LIMIT.format(retry_after=messages.format_wait(ctx['retry_after']))
+        elif reason == "file_too_large":
+            text = messages.ERROR_FILE_TOO_LARGE.format(
+                size=round((ctx['file_size'] or 0) / (1024*1024), 2), max_size=MAX_FILE_SIZE // (1024*1024)
+            )
+        else:
+            text = messages.ERROR_API_UNAVAILABLE
+        
+        await self._edit_status(ctx, text, final=True, reply_markup=get_error_keyboard())
+    
+    def _publish_result(self, ctx: dict):
+        """Передача результата задачам-дубликатам, ждущим эту задачу"""
+        flight = ctx.get('flight')
+        if flight is None:
+            return
+        
+        shared = None
+        if ctx.get('result_data') is not None or ctx.get('xlsx_file_id'):
+            shared = {
+                'result_data': ctx.get('result_data'),
+                'enhancement_stats': ctx.get('enhancement_stats'),
+                'xlsx_file_id': ctx.get('xlsx_file_id'),
+                'caption': ctx.get('caption'),
+            }
+        self.singleflight.resolve(flight, shared)
+    
+    async def _stage_cached(self, ctx: dict):
+        """Стадия: этот файл Telegram уже конвертировался - повторная отправка XLSX по file_id"""
+        delivered = await self.db.get_delivered_file(file_unique_id=ctx['file_unique_id'])
+        CACHE_REQUESTS.inc(cache='delivered_file_id', result='hit' if delivered else 'miss')
+        if delivered:
+            await self._send_delivered(ctx, delivered)
+    
+    async def _send_delivered(self, ctx: dict, delivered: dict) -> bool:
+        """Отправка ранее загруженного в Telegram XLSX по file_id (без загрузки байтов)"""
+        await self._edit_status(ctx, messages.CONVERSION_MESSAGES['finalizing'], final=True)
+        
+        try:
+            await ctx['bot'].send_document(
+                chat_id=ctx['chat_id'],
+                document=delivered['xlsx_file_id'],
+                caption=delivered['caption'],
+                reply_to_message_id=ctx['message_id'],
+                reply_markup=get_success_keyboard()
+            )
+        except Exception as e:
+            # file_id недействителен - забываем его и конвертируем заново
+            logger.warning(f"Cached file_id for {ctx['file_name']} is not usable, converting again: {e}")
+            await self.db.remove_delivered_file(delivered['source_hash'])
+            return False
+        
+        logger.info(f"Delivered {ctx['file_name']} by cached file_id")
+        ctx['delivered'] = True
+        ctx['xlsx_file_id'] = delivered['xlsx_file_id']
+        ctx['caption'] = delivered['caption']
+        return True
+    
+    async def _stage_join(self, ctx: dict):
+        """Стадия: результат лидера для того же file_unique_id (лидер уже завершился или не успел)"""
+        flight = ctx['joined_flight']
+        if not flight.done():
+            raise StageError(f"Shared conversion of {ctx['file_name']} timed out", "timeout")
+        if not await self._join_flight(ctx, flight):
+            raise StageError(f"Shared conversion of {ctx['file_name']} failed", "conversion_failed")
+    
+    async def _stage_dedup(self, ctx: dict):
+        """Стадия: поиск выполняющейся конвертации того же содержимого (файл мог быть загружен заново)"""
+        ctx['content_hash'] = await asyncio.to_thread(self.file_handler.compute_file_hash, ctx['file_path'])
+        content_key = f"sha:{ctx['content_hash']}"
+        
+        # Тот же PDF уже конвертировался (например, загружен заново другим пользователем)
+        delivered = await self.db.get_delivered_file(source_hash=ctx['content_hash'])
+        CACHE_REQUESTS.inc(cache='delivered_hash', result='hit' if delivered else 'miss')
+        if delivered and await self._send_delivered(ctx, delivered):
+            return
+        
+        existing = self.singleflight.get(content_key)
+        if existing is not None and existing is not ctx['flight']:
+            if await self._join_flight(ctx, existing):
+                return
+            # Лидер завершился без результата - конвертируем сами
+            logger.info(f"Leader for {ctx['file_name']} finished without result, job {ctx['id']} converts it")
+        
+        if ctx['flight'] is not None:
+            self.singleflight.add_key(ctx['flight'], content_key)
+        else:
+            ctx['flight'] = self._flights[ctx['id']] = self.singleflight.lead(content_key)
+            # Задача уже выполняется воркером
+            self.singleflight.mark_started(ctx['flight'])
+    
+    async def _join_flight(self, ctx: dict, flight) -> bool:
+        """Получение результата лидера вместо собственной конвертации; False - лидер завершился без результата"""
+        shared = await self.singleflight.join(flight)
+        if shared is None:
+            return False
+        
+        logger.info(f"Job {ctx['id']} reuses result of in-flight conversion of {ctx['file_name']}")
+        ctx['deduplicated'] = True
+        ctx['result_data'] = shared['result_data']
+        ctx['enhancement_stats'] = shared['enhancement_stats']
+        ctx['xlsx_file_id'] = shared['xlsx_file_id']
+        ctx['caption'] = shared['caption']
+        return True
+    
+    async def _stage_download(self, ctx: dict):
+        """Стадия: потоковое скачивание PDF из Telegram во временный файл"""
+        file = await ctx['bot'].get_file(ctx['file_id'])
+        
+        # Local режим Bot API: файл уже на диске, читаем его напрямую без HTTP передачи
+        local_path = self.file_handler.get_local_file_path(file)
+        if local_path:
+            if os.path.getsize(local_path) > MAX_FILE_SIZE:
+                raise StageError(f"File {ctx['file_name']} exceeds {MAX_FILE_SIZE} bytes", "file_too_large")
+            ctx['file_path'] = local_path
+            ctx['file_is_local'] = True
+            return
+        
+        # Резерв по заявленному размеру; если он неизвестен - по максимально допустимому
+        try:
+            directory = await self.storage.reserve(ctx['id'], file.file_size or MAX_FILE_SIZE)
+        except StorageQuotaExceeded as e:
+            raise StageError(str(e), "storage_full")
+        
+        try:
+            ctx['file_path'] = await self.file_handler.download_telegram_file(
+                file, ctx['file_name'], directory=directory
+            )
+        except FileTooLargeError as e:
+            raise StageError(str(e), "file_too_large")
+        except LocalFileUnavailableError as e:
+            logger.error(str(e))
+            raise StageError(str(e), "local_file_unavailable")
+        await self.storage.adjust(ctx['id'], os.path.getsize(ctx['file_path']))
+    
+    async def _stage_compress(self, ctx: dict):
+        """Стадия: сжатие скана перед загрузкой; при ошибке загружается исходный файл"""
+        # Компрессор мог быть пересоздан перечитыванием настроек после проверки skip_if
+        compressor = self.compressor
+        if compressor is None:
+            return
+        info = ctx.get('pdf_info')
+        size = os.path.getsize(ctx['file_path'])
+        # Сжимаются только крупные файлы с изображениями страниц: текстовым PDF уменьшать нечего
+        if size < ctx['settings'].pdf_compression_min_size:
+            return
+        if info is not None and (info.encrypted or not info.image_only_pages):
+            return
+        
+        # Сжатие укладывается в бюджет стадии с запасом: при нехватке места или таймауте
+        # загружается исходный файл, а не завершается ошибкой вся задача
+        budget = ctx['settings'].stage_timeouts['compress']
+        started = time.monotonic()
+        
+        # Сжатый файл кладется в директорию задачи; для файла локального сервера Bot API
+        # директория создается здесь, для скачанного - резерв увеличивается
+        reserved = size if ctx.get('file_is_local') else size * 2
+        try:
+            directory = await self.storage.reserve(ctx['id'], reserved, timeout=budget * 0.25)
+        except StorageQuotaExceeded as e:
+            logger.warning(f"Skipping compression of {ctx['file_name']}: {e}")
+            return
+        
+        target = self.file_handler.get_temp_file_path(ctx['file_name'], "compressed", directory)
+        result = await compressor.compress(
+            ctx['file_path'], target, timeout=budget * 0.9 - (time.monotonic() - started)
+        )
+        if result is None:
+            PDF_COMPRESSIONS.inc(result='failed')
+            await self.storage.adjust(ctx['id'], reserved - size)
+            return
+        
+        ctx['compression'] = result
+        logger.info(f"PDF compression of {ctx['file_name']}: {result.to_dict()}")
+        if result.path:
+            ctx['upload_path'] = result.path
+            PDF_COMPRESSIONS.inc(result='compressed')
+            PDF_COMPRESSION_SAVED_BYTES.inc(result.saved_bytes)
+            await self.storage.adjust(ctx['id'], reserved - size + result.compressed_size)
+        else:
+            PDF_COMPRESSIONS.inc(result='no_gain')
+            await self.storage.adjust(ctx['id'], reserved - size)
+    
+    async def _stage_inspect(self, ctx: dict):
+        """Стадия: быстрая проверка PDF - поврежденные файлы не расходуют кредиты CloudConvert"""
+        info = await asyncio.to_thread(inspect_pdf, ctx['file_path'])
+        if info is None:
+            return
+        
+        ctx['pdf_info'] = info
+        logger.info(f"PDF {ctx['file_name']}: {info.to_dict()}")
+        
+        if not info.valid:
+            raise StageError(f"Invalid PDF {ctx['file_name']}: {info.error}", "invalid_pdf")
+        max_pages = ctx['settings'].pdf_max_pages
+        if max_pages and info.pages > max_pages:
+            raise StageError(f"PDF {ctx['file_name']} has {info.pages} pages", "too_many_pages")
+        
+        # Число страниц известно только после скачивания - проверяем и списываем лимит сейчас
+        allowed, retry_after = self.rate_limiter.check(ctx['user_id'], files=0, pages=info.pages)
+        if not allowed:
+            # Файл не будет конвертирован - списанные при приеме лимиты возвращаются
+            self.rate_limiter.refund(ctx['user_id'], files=1, size=ctx.get('file_size') or 0)
+            ctx['retry_after'] = retry_after
+            raise StageError(f"Page limit exceeded for {ctx['file_name']} ({info.pages} pages)", "rate_limited")
+        
+        # Документ с текстовым слоем на всех страницах не требует точного OCR -
+        # начинаем с быстрой стратегии, точная остается запасной
+        if info.has_text_layer and not info.image_only_pages:
+            ctx['strategies'] = (STRATEGY_HIGH_QUALITY, STRATEGY_STANDARD)
+    
+    async def _stage_upload(self, ctx: dict):
+        """Стадия: создание задачи CloudConvert и загрузка файла"""
+        await self._edit_status(ctx, messages.CONVERSION_MESSAGES['uploading'])
+        
+        await self._start_conversion(ctx, ctx.get('strategies') or CONVERSION_STRATEGIES)
+        if not ctx.get('cc_job_id'):
+            raise StageError("Upload failed for all conversion strategies", "conversion_failed")
+        
+        compression = ctx.get('compression')
+        if compression and compression.path:
+            # Скорость загрузки сжатого файла дает оценку времени, сэкономленного на загрузке
+            upload_time = [duration for name, duration, _ in ctx['stage_details'] if name == "upload.attempt"][-1]
+            speed = compression.compressed_size / upload_time if upload_time > 0 else 0
+            logger.info(
+                f"Compression of {ctx['file_name']}: {compression.original_size} -> "
+                f"{compression.compressed_size} bytes (-{compression.ratio:.0%}) in {compression.duration:.1f}s, "
+                f"estimated time saved {compression.upload_time_saved(speed):+.1f}s"
+            )
+    
+    async def _stage_ocr(self, ctx: dict):
+        """Стадия: ожидание OCR/конвертации и скачивание XLSX (с переходом на запасную стратегию)"""
+        file_name = ctx['file_name']
+        strategies = ctx.get('strategies') or CONVERSION_STRATEGIES
+        strategy = ctx.get('strategy') or strategies[0]
+        
+        await self._edit_status(ctx, messages.CONVERSION_MESSAGES['processing'])
+        
+        # Реальный процент выполнения из статуса задачи CloudConvert
+        report_progress = lambda percent: self._edit_status(
+            ctx, messages.CONVERSION_MESSAGES['processing'], percent=percent
+        )
+        
+        converted_data = await self._finish_attempt(ctx, strategy, report_progress)
+        
+        # Если стратегия не сработала - пробуем оставшиеся
+        remaining = strategies[strategies.index(strategy) + 1:]
+        while not converted_data and remaining:
+            logger.info(f"Trying alternative conversion strategy for {file_name}")
+            
+            # Задача, восстановленная после рестарта, еще не скачивала исходный файл
+            if 'file_path' not in ctx:
+                await self._stage_download(ctx)
+            
+            ctx['cc_job_id'] = None
+            await self._start_conversion(ctx, remaining)
+            if not ctx.get('cc_job_id'):
+                break
+            
+            strategy = ctx['strategy']
+            converted_data = await self._finish_attempt(ctx, strategy, report_progress)
+            remaining = strategies[strategies.index(strategy) + 1:]
+        
+        if not converted_data:
+            raise StageError(f"All conversion attempts failed for {file_name}", "conversion_failed")
+        
+        ctx['converted_data'] = converted_data
+        
+        # Успешная конвертация
+        await self._edit_status(ctx, messages.CONVERSION_SUCCESS)
+    
+    async def _finish_attempt(self, ctx: dict, strategy: str, report_progress) -> Optional[bytes]:
+        """Ожидание результата одной стратегии с записью времени ожидания и скачивания"""
+        timings = {}
+        converted_data = await self.cloudconvert.finish_conversion(
+            ctx['cc_job_id'], ctx['file_name'], strategy, report_progress, timings=timings,
+            poll_interval=ctx['settings'].cloudconvert_poll_interval
+        )
+        ctx['stage_details'].extend((f"ocr.{name}", duration, strategy) for name, duration in timings.items())
+        return converted_data
+    
+    async def _start_conversion(self, ctx: dict, strategies):
+        """Запуск первой сработавшей стратегии; id задачи CloudConvert сохраняется в контексте и в базе"""
+        for strategy in strategies:
+            started = time.perf_counter()
+            try:
+                cc_job_id = await self.cloudconvert.start_conversion(
+                    ctx.get('upload_path') or ctx['file_path'], ctx['file_name'], strategy
+                )
+            except CircuitOpenError as e:
+                raise StageError(str(e), "api_unavailable") from e
+            ctx['stage_details'].append(("upload.attempt", time.perf_counter() - started, strategy))
+            if cc_job_id:
+                ctx['cc_job_id'] = cc_job_id
+                ctx['strategy'] = strategy
+                
+                # Реальный id задачи CloudConvert позволяет переподключиться к ней после рестарта
+                await self.db.set_job_remote(ctx['id'], cc_job_id, strategy)
+                await self.db.save_active_task(ctx['user_id'], cc_job_id, ctx['file_name'])
+                return
+    
+    async def _stage_forced_replacement(self, ctx: dict):
+        """Стадия: загрузка книги (один раз) и принудительная замена украинских символов"""
+        try:
+            # Разбор и проход по книге - синхронная работа openpyxl, выносим из event loop
+            processor = await asyncio.to_thread(WorkbookProcessor, ctx['converted_data'], ctx['file_name'])
+            await asyncio.to_thread(processor.apply_forced_replacement)
+            ctx['processor'] = processor
+        except Exception as processing_error:
+            # Постобработка не критична: отправим результат CloudConvert как есть
+            logger.error(f"Error in text post-processing: {processing_error}")
+            ctx['processor'] = None
+    
+    async def _stage_enhancement(self, ctx: dict):
+        """Стадия: улучшение текста с помощью Claude AI над той же книгой"""
+        await self._edit_status(ctx, messages.CONVERSION_MESSAGES['enhancing'])
+        
+        report_progress = lambda percent: self._edit_status(
+            ctx, messages.CONVERSION_MESSAGES['enhancing'], percent=percent
+        )
+        
+        try:
+            await ctx['processor'].enhance(
+                self.text_enhancer, report_progress, batch_size=ctx['settings'].claude_batch_size
+            )
+        except Exception as claude_error:
+            logger.error(f"Error in Claude AI enhancement: {claude_error}")
+    
+    async def _stage_stats(self, ctx: dict):
+        """Стадия: статистика по собранным текстам и единственная сериализация результата"""
+        processor = ctx.get('processor')
+        ctx['enhancement_stats'] = None
+        ctx['result_data'] = ctx['converted_data']
+        
+        if processor is None:
+            return
+        
+        try:
+            if ctx['settings'].claude_enabled:
+                # Анализ качества всего текста книги - тоже вне event loop
+                ctx['enhancement_stats'] = await asyncio.to_thread(
+                    processor.get_enhancement_stats, self.text_enhancer
+                )
+                if ctx['enhancement_stats']:
+                    logger.info(f"Text enhancement stats: {ctx['enhancement_stats']}")
+            
+            ctx['result_data'] = await asyncio.to_thread(processor.to_bytes)
+        except Exception as stats_error:
+            logger.error(f"Error in text analysis: {stats_error}")
+    
+    async def _stage_reply(self, ctx: dict):
+        """Стадия: отправка готового XLSX пользователю"""
+        enhancement_stats = ctx.get('enhancement_stats')
+        
+        # Финальное состояние отправляется до документа, минуя ограничение частоты
+        await self._edit_status(ctx, messages.CONVERSION_MESSAGES['finalizing'], final=True)
+        
+        # Генерируем имя XLSX файла
+        xlsx_name = ctx['file_name'].replace('.pdf', '.xlsx')
+        caption = ctx.get('caption') or self._build_caption(enhancement_stats, ctx['settings'].claude_enabled)
+        
+        # Результат лидера уже загружен в Telegram - отправляем по file_id
+        if ctx.get('xlsx_file_id'):
+            try:
+                await ctx['bot'].send_document(
+                    chat_id=ctx['chat_id'],
+                    document=ctx['xlsx_file_id'],
+                    caption=caption,
+                    reply_to_message_id=ctx['message_id'],
+                    reply_markup=get_success_keyboard()
+                )
+                return
+            except Exception as e:
+                if ctx.get('result_data') is None:
+                    raise
+                logger.warning(f"Sending {xlsx_name} by file_id failed, uploading it: {e}")
+        
+        # Отправляем файл
+        sent = await ctx['bot'].send_document(
+            chat_id=ctx['chat_id'],
+            document=BytesIO(ctx['result_data']),
+            filename=xlsx_name,
+            caption=caption,
+            reply_to_message_id=ctx['message_id'],
+            reply_markup=get_success_keyboard()
+        )
+        
+        # Запоминаем file_id: повторная доставка того же PDF не будет загружать XLSX заново
+        if sent and sent.document:
+            ctx['xlsx_file_id'] = sent.document.file_id
+            ctx['caption'] = caption
+            if ctx.get('content_hash'):
+                await self.db.save_delivered_file(
+                    ctx['content_hash'], ctx.get('file_unique_id'), sent.document.file_id, caption
+                )
+    
+    def _build_caption(self, enhancement_stats: Optional[dict], claude_enabled: bool) -> str:
+        """Подпись к XLSX с информацией о качестве"""
+        caption = "✅ Конвертация завершена успешно!"
+        
+        if enhancement_stats and enhancement_stats['improvement'] > 0:
+            caption += f"\n🤖 Текст улучшен с помощью Claude AI"
+            caption += f"\n📈 Качество: {enhancement_stats['original_score']:.0f}% → {enhancement_stats['enhanced_score']:.0f}%"
+            if enhancement_stats['ukrainian_chars_fixed'] > 0:
+                caption += f"\n🔧 Исправлено украинских символов: {enhancement_stats['ukrainian_chars_fixed']}"
+            if enhancement_stats['ocr_errors_fixed'] > 0:
+                caption += f"\n🔧 Исправлено OCR ошибок: {enhancement_stats['ocr_errors_fixed']}"
+        elif claude_enabled:
+            caption += "\n✅ Качество проверено - улучшения не требуются"
+        
+        return caption
     
     async def handle_callback_query(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик callback кнопок"""
@@ -298,7 +1153,7 @@ class BotHandlers:
         
         elif data == "status":
             user_id = query.from_user.id
-            active_task = self.db.get_active_task(user_id)
+            active_task = await self.db.get_active_task(user_id)
             
             if not active_task:
                 await query.edit_message_text(
@@ -319,7 +1174,8 @@ class BotHandlers:
         
         elif data == "cancel_task":
             user_id = query.from_user.id
-            self.db.remove_active_task(user_id)
+            await self.db.remove_active_task(user_id)
+            await self._cancel_queued_jobs(user_id)
             await query.edit_message_text(
                 messages.CANCEL_SUCCESS,
                 parse_mode=ParseMode.MARKDOWN
@@ -338,7 +1194,7 @@ class BotHandlers:
             )
         
         elif data == "show_stats":
-            stats = self.db.get_stats()
+            stats = await self.db.get_stats()
             stats_text = f"""
 📊 **Статистика бота**
 
@@ -347,6 +1203,7 @@ class BotHandlers:
 ❌ **С ошибками:** {stats['error_operations']}
 👥 **Уникальных пользователей:** {stats['unique_users']}
 📊 **Успешность:** {stats['success_rate']:.1f}%
+🔁 **Дубликатов без повторной конвертации:** {self.singleflight.hits}
             """
             await query.edit_message_text(
                 stats_text,
@@ -93,8 +93,64 @@ CONVERSION_SUCCESS = """
 
 SENDING_FILE = "📨 **Отправляю готовый файл...**"
 
+# Сообщения очереди
+QUEUED_MESSAGE = """
+📥 **Файл принят в очередь**
+
+📄 Файл: `{filename}`
+🔢 Перед вами в очереди: **{position}**
+⏱ Ожидаемое время готовности: **~{eta}**
+
+Я пришлю результат, как только конвертация завершится.
+"""
+
+ERROR_QUEUE_FULL = """
+⏳ **Очередь переполнена**
+
+Сейчас обрабатывается слишком много файлов (или у вас уже есть файлы в очереди).
+Попробуйте отправить файл через несколько минут.
+"""
+
+STATUS_QUEUED_TASK = """
+📊 **Статус текущей задачи**
+
+🔄 **Статус:** ⏳ В очереди
+🔢 **Перед вами:** {position}
+⏱ **Ожидаемое время готовности:** ~{eta}
+"""
+
+def format_eta(seconds: float) -> str:
+    """Человекочитаемая оценка времени ожидания"""
+    minutes = int(round(seconds / 60))
+    if minutes < 1:
+        return "меньше минуты"
+    return f"{minutes} мин"
+
+def format_wait(seconds: float) -> str:
+    """Время до снятия ограничения"""
+    if seconds < 60:
+        return f"{max(1, int(seconds + 0.5))} сек"
+    return f"{int(seconds / 60 + 0.5)} мин"
+
+def format_progress(text: str, percent=None) -> str:
+    """Добавление полосы прогресса к статусному сообщению"""
+    if percent is None:
+        return text
+    percent = max(0, min(100, int(percent)))
+    filled = percent // 10
+    return f"{text}\n\n{'▰' * filled}{'▱' * (10 - filled)} {percent}%"
+
 # Сообщения об ошибках
-ERROR_FILE_TOO_LARGE = "❌ **Файл слишком большой!**\n\nМаксимально допустимый размер: **20 МБ**\nРазмер вашего файла: **{size} МБ**"
+ERROR_FILE_TOO_LARGE = "❌ **Файл слишком большой!**\n\nМаксимально допустимый размер: **{max_size} МБ**\nРазмер вашего файла: **{size} МБ**"
+
+ERROR_INVALID_PDF = """
+❌ **Файл поврежден**
+
+Не удалось прочитать PDF: файл обрезан или не является PDF документом.
+Попробуйте сохранить документ заново и отправить еще раз.
+"""
+
+ERROR_TOO_MANY_PAGES = "❌ **Слишком много страниц!**\n\nМаксимум: **{max_pages}**\nВ вашем файле: **{pages}**"
 
 ERROR_INVALID_FORMAT = "❌ **Неподдерживаемый формат файла!**\n\nЯ принимаю только **PDF файлы**.\nПожалуйста, отправьте файл с расширением `.pdf`"
 
@@ -134,9 +190,9 @@ ERROR_TIMEOUT = """
 ERROR_RATE_LIMIT = """
 ❌ **Слишком частые запросы**
 
-Вы можете отправлять не более **1 файла в минуту**.
+Вы превысили лимит отправки файлов.
 
-⏰ Попробуйте через минуту.
+⏰ Попробуйте снова через **{retry_after}**.
 """
 
 ERROR_NO_FILE = """
@@ -165,6 +221,15 @@ CANCEL_SUCCESS = "✅ **Операция отменена**\n\nВы можете
 
 CANCEL_NO_TASK = "ℹ️ **Нет активных задач для отмены**"
 
+# Перечитывание настроек (/reload, только для администраторов)
+RELOAD_SUCCESS = "✅ **Настройки перечитаны** (версия {version})\n\n{changes}\n\nНовые значения применяются к новым задачам."
+
+RELOAD_NO_CHANGES = "ℹ️ **Настройки перечитаны** (версия {version})\n\nИзменений нет."
+
+RELOAD_FAILED = "❌ **Настройки не изменены**\n\n`{error}`"
+
+ADMIN_ONLY = "⛔ Команда доступна только администраторам бота."
+
 # Общие сообщения
 UNKNOWN_COMMAND = """
 ❓ **Неизвестная команда**
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import time
+from typing import Optional, Dict, Tuple, Any
+
+from telegram.constants import ParseMode
+from telegram.error import BadRequest, RetryAfter
+
+from bot import messages
+
+logger = logging.getLogger(__name__)
+
+
+class _MessageState:
+    """Состояние одного статусного сообщения"""
+
+    def __init__(self):
+        self.pending: Optional[Tuple[str, Dict[str, Any]]] = None
+        self.sent_text: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+
+
+class ProgressReporter:
+    """Вывод прогресса в статусные сообщения с объединением частых обновлений.
+
+    Промежуточные обновления одного сообщения объединяются: отправляется только последнее,
+    не чаще min_interval на чат и в пределах общего бюджета edits_per_second.
+    Финальное состояние (final=True) отправляется всегда.
+    """
+
+    def __init__(self, min_interval: float = 2.0, edits_per_second: float = 20.0):
+        self.min_interval = min_interval
+        self.edits_per_second = edits_per_second
+        self._states: Dict[Tuple[int, int], _MessageState] = {}
+        self._last_chat_edit: Dict[int, float] = {}
+        self._last_prune = time.monotonic()
+
+        # Общий бюджет правок (token bucket)
+        self._tokens = edits_per_second
+        self._tokens_updated = time.monotonic()
+        self._budget_lock: Optional[asyncio.Lock] = None
+
+        self.edits_sent = 0
+        self.updates_coalesced = 0
+
+    async def update(self, bot, chat_id: int, message_id: int, text: str,
+                     percent: Optional[float] = None, final: bool = False, **kwargs):
+        """Новое состояние статусного сообщения (percent - реальный прогресс стадии, 0-100)"""
+        key = (chat_id, message_id)
+        state = self._states.setdefault(key, _MessageState())
+
+        if state.pending is not None:
+            self.updates_coalesced += 1
+        state.pending = (messages.format_progress(text, percent), kwargs)
+
+        if final:
+            # Финальное состояние вытесняет отложенную отправку и уходит сразу
+            if state.task and not state.task.done():
+                state.task.cancel()
+            await self._send(bot, key, state)
+            self._states.pop(key, None)
+            return
+
+        if state.task is None or state.task.done():
+            state.task = asyncio.create_task(self._flush_later(bot, key, state))
+
+    async def _flush_later(self, bot, key: Tuple[int, int], state: _MessageState):
+        chat_id = key[0]
+        delay = self._last_chat_edit.get(chat_id, 0.0) + self.min_interval - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await self._send(bot, key, state)
+
+    async def _send(self, bot, key: Tuple[int, int], state: _MessageState):
+        if state.pending is None:
+            return
+
+        text, kwargs = state.pending
+        state.pending = None
+        if text == state.sent_text and not kwargs:
+            return
+
+        chat_id, message_id = key
+        await self._acquire_budget()
+        now = time.monotonic()
+        self._prune_chat_edits(now)
+        self._last_chat_edit[chat_id] = now
+
+        try:
+            await bot.edit_message_text(
+                text,
+                chat_id=chat_id,
+                message_id=message_id,
+                parse_mode=ParseMode.MARKDOWN,
+                **kwargs
+            )
+            state.sent_text = text
+            self.edits_sent += 1
+        except RetryAfter as e:
+            # Флуд-контроль Telegram: откладываем правки этого чата
+            logger.warning(f"Flood control on chat {chat_id}, retry after {e.retry_after}s")
+            retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, 'total_seconds') else e.retry_after
+            self._last_chat_edit[chat_id] = time.monotonic() + retry_after
+        except BadRequest as e:
+            if 'not modified' not in str(e).lower():
+                logger.error(f"Error editing progress message: {e}")
+        except Exception as e:
+            logger.error(f"Error editing progress message: {e}")
+
+    def _prune_chat_edits(self, now: float):
+        """Удаление отметок чатов, для которых интервал уже истек (не чаще раза в min_interval)"""
+        if now - self._last_prune < self.min_interval:
+            return
+        self._last_prune = now
+        # Истекшая отметка равнозначна отсутствующей; отметки флуд-контроля лежат в будущем и сохраняются
+        expired = [chat_id for chat_id, edited in self._last_chat_edit.items()
+                   if edited + self.min_interval <= now]
+        for chat_id in expired:
+            del self._last_chat_edit[chat_id]
+
+    async def _acquire_budget(self):
+        """Ожидание токена общего бюджета правок"""
+        if self._budget_lock is None:
+            self._budget_lock = asyncio.Lock()
+
+        async with self._budget_lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.edits_per_second,
+                    self._tokens + (now - self._tokens_updated) * self.edits_per_second
+                )
+                self._tokens_updated = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self._tokens) / self.edits_per_second)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Счетчики отправленных и объединенных правок"""
+        return {
+            'edits_sent': self.edits_sent,
+            'updates_coalesced': self.updates_coalesced,
+            'pending_messages': len(self._states),
+        }
@@ -0,0 +1,99 @@
+import asyncio
+import logging
+from typing import Optional, Dict, Any, Awaitable
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка апдейтов разных пользователей с сохранением порядка для одного пользователя.
+
+    Базовый семафор PTB ограничивает общее число принятых апдейтов (max_pending),
+    собственный семафор - число реально выполняющихся обработчиков (max_concurrent).
+    Апдейты, ждущие своей очереди у пользователя, не занимают слоты выполнения.
+    """
+
+    def __init__(self, max_concurrent: int, max_pending: Optional[int] = None):
+        super().__init__(max_concurrent_updates=max(max_pending or 0, max_concurrent))
+        self.max_concurrent = max_concurrent
+        self._running_limit: Optional[asyncio.Semaphore] = None
+        self._user_locks: Dict[int, asyncio.Lock] = {}
+        self._user_waiters: Dict[int, int] = {}
+        self.accepted = 0
+        self.in_flight = 0
+        self.processed = 0
+
+    async def initialize(self) -> None:
+        # Семафор создается в event loop приложения
+        self._running_limit = asyncio.Semaphore(self.max_concurrent)
+
+    async def shutdown(self) -> None:
+        self._user_locks.clear()
+        self._user_waiters.clear()
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        self.accepted += 1
+        try:
+            await self._process_ordered(update, coroutine)
+        finally:
+            self.accepted -= 1
+
+    async def _process_ordered(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = self._ordering_key(update)
+        if key is None:
+            await self._run(coroutine)
+            return
+
+        # Блокировки asyncio.Lock выдаются в порядке ожидания (FIFO) -
+        # апдейты одного пользователя обрабатываются строго по очереди
+        lock = self._user_locks.get(key)
+        if lock is None:
+            lock = self._user_locks[key] = asyncio.Lock()
+        self._user_waiters[key] = self._user_waiters.get(key, 0) + 1
+
+        try:
+            async with lock:
+                await self._run(coroutine)
+        finally:
+            waiters = self._user_waiters.get(key, 1) - 1
+            if waiters:
+                self._user_waiters[key] = waiters
+            else:
+                self._user_waiters.pop(key, None)
+                self._user_locks.pop(key, None)
+
+    async def _run(self, coroutine: Awaitable[Any]) -> None:
+        if self._running_limit is None:
+            await self.initialize()
+
+        async with self._running_limit:
+            self.in_flight += 1
+            try:
+                await coroutine
+            finally:
+                self.in_flight -= 1
+                self.processed += 1
+
+    @staticmethod
+    def _ordering_key(update: object) -> Optional[int]:
+        """Ключ упорядочивания: пользователь, а для апдейтов без пользователя - чат"""
+        if not isinstance(update, Update):
+            return None
+        if update.effective_user:
+            return update.effective_user.id
+        if update.effective_chat:
+            return update.effective_chat.id
+        return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Текущее состояние обработки апдейтов"""
+        return {
+            'in_flight': self.in_flight,
+            'pending': self.accepted - self.in_flight,
+            'max_concurrent': self.max_concurrent,
+            'users_with_pending_updates': len(self._user_locks),
+            'processed': self.processed,
+        }
@@ -0,0 +1,47 @@
+import hmac
+import json
+import logging
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+SECRET_TOKEN_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+class TelegramWebhook:
+    """Прием апдейтов Telegram через webhook на aiohttp сервере приложения"""
+
+    def __init__(self, application: Application, secret_token: str):
+        self.application = application
+        self.secret_token = secret_token
+        self.received = 0
+        self.rejected = 0
+
+    async def handle(self, request: web.Request) -> web.Response:
+        """POST от Telegram: проверка секрета и передача апдейта в очередь приложения"""
+        token = request.headers.get(SECRET_TOKEN_HEADER, '')
+        if not self.secret_token or not hmac.compare_digest(token, self.secret_token):
+            self.rejected += 1
+            logger.warning(f"Rejected webhook request from {request.remote}: invalid secret token")
+            return web.Response(status=403)
+
+        try:
+            data = await request.json()
+            update = Update.de_json(data, self.application.bot)
+        except (json.JSONDecodeError, ValueError, TypeError) as e:
+            logger.error(f"Invalid webhook payload: {e}")
+            return web.Response(status=400)
+
+        # Обработка идет асинхронно через update_queue, Telegram получает ответ сразу
+        await self.application.update_queue.put(update)
+        self.received += 1
+        return web.Response(status=200)
+
+    def get_stats(self) -> dict:
+        """Счетчики webhook запросов"""
+        return {
+            'received': self.received,
+            'rejected': self.rejected,
+        }
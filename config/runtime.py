@@ -0,0 +1,172 @@
+import logging
+import os
+import time
+from typing import Optional, Dict, Any, Tuple, Callable, Mapping, List
+
+from dotenv import dotenv_values, find_dotenv
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_bool(value: str) -> bool:
+    return value.strip().lower() == 'true'
+
+
+class TunableSettings:
+    """Снимок параметров, которые можно менять без перезапуска.
+
+    Задача берет текущий снимок при старте и работает с ним до конца: новые значения
+    применяются к новым задачам, идущие конвертации не меняют поведение на ходу.
+    Переменная, удаленная из окружения, сохраняет значение, полученное при запуске.
+    """
+
+    # атрибут -> (переменная окружения, тип, значение при запуске)
+    FIELDS = {
+        'claude_manual_enabled': ('CLAUDE_MANUAL_ENABLED', bool, settings.CLAUDE_MANUAL_ENABLED),
+        'claude_batch_size': ('CLAUDE_BATCH_SIZE', int, settings.CLAUDE_BATCH_SIZE),
+        'cloudconvert_poll_interval': ('CLOUDCONVERT_POLL_INTERVAL', float, settings.CLOUDCONVERT_POLL_INTERVAL),
+        'worker_pool_size': ('WORKER_POOL_SIZE', int, settings.WORKER_POOL_SIZE),
+        'job_queue_max_size': ('JOB_QUEUE_MAX_SIZE', int, settings.JOB_QUEUE_MAX_SIZE),
+        'job_queue_max_per_user': ('JOB_QUEUE_MAX_PER_USER', int, settings.JOB_QUEUE_MAX_PER_USER),
+        'progress_min_interval': ('PROGRESS_MIN_INTERVAL', float, settings.PROGRESS_MIN_INTERVAL),
+        'operation_log_flush_interval_ms': ('OPERATION_LOG_FLUSH_INTERVAL_MS', int,
+                                            settings.OPERATION_LOG_FLUSH_INTERVAL_MS),
+        'operation_log_batch_size': ('OPERATION_LOG_BATCH_SIZE', int, settings.OPERATION_LOG_BATCH_SIZE),
+        'log_prune_batch_size': ('LOG_PRUNE_BATCH_SIZE', int, settings.LOG_PRUNE_BATCH_SIZE),
+        'pdf_inspection_enabled': ('PDF_INSPECTION_ENABLED', bool, settings.PDF_INSPECTION_ENABLED),
+        'pdf_max_pages': ('PDF_MAX_PAGES', int, settings.PDF_MAX_PAGES),
+        'pdf_compression_enabled': ('PDF_COMPRESSION_ENABLED', bool, settings.PDF_COMPRESSION_ENABLED),
+        'pdf_compression_dpi': ('PDF_COMPRESSION_DPI', int, settings.PDF_COMPRESSION_DPI),
+        'pdf_compression_min_size': ('PDF_COMPRESSION_MIN_SIZE', int, settings.PDF_COMPRESSION_MIN_SIZE),
+        'pdf_compression_min_saving': ('PDF_COMPRESSION_MIN_SAVING', float, settings.PDF_COMPRESSION_MIN_SAVING),
+    }
+
+    claude_manual_enabled: bool
+    claude_batch_size: int
+    cloudconvert_poll_interval: float
+    worker_pool_size: int
+    job_queue_max_size: int
+    job_queue_max_per_user: int
+    progress_min_interval: float
+    operation_log_flush_interval_ms: int
+    operation_log_batch_size: int
+    log_prune_batch_size: int
+    pdf_inspection_enabled: bool
+    pdf_max_pages: int
+    pdf_compression_enabled: bool
+    pdf_compression_dpi: int
+    pdf_compression_min_size: int
+    pdf_compression_min_saving: float
+    stage_timeouts: Dict[str, int]
+
+    def __init__(self, env: Mapping[str, str]):
+        """Разбор значений из env; неверное значение - ValueError с именем переменной"""
+        for attr, (name, kind, default) in self.FIELDS.items():
+            setattr(self, attr, self._parse(env, name, kind, default))
+
+        self.stage_timeouts = {
+            stage: self._parse(env, f"STAGE_TIMEOUT_{stage.upper()}", int, default)
+            for stage, default in settings.STAGE_TIMEOUTS.items()
+        }
+
+    @staticmethod
+    def _parse(env: Mapping[str, str], name: str, kind: type, default):
+        value = env.get(name)
+        if value is None or value == '':
+            return default
+        try:
+            return _parse_bool(value) if kind is bool else kind(value)
+        except ValueError:
+            raise ValueError(f"{name}: неверное значение {value!r}, ожидается {kind.__name__}") from None
+
+    @property
+    def claude_enabled(self) -> bool:
+        return bool(settings.CLAUDE_API_KEY) and self.claude_manual_enabled
+
+    def to_dict(self) -> Dict[str, Any]:
+        values = {attr: getattr(self, attr) for attr in self.FIELDS}
+        values['stage_timeouts'] = dict(self.stage_timeouts)
+        return values
+
+    def diff(self, other: 'TunableSettings') -> Dict[str, Tuple[Any, Any]]:
+        """Изменившиеся параметры: имя -> (старое значение, новое)"""
+        changes = {}
+        for attr in self.FIELDS:
+            if getattr(self, attr) != getattr(other, attr):
+                changes[attr] = (getattr(self, attr), getattr(other, attr))
+        for stage, timeout in self.stage_timeouts.items():
+            if other.stage_timeouts[stage] != timeout:
+                changes[f"stage_timeouts.{stage}"] = (timeout, other.stage_timeouts[stage])
+        return changes
+
+
+def load_environment() -> Dict[str, str]:
+    """Текущие .env и окружение процесса (переменные окружения важнее .env, как при запуске)"""
+    env = {name: value for name, value in dotenv_values(find_dotenv()).items() if value is not None}
+    env.update(settings.PROCESS_ENV)
+    return env
+
+
+SettingsListener = Callable[[TunableSettings, Dict[str, Tuple[Any, Any]]], None]
+
+
+class RuntimeSettings:
+    """Текущие настраиваемые параметры; reload() перечитывает .env и окружение без перезапуска.
+
+    Атрибуты читаются из текущего снимка (runtime.worker_pool_size); компоненты, которые хранят
+    значения у себя (пул воркеров, журнал операций), обновляются подписчиками add_listener().
+    """
+
+    def __init__(self):
+        # При запуске .env уже загружен в os.environ модулем config.settings
+        self.current = TunableSettings(os.environ)
+        self.version = 1
+        self.reloaded_at: Optional[float] = None
+        self._listeners: List[SettingsListener] = []
+
+    def __getattr__(self, name: str):
+        if name == 'current':
+            raise AttributeError(name)
+        return getattr(self.current, name)
+
+    def add_listener(self, listener: SettingsListener):
+        """Подписка на применение новых настроек: listener(новый снимок, изменения)"""
+        self._listeners.append(listener)
+
+    def reload(self) -> Dict[str, Tuple[Any, Any]]:
+        """Перечитывание настроек, возвращает изменения.
+
+        При неверном значении выбрасывает ValueError, действующие настройки не меняются.
+        """
+        new = TunableSettings(load_environment())
+        changes = self.current.diff(new)
+        self.current = new
+        self.version += 1
+        self.reloaded_at = time.time()
+
+        if changes:
+            logger.info("Settings reloaded: " + ", ".join(
+                f"{name} {old!r} -> {value!r}" for name, (old, value) in changes.items()
+            ))
+        else:
+            logger.info("Settings reloaded: no changes")
+
+        for listener in self._listeners:
+            try:
+                listener(new, changes)
+            except Exception as e:
+                logger.error(f"Error applying reloaded settings: {e}")
+        return changes
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Версия и значения действующих настроек"""
+        return {
+            'version': self.version,
+            'reloaded_at': self.reloaded_at,
+            'values': self.current.to_dict(),
+        }
+
+
+runtime = RuntimeSettings()
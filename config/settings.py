@@ -1,6 +1,11 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
+# Окружение процесса до загрузки .env: при перечитывании настроек (config.runtime)
+# переменные платформы, как и при запуске, важнее значений из .env
+PROCESS_ENV = dict(os.environ)
+
 load_dotenv()
 
 # Telegram настройки
@@ -10,9 +15,14 @@ TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 CLOUDCONVERT_API_KEY = os.getenv('CLOUDCONVERT_API_KEY')
 CLOUDCONVERT_BASE_URL = 'https://api.cloudconvert.com/v2'
 
+# Предохранитель CloudConvert: после N ошибок подряд новые задачи не отправляются RESET секунд
+CLOUDCONVERT_BREAKER_FAILURES = int(os.getenv('CLOUDCONVERT_BREAKER_FAILURES', 5))
+CLOUDCONVERT_BREAKER_RESET = int(os.getenv('CLOUDCONVERT_BREAKER_RESET', 60))
+
 # Языковые настройки CloudConvert
 CLOUDCONVERT_OCR_LANGUAGES = os.getenv('CLOUDCONVERT_OCR_LANGUAGES', 'rus,eng').split(',')
 CLOUDCONVERT_LOCALE = os.getenv('CLOUDCONVERT_LOCALE', 'ru_RU')
+CLOUDCONVERT_POLL_INTERVAL = float(os.getenv('CLOUDCONVERT_POLL_INTERVAL', 5))  # опрос статуса задачи (секунды)
 
 # Claude AI настройки
 CLAUDE_API_KEY = os.getenv('CLAUDE_API_KEY')
@@ -20,24 +30,115 @@ CLAUDE_MODEL = os.getenv('CLAUDE_MODEL', 'claude-3-5-sonnet-20241022')
 
 # Автоматическое включение Claude AI если есть API ключ (рекомендуется для лучшего качества)
 CLAUDE_MANUAL_ENABLED = os.getenv('CLAUDE_MANUAL_ENABLED', 'true').lower() == 'true'  # По умолчанию включен
+CLAUDE_BATCH_SIZE = int(os.getenv('CLAUDE_BATCH_SIZE', 30))  # ячеек в одном запросе к Claude
+
+# Администраторы бота (Telegram user id через запятую): команда /reload
+ADMIN_USER_IDS = {int(value) for value in os.getenv('ADMIN_USER_IDS', '').split(',') if value.strip()}
 
 # База данных
 DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///bot.db')
 
+# Собственный сервер Bot API (telegram-bot-api): бот скачивает файлы до 2000 МБ,
+# а в local режиме get_file возвращает путь к файлу на диске сервера (без HTTP передачи)
+TELEGRAM_API_BASE_URL = os.getenv('TELEGRAM_API_BASE_URL', '').rstrip('/')  # например http://localhost:8081
+TELEGRAM_LOCAL_MODE = os.getenv('TELEGRAM_LOCAL_MODE', 'false').lower() == 'true'
+
 # Лимиты файлов
-MAX_FILE_SIZE = int(os.getenv('MAX_FILE_SIZE', 20971520))  # 20MB в байтах
+# 20MB в байтах (лимит публичного Bot API), 2000MB при собственном сервере Bot API
+MAX_FILE_SIZE = int(os.getenv('MAX_FILE_SIZE', 2097152000 if TELEGRAM_API_BASE_URL else 20971520))
 # MAX_PAGES - убрано ограничение на количество страниц
+# Быстрая проверка PDF (mmap) до отправки в CloudConvert: поврежденные файлы отклоняются сразу
+PDF_INSPECTION_ENABLED = os.getenv('PDF_INSPECTION_ENABLED', 'true').lower() == 'true'
+PDF_MAX_PAGES = int(os.getenv('PDF_MAX_PAGES', 0))  # 0 - без ограничения
+# Локальное сжатие сканов перед загрузкой в CloudConvert (нужен Ghostscript или qpdf в PATH):
+# изображения страниц уменьшаются до разрешения, достаточного для OCR; сжатый файл используется,
+# только если он меньше исходного хотя бы на MIN_SAVING
+PDF_COMPRESSION_ENABLED = os.getenv('PDF_COMPRESSION_ENABLED', 'false').lower() == 'true'
+PDF_COMPRESSION_TOOL = os.getenv('PDF_COMPRESSION_TOOL', 'auto')  # auto, ghostscript, qpdf
+PDF_COMPRESSION_DPI = int(os.getenv('PDF_COMPRESSION_DPI', 300))
+PDF_COMPRESSION_MIN_SIZE = int(os.getenv('PDF_COMPRESSION_MIN_SIZE', 2 * 1024 * 1024))  # байт
+PDF_COMPRESSION_MIN_SAVING = float(os.getenv('PDF_COMPRESSION_MIN_SAVING', 0.1))
+
+# Временные файлы задач: отдельная директория на задачу, общая квота (при превышении задачи ждут места)
+# и периодическая уборка директорий, оставшихся от упавших процессов
+TEMP_STORAGE_DIR = os.getenv('TEMP_STORAGE_DIR', os.path.join(tempfile.gettempdir(), 'pdf-bot'))
+TEMP_STORAGE_QUOTA_MB = int(os.getenv('TEMP_STORAGE_QUOTA_MB', 2048))  # 0 - без ограничения
+TEMP_STORAGE_WAIT_TIMEOUT = int(os.getenv('TEMP_STORAGE_WAIT_TIMEOUT', 60))  # ожидание места (секунды)
+TEMP_STORAGE_SWEEP_INTERVAL = int(os.getenv('TEMP_STORAGE_SWEEP_INTERVAL', 600))
+TEMP_STORAGE_MAX_AGE = int(os.getenv('TEMP_STORAGE_MAX_AGE', 3600))  # возраст чужих файлов для удаления
+
+# Webhook режим (если задан публичный URL, вместо polling используется webhook
+# на том же aiohttp сервере, что и health check)
+TELEGRAM_WEBHOOK_URL = os.getenv('TELEGRAM_WEBHOOK_URL', '').rstrip('/')
+TELEGRAM_WEBHOOK_PATH = os.getenv('TELEGRAM_WEBHOOK_PATH', '/telegram/webhook')
+TELEGRAM_WEBHOOK_SECRET = os.getenv('TELEGRAM_WEBHOOK_SECRET', '')
 
 # Логирование
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
 
 # Лимиты пользователей
-USER_REQUEST_LIMIT = 1  # файл в минуту на пользователя
+USER_REQUEST_LIMIT = int(os.getenv('USER_REQUEST_LIMIT', 1))  # файлов за окно на пользователя
+RATE_LIMIT_WINDOW = int(os.getenv('RATE_LIMIT_WINDOW', 60))  # окно лимитов (секунды)
+RATE_LIMIT_FILES_BURST = int(os.getenv('RATE_LIMIT_FILES_BURST', USER_REQUEST_LIMIT))  # файлов подряд
+# Объем и страницы за окно (0 - без ограничения); burst по умолчанию равен объему за окно
+RATE_LIMIT_BYTES_PER_WINDOW = int(os.getenv('RATE_LIMIT_BYTES_PER_WINDOW', 0))
+RATE_LIMIT_PAGES_PER_WINDOW = int(os.getenv('RATE_LIMIT_PAGES_PER_WINDOW', 0))
+RATE_LIMIT_SNAPSHOT_INTERVAL = int(os.getenv('RATE_LIMIT_SNAPSHOT_INTERVAL', 30))  # сохранение в SQLite
+
+# Очередь конвертаций и пул воркеров
+WORKER_POOL_SIZE = int(os.getenv('WORKER_POOL_SIZE', 2))  # одновременных конвертаций
+JOB_QUEUE_MAX_SIZE = int(os.getenv('JOB_QUEUE_MAX_SIZE', 100))  # задач в очереди всего
+JOB_QUEUE_MAX_PER_USER = int(os.getenv('JOB_QUEUE_MAX_PER_USER', 3))  # задач в очереди на пользователя
+JOB_INITIAL_DURATION_ESTIMATE = 90  # начальная оценка длительности задачи для ETA (секунды)
+# Готовность (/ready): при превышении порогов инстанс отвечает 503 и не должен получать трафик
+READY_MAX_LOOP_LAG = float(os.getenv('READY_MAX_LOOP_LAG', 1.0))  # секунд задержки event loop (p99)
+READY_LAG_WINDOW = float(os.getenv('READY_LAG_WINDOW', 30))  # за сколько последних секунд замеров монитора
+READY_MAX_QUEUE_DEPTH = int(os.getenv('READY_MAX_QUEUE_DEPTH', int(JOB_QUEUE_MAX_SIZE * 0.9)))  # 0 - без порога
+READY_MAX_DB_PENDING = int(os.getenv('READY_MAX_DB_PENDING', 100))  # запросов в очереди потока базы
+# Монитор event loop: интервал замеров задержки и порог, после которого в лог пишется стек блокировки
+LOOP_MONITOR_ENABLED = os.getenv('LOOP_MONITOR_ENABLED', 'true').lower() == 'true'
+LOOP_MONITOR_INTERVAL = float(os.getenv('LOOP_MONITOR_INTERVAL', 0.1))
+LOOP_SLOW_CALLBACK_THRESHOLD = float(os.getenv('LOOP_SLOW_CALLBACK_THRESHOLD', 0.5))
+JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', 120))  # аренда задачи воркером (visibility timeout)
+JOB_RECOVERY_INTERVAL = int(os.getenv('JOB_RECOVERY_INTERVAL', 60))  # поиск задач с истекшей арендой
+
+# Параллельная обработка апдейтов Telegram (порядок апдейтов одного пользователя сохраняется)
+UPDATE_CONCURRENCY = int(os.getenv('UPDATE_CONCURRENCY', 16))  # одновременно выполняющихся обработчиков
+UPDATE_MAX_PENDING = int(os.getenv('UPDATE_MAX_PENDING', 256))  # принятых апдейтов всего, включая ожидающие
+
+# Обновления статусных сообщений (лимиты Telegram: ~1 правка в секунду на чат, ~30 в секунду всего)
+PROGRESS_MIN_INTERVAL = float(os.getenv('PROGRESS_MIN_INTERVAL', 2.0))  # секунд между правками в одном чате
+PROGRESS_EDITS_PER_SECOND = float(os.getenv('PROGRESS_EDITS_PER_SECOND', 20))  # правок в секунду на весь бот
+
+# Write-behind журнал операций: события пишутся пачками одной транзакцией
+OPERATION_LOG_FLUSH_INTERVAL_MS = int(os.getenv('OPERATION_LOG_FLUSH_INTERVAL_MS', 500))
+OPERATION_LOG_BATCH_SIZE = int(os.getenv('OPERATION_LOG_BATCH_SIZE', 100))  # запись без ожидания интервала
+OPERATION_LOG_MAX_QUEUE = int(os.getenv('OPERATION_LOG_MAX_QUEUE', 10000))  # событий в памяти
+OPERATION_LOG_SYNC = os.getenv('OPERATION_LOG_SYNC', 'false').lower() == 'true'  # немедленная запись (тесты)
+
+# Хранение журнала операций: завершенные дни сворачиваются в дневные агрегаты,
+# сырые строки старше срока удаляются небольшими пачками
+LOG_RETENTION_DAYS = int(os.getenv('LOG_RETENTION_DAYS', 30))
+LOG_ROLLUP_INTERVAL = int(os.getenv('LOG_ROLLUP_INTERVAL', 3600))  # секунд между проходами
+LOG_PRUNE_BATCH_SIZE = int(os.getenv('LOG_PRUNE_BATCH_SIZE', 500))  # строк в одной транзакции удаления
 
 # Таймауты
 CONVERSION_TIMEOUT = 300  # 5 минут
 API_TIMEOUT = 30  # 30 секунд
 
+# Таймауты стадий конвейера конвертации (секунды)
+STAGE_TIMEOUTS = {
+    'download': int(os.getenv('STAGE_TIMEOUT_DOWNLOAD', 120)),
+    'inspect': int(os.getenv('STAGE_TIMEOUT_INSPECT', 30)),
+    'compress': int(os.getenv('STAGE_TIMEOUT_COMPRESS', 120)),
+    'upload': int(os.getenv('STAGE_TIMEOUT_UPLOAD', 180)),
+    'ocr': int(os.getenv('STAGE_TIMEOUT_OCR', CONVERSION_TIMEOUT * 2)),  # две стратегии
+    'forced_replacement': int(os.getenv('STAGE_TIMEOUT_FORCED_REPLACEMENT', 120)),
+    'enhancement': int(os.getenv('STAGE_TIMEOUT_ENHANCEMENT', 900)),
+    'stats': int(os.getenv('STAGE_TIMEOUT_STATS', 120)),
+    'reply': int(os.getenv('STAGE_TIMEOUT_REPLY', 120)),
+}
+
 # Сообщения об ошибках
 ERROR_MESSAGES = {
     'invalid_format': '❌ Поддерживаются только PDF файлы',
@@ -50,18 +151,26 @@ ERROR_MESSAGES = {
     'no_api_key': '❌ Не настроен API ключ CloudConvert'
 }
 
-# Проверка обязательных переменных
-if not TELEGRAM_BOT_TOKEN:
-    raise ValueError("TELEGRAM_BOT_TOKEN не установлен")
-
-if not CLOUDCONVERT_API_KEY:
-    raise ValueError("CLOUDCONVERT_API_KEY не установлен")
-
 # Claude AI опционален и управляется вручную
 CLAUDE_ENABLED = bool(CLAUDE_API_KEY) and CLAUDE_MANUAL_ENABLED
-if CLAUDE_API_KEY and CLAUDE_MANUAL_ENABLED:
-    print("✅ Claude AI включен")
-elif CLAUDE_API_KEY and not CLAUDE_MANUAL_ENABLED:
-    print("⚠️ Claude AI доступен, но отключен вручную")
-else:
-    print("⚠️ Claude AI недоступен (нет API ключа)") 
\ No newline at end of file
+
+
+def validate_settings():
+    """Проверка обязательных переменных; вызывается при запуске бота, а не при импорте модуля"""
+    if not TELEGRAM_BOT_TOKEN:
+        raise ValueError("TELEGRAM_BOT_TOKEN не установлен")
+    
+    if not CLOUDCONVERT_API_KEY:
+        raise ValueError("CLOUDCONVERT_API_KEY не установлен")
+    
+    if TELEGRAM_WEBHOOK_URL and not TELEGRAM_WEBHOOK_SECRET:
+        raise ValueError("TELEGRAM_WEBHOOK_SECRET обязателен в webhook режиме")
+
+
+def claude_status() -> str:
+    """Состояние Claude AI для лога запуска"""
+    if CLAUDE_API_KEY and CLAUDE_MANUAL_ENABLED:
+        return "✅ Claude AI включен"
+    if CLAUDE_API_KEY:
+        return "⚠️ Claude AI доступен, но отключен вручную"
+    return "⚠️ Claude AI недоступен (нет API ключа)"
@@ -1,22 +1,51 @@
-import asyncio
 import logging
 from aiohttp import web
-import threading
 import time
 
+from services.metrics import REGISTRY
+
 logger = logging.getLogger(__name__)
 
 class HealthServer:
-    def __init__(self, port=8080):
+    def __init__(self, port=8080, max_loop_lag=1.0, lag_window=30.0):
         self.port = port
         self.app = web.Application()
         self.setup_routes()
         self.start_time = time.time()
+        self.status_providers = {}
+        self.runner = None
+        
+        # Проверки готовности выполняются в основном event loop бота
+        self.readiness_checks = {}
+        self.main_loop = None
+        self.max_loop_lag = max_loop_lag
+        self.lag_window = lag_window
+        # Источник задержки event loop (LoopMonitor.recent_lag): замер из самого обработчика
+        # /ready, работающего в том же loop, всегда близок к нулю
+        self.loop_lag = None
+    
+    def add_status_provider(self, name, provider):
+        """Регистрация источника данных для /status (функция, возвращающая словарь)"""
+        self.status_providers[name] = provider
+        
+    def add_readiness_check(self, name, check):
+        """Регистрация проверки для /ready (функция, возвращающая (ok, значение))"""
+        self.readiness_checks[name] = check
+    
+    def set_loop_lag_source(self, source):
+        """Функция окна (сек) -> задержка event loop по последним замерам (сек) или None"""
+        self.loop_lag = source
+    
+    def set_main_loop(self, loop):
+        """Бот запущен в этом event loop: до этого /ready отвечает 503"""
+        self.main_loop = loop
         
     def setup_routes(self):
         """Настройка маршрутов для health check"""
         self.app.router.add_get('/health', self.health_check)
         self.app.router.add_get('/status', self.status_check)
+        self.app.router.add_get('/metrics', self.metrics)
+        self.app.router.add_get('/ready', self.ready_check)
         self.app.router.add_get('/', self.root_check)
         
     async def health_check(self, request):
@@ -29,42 +58,79 @@ class HealthServer:
         
     async def status_check(self, request):
         """Детальный статус сервиса"""
-        return web.json_response({
+        status = {
             'status': 'running',
             'uptime_seconds': time.time() - self.start_time,
             'service': 'telegram-pdf-converter-bot',
             'version': '1.0.0'
-        })
+        }
         
-    async def root_check(self, request):
-        """Корневой endpoint"""
-        return web.Response(text="Telegram PDF to XLSX Converter Bot is running!")
+        for name, provider in self.status_providers.items():
+            try:
+                status[name] = provider()
+            except Exception as e:
+                logger.error(f"Status provider {name} failed: {e}")
+                status[name] = {'error': str(e)}
+        
+        return web.json_response(status)
+        
+    async def ready_check(self, request):
+        """Готовность принимать трафик: 503, если бот перегружен или зависим от недоступного сервиса"""
+        if self.main_loop is None:
+            return web.json_response({'ready': False, 'reason': 'starting'}, status=503)
         
-    def start_server(self):
-        """Запуск сервера в отдельном потоке"""
-        def run_server():
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-            async def start():
-                runner = web.AppRunner(self.app)
-                await runner.setup()
-                site = web.TCPSite(runner, '0.0.0.0', self.port)
-                await site.start()
-                logger.info(f"Health server started on port {self.port}")
-                
-                # Держим сервер запущенным
-                while True:
-                    await asyncio.sleep(1)
-            
+        checks = self._evaluate_readiness()
+        ready = all(check['ok'] for check in checks.values())
+        return web.json_response({'ready': ready, 'checks': checks}, status=200 if ready else 503)
+    
+    def _evaluate_readiness(self) -> dict:
+        """Проверки готовности; задержка event loop - p99 замеров монитора за lag_window секунд"""
+        checks = {}
+        if self.loop_lag is not None:
             try:
-                loop.run_until_complete(start())
+                lag = self.loop_lag(self.lag_window)
+                checks['event_loop_lag'] = {
+                    'ok': lag is None or lag <= self.max_loop_lag,
+                    'value': None if lag is None else round(lag, 4),
+                }
             except Exception as e:
-                logger.error(f"Health server error: {e}")
+                logger.error(f"Event loop lag check failed: {e}")
+                checks['event_loop_lag'] = {'ok': False, 'value': str(e)}
         
-        # Запуск в отдельном потоке
-        thread = threading.Thread(target=run_server, daemon=True)
-        thread.start()
-        logger.info("Health server thread started")
+        for name, check in self.readiness_checks.items():
+            try:
+                ok, value = check()
+                checks[name] = {'ok': bool(ok), 'value': value}
+            except Exception as e:
+                logger.error(f"Readiness check {name} failed: {e}")
+                checks[name] = {'ok': False, 'value': str(e)}
+        return checks
+    
+    async def metrics(self, request):
+        """Метрики в текстовом формате Prometheus"""
+        return web.Response(text=REGISTRY.render(), content_type='text/plain',
+                            headers={'X-Prometheus-Format': '0.0.4'})
+        
+    async def root_check(self, request):
+        """Корневой endpoint"""
+        return web.Response(text="Telegram PDF to XLSX Converter Bot is running!")
         
-        return thread 
\ No newline at end of file
+    def add_webhook_route(self, path, handler):
+        """Маршрут webhook Telegram (добавляется до запуска сервера)"""
+        self.app.router.add_post(path, handler)
+    
+    async def start(self):
+        """Запуск сервера в текущем event loop (event loop бота)"""
+        if self.runner:
+            return
+        self.runner = web.AppRunner(self.app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '0.0.0.0', self.port)
+        await site.start()
+        logger.info(f"Health server started on port {self.port}")
+    
+    async def stop(self):
+        """Остановка сервера, запущенного через start()"""
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
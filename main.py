@@ -1,13 +1,36 @@
+import time
+
+# Отметка старта до импорта тяжелых модулей (для --profile-startup)
+STARTED = time.perf_counter()
+
 import asyncio
 import logging
 import signal
 import sys
 import os
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters
 
-from config.settings import TELEGRAM_BOT_TOKEN, LOG_LEVEL
+startup_profiler = None
+if '--profile-startup' in sys.argv:
+    # Профилировщик встает в sys.meta_path до импорта telegram, aiohttp и сервисов бота
+    from services.startup_profiler import StartupProfiler
+    startup_profiler = StartupProfiler(STARTED)
+    startup_profiler.install()
+
+from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, TypeHandler, filters
+
+from telegram import Update
+from config.settings import (
+    TELEGRAM_BOT_TOKEN, LOG_LEVEL, UPDATE_CONCURRENCY, UPDATE_MAX_PENDING,
+    TELEGRAM_WEBHOOK_URL, TELEGRAM_WEBHOOK_PATH, TELEGRAM_WEBHOOK_SECRET,
+    TELEGRAM_API_BASE_URL, TELEGRAM_LOCAL_MODE, READY_MAX_LOOP_LAG, READY_LAG_WINDOW,
+    LOOP_MONITOR_ENABLED, LOOP_MONITOR_INTERVAL, LOOP_SLOW_CALLBACK_THRESHOLD,
+    validate_settings, claude_status
+)
+from config.runtime import runtime
 from bot.handlers import BotHandlers
-from services.database import Database
+from bot.update_processor import PerUserUpdateProcessor
+from bot.webhook import TelegramWebhook
+from services.loop_monitor import LoopMonitor
 from health_server import HealthServer
 
 # Настройка логирования
@@ -17,30 +40,134 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+if startup_profiler:
+    startup_profiler.mark("imports")
+
+async def run_webhook(application: Application, health_server: HealthServer):
+    """Режим webhook: апдейты принимает тот же aiohttp сервер и event loop, что и health check"""
+    webhook = TelegramWebhook(application, TELEGRAM_WEBHOOK_SECRET)
+    health_server.add_webhook_route(TELEGRAM_WEBHOOK_PATH, webhook.handle)
+    health_server.add_status_provider('webhook', webhook.get_stats)
+    
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            pass
+    
+    await application.initialize()
+    try:
+        # post_init/post_shutdown вызываются только run_polling/run_webhook, здесь - вручную
+        if application.post_init:
+            await application.post_init(application)
+        
+        await application.bot.set_webhook(
+            url=f"{TELEGRAM_WEBHOOK_URL}{TELEGRAM_WEBHOOK_PATH}",
+            secret_token=TELEGRAM_WEBHOOK_SECRET,
+            allowed_updates=Update.ALL_TYPES
+        )
+        await application.start()
+        logger.info(f"Webhook set to {TELEGRAM_WEBHOOK_URL}{TELEGRAM_WEBHOOK_PATH}")
+        
+        await stop_event.wait()
+    finally:
+        await health_server.stop()
+        if application.running:
+            await application.stop()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+        await application.shutdown()
+
 def main():
     """Главная функция для запуска бота"""
     try:
-        # Запуск health server для Railway
+        validate_settings()
+        logger.info(claude_status())
+        
         port = int(os.getenv('PORT', 8080))
-        health_server = HealthServer(port)
-        health_server.start_server()
+        health_server = HealthServer(port, READY_MAX_LOOP_LAG, READY_LAG_WINDOW)
         
-        # Инициализация базы данных
-        logger.info("Initializing database...")
-        db = Database()
+        # Инициализация обработчиков
+        handlers = BotHandlers()
+        if startup_profiler:
+            startup_profiler.mark("handlers created")
+        
+        # Задержка event loop и стеки блокирующих вызовов
+        loop_monitor = LoopMonitor(LOOP_MONITOR_INTERVAL, LOOP_SLOW_CALLBACK_THRESHOLD)
+        
+        async def post_init(app: Application):
+            # Health check, /ready и метрики обслуживаются в event loop бота (в режиме webhook - и апдейты)
+            await health_server.start()
+            if LOOP_MONITOR_ENABLED:
+                await loop_monitor.start()
+                # Задержка event loop для /ready берется из замеров монитора
+                health_server.set_loop_lag_source(loop_monitor.recent_lag)
+            # Воркеры конвертации запускаются в event loop приложения,
+            # незавершенные задачи из базы ставятся в очередь повторно
+            await handlers.on_startup(app)
+            # /ready проверяет состояние бота в его event loop
+            health_server.set_main_loop(asyncio.get_running_loop())
+            # kill -HUP <pid> перечитывает .env без перезапуска (как /reload)
+            if hasattr(signal, 'SIGHUP'):
+                try:
+                    asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, handlers.reload_settings)
+                except NotImplementedError:
+                    pass
+            if startup_profiler:
+                startup_profiler.mark("bot started")
+        
+        async def post_shutdown(app: Application):
+            await health_server.stop()
+            await handlers.on_shutdown(app)
+            await loop_monitor.stop()
+        
+        # Апдейты разных пользователей обрабатываются параллельно, одного пользователя - по порядку
+        update_processor = PerUserUpdateProcessor(UPDATE_CONCURRENCY, UPDATE_MAX_PENDING)
+        health_server.add_status_provider('updates', update_processor.get_stats)
+        health_server.add_status_provider('jobs', handlers.worker_pool.get_stats)
+        health_server.add_status_provider('progress', handlers.progress.get_stats)
+        health_server.add_status_provider('dedup', handlers.singleflight.get_stats)
+        health_server.add_status_provider('db', handlers.db.get_writer_stats)
+        health_server.add_status_provider('operation_log', handlers.oplog.get_stats)
+        health_server.add_status_provider('rate_limits', handlers.rate_limiter.get_stats)
+        health_server.add_status_provider('log_retention', handlers.log_retention.get_stats)
+        health_server.add_status_provider('temp_storage', handlers.storage.get_stats)
+        health_server.add_status_provider('cloudconvert', handlers.cloudconvert.breaker.get_stats)
+        health_server.add_status_provider('event_loop', loop_monitor.get_stats)
+        health_server.add_status_provider('settings', runtime.get_stats)
+        for name, check in handlers.get_readiness_checks().items():
+            health_server.add_readiness_check(name, check)
         
         # Создание приложения
         logger.info("Creating bot application...")
-        application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+        builder = (
+            Application.builder()
+            .token(TELEGRAM_BOT_TOKEN)
+            .concurrent_updates(update_processor)
+            .post_init(post_init)
+            .post_shutdown(post_shutdown)
+        )
         
-        # Инициализация обработчиков
-        handlers = BotHandlers()
+        if TELEGRAM_API_BASE_URL:
+            # Собственный сервер Bot API: большие файлы и (в local режиме) прямой доступ к файлам на диске
+            logger.info(f"Using Bot API server {TELEGRAM_API_BASE_URL} (local mode: {TELEGRAM_LOCAL_MODE})")
+            builder = (
+                builder
+                .base_url(f"{TELEGRAM_API_BASE_URL}/bot")
+                .base_file_url(f"{TELEGRAM_API_BASE_URL}/file/bot")
+                .local_mode(TELEGRAM_LOCAL_MODE)
+            )
+        
+        application = builder.build()
         
         # Регистрация обработчиков команд
         application.add_handler(CommandHandler("start", handlers.start_command))
         application.add_handler(CommandHandler("help", handlers.help_command))
         application.add_handler(CommandHandler("convert", handlers.convert_command))
         application.add_handler(CommandHandler("status", handlers.status_command))
+        application.add_handler(CommandHandler("reload", handlers.reload_command))
         
         # Обработчик документов
         application.add_handler(MessageHandler(
@@ -57,14 +184,26 @@ def main():
             handlers.handle_unknown_command
         ))
         
+        if startup_profiler:
+            # Группа -1 выполняется до остальных обработчиков для каждого апдейта
+            async def on_first_update(update: Update, context):
+                startup_profiler.first_update()
+            application.add_handler(TypeHandler(Update, on_first_update), group=-1)
+            startup_profiler.mark("application built")
+        
         logger.info("Bot handlers registered successfully")
         
         # Запуск бота
         logger.info("Starting bot...")
         logger.info("Bot is running! Press Ctrl+C to stop.")
         
-        # Запуск polling
-        application.run_polling()
+        if TELEGRAM_WEBHOOK_URL:
+            # Webhook, health check и статус на одном порту и в одном event loop
+            logger.info("Starting in webhook mode")
+            asyncio.run(run_webhook(application, health_server))
+        else:
+            # Запуск polling (health server для Railway запускается в post_init)
+            application.run_polling()
         
     except Exception as e:
         logger.error(f"Error starting bot: {e}")
@@ -6,6 +6,7 @@
 
 import os
 import asyncio
+import signal
 import sys
 from pathlib import Path
 
@@ -44,6 +45,17 @@ def update_env_variable(var_name: str, value: str):
     with open(env_path, 'w', encoding='utf-8') as f:
         f.writelines(lines)
 
+def apply_changes(pid: str = None):
+    """Применяет изменения .env в запущенном боте: SIGHUP процессу или подсказка"""
+    if pid and hasattr(signal, 'SIGHUP'):
+        try:
+            os.kill(int(pid), signal.SIGHUP)
+            print(f"🔄 Бот (PID {pid}) перечитал настройки.")
+            return
+        except (ValueError, OSError) as e:
+            print(f"⚠️ Не удалось отправить SIGHUP процессу {pid}: {e}")
+    print("Примените изменения без перезапуска: команда /reload в боте или kill -HUP <PID бота>.")
+
 def show_status():
     """Показывает текущий статус Claude AI"""
     print("🤖 Claude AI Status")
@@ -53,7 +65,7 @@ def show_status():
     print(f"Status: {'🟢 Включен' if CLAUDE_ENABLED else '🔴 Отключен'}")
     print()
 
-def enable_claude():
+def enable_claude(pid: str = None):
     """Включает Claude AI"""
     if not CLAUDE_API_KEY:
         print("❌ Ошибка: API ключ Claude не настроен!")
@@ -62,13 +74,13 @@ def enable_claude():
     
     update_env_variable('CLAUDE_MANUAL_ENABLED', 'true')
     print("✅ Claude AI включен!")
-    print("Перезапустите бота для применения изменений.")
+    apply_changes(pid)
 
-def disable_claude():
+def disable_claude(pid: str = None):
     """Отключает Claude AI"""
     update_env_variable('CLAUDE_MANUAL_ENABLED', 'false')
     print("🔴 Claude AI отключен!")
-    print("Перезапустите бота для применения изменений.")
+    apply_changes(pid)
 
 async def test_enhancement():
     """Тестирует функцию улучшения текста"""
@@ -134,15 +146,16 @@ def show_help():
     print("=" * 50)
     print()
     print("Команды:")
-    print("  status      - Показать текущий статус")
-    print("  enable      - Включить Claude AI")
-    print("  disable     - Отключить Claude AI")
-    print("  test        - Тестировать улучшение текста")
-    print("  help        - Показать эту справку")
+    print("  status        - Показать текущий статус")
+    print("  enable [PID]  - Включить Claude AI (с PID бот сразу перечитает настройки)")
+    print("  disable [PID] - Отключить Claude AI")
+    print("  test          - Тестировать улучшение текста")
+    print("  help          - Показать эту справку")
     print()
     print("Примеры:")
     print("  python manage_claude.py status")
     print("  python manage_claude.py enable")
+    print("  python manage_claude.py disable $(pgrep -f main.py)")
     print("  python manage_claude.py test")
 
 async def main():
@@ -152,13 +165,14 @@ async def main():
         return
     
     command = sys.argv[1].lower()
+    pid = sys.argv[2] if len(sys.argv) > 2 else None
     
     if command == 'status':
         show_status()
     elif command == 'enable':
-        enable_claude()
+        enable_claude(pid)
     elif command == 'disable':
-        disable_claude()
+        disable_claude(pid)
     elif command == 'test':
         await test_enhancement()
     elif command == 'help':
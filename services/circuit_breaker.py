@@ -0,0 +1,72 @@
+import logging
+import time
+from typing import Dict, Any
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Внешний сервис временно считается недоступным, запрос не отправлялся"""
+
+
+class CircuitBreaker:
+    """Предохранитель внешнего сервиса.
+
+    После failure_threshold ошибок подряд переходит в состояние open и отклоняет новые
+    запросы reset_timeout секунд. Затем пропускает одну пробную попытку (half_open):
+    успех закрывает предохранитель, ошибка снова открывает его.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 60.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self.trips = 0
+
+    def allow(self) -> bool:
+        """Можно ли начинать новую работу с сервисом"""
+        if self.state == self.CLOSED:
+            return True
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            # Пробная попытка; следующая - не раньше чем через reset_timeout
+            self.state = self.HALF_OPEN
+            self.opened_at = time.monotonic()
+            return True
+        self.rejected += 1
+        return False
+
+    @property
+    def is_open(self) -> bool:
+        """Сервис считается недоступным и пробная попытка еще не положена"""
+        return self.state != self.CLOSED and time.monotonic() - self.opened_at < self.reset_timeout
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            logger.info(f"Circuit {self.name} closed")
+        self.state = self.CLOSED
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self.trips += 1
+            logger.warning(f"Circuit {self.name} opened after {self.failures} consecutive failures")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Состояние предохранителя"""
+        return {
+            'state': self.state,
+            'consecutive_failures': self.failures,
+            'trips': self.trips,
+            'rejected': self.rejected,
+        }
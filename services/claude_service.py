@@ -1,17 +1,40 @@
 import asyncio
 import logging
 import base64
+import time
 from typing import Optional, Tuple
-from anthropic import AsyncAnthropic
 from config.settings import CLAUDE_API_KEY, CLAUDE_MODEL
+from services.metrics import CLAUDE_LATENCY, record_claude_response
+from services.lazy_import import LazyModule
+
+# anthropic импортируется больше секунды - только при первом запросе к Claude
+anthropic = LazyModule('anthropic')
 
 logger = logging.getLogger(__name__)
 
 class ClaudeService:
     def __init__(self):
-        self.client = AsyncAnthropic(api_key=CLAUDE_API_KEY)
+        self._client = None
         self.model = CLAUDE_MODEL
     
+    @property
+    def client(self):
+        """Клиент Anthropic (создается при первом обращении)"""
+        if self._client is None:
+            self._client = anthropic.AsyncAnthropic(api_key=CLAUDE_API_KEY)
+        return self._client
+    
+    async def _create(self, **kwargs):
+        """Запрос к Claude с учетом длительности и токенов в метриках"""
+        started = time.perf_counter()
+        try:
+            response = await self.client.messages.create(**kwargs)
+        except Exception:
+            CLAUDE_LATENCY.observe(time.perf_counter() - started, outcome='error')
+            raise
+        record_claude_response(response, time.perf_counter() - started)
+        return response
+    
     async def enhance_xlsx_file(self, pdf_data: bytes, xlsx_data: bytes, original_filename: str) -> Optional[bytes]:
         """
         Улучшение XLSX файла с помощью Claude AI
@@ -61,7 +84,7 @@ XLSX образец (base64): {xlsx_base64}
 Дай краткие рекомендации по улучшению качества."""
 
             # Отправляем запрос к Claude
-            response = await self.client.messages.create(
+            response = await self._create(
                 model=self.model,
                 max_tokens=1024,
                 system=system_message,
@@ -123,7 +146,7 @@ XLSX образец: {xlsx_base64}
 
 Дай краткую оценку качества конвертации."""
 
-            response = await self.client.messages.create(
+            response = await self._create(
                 model=self.model,
                 max_tokens=512,
                 system=system_message,
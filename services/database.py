@@ -1,14 +1,167 @@
 import sqlite3
+import asyncio
+import functools
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Callable
 from contextlib import contextmanager
 
+from services.metrics import DB_CALL_DURATION
+
 logger = logging.getLogger(__name__)
 
+# Миграции схемы: (версия, SQL запросы). Применяются по порядку при запуске,
+# номер последней примененной миграции хранится в PRAGMA user_version
+MIGRATIONS = [
+    (1, [
+        # Индексы для выборок по пользователю, статусу и времени
+        'CREATE INDEX IF NOT EXISTS idx_operations_user_created ON operations_log(user_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_operations_status ON operations_log(status)',
+        'CREATE INDEX IF NOT EXISTS idx_operations_created ON operations_log(created_at)',
+    ]),
+    (2, [
+        # Счетчики для статистики за O(1): общие и по пользователям
+        '''
+            CREATE TABLE IF NOT EXISTS stats_counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL DEFAULT 0
+            )
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS user_stats (
+                user_id INTEGER PRIMARY KEY,
+                username TEXT,
+                operations INTEGER NOT NULL DEFAULT 0,
+                successful INTEGER NOT NULL DEFAULT 0,
+                last_activity TIMESTAMP
+            )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_user_stats_operations ON user_stats(operations)',
+        
+        # Заполнение по уже накопленному журналу (один проход при миграции)
+        '''
+            INSERT OR REPLACE INTO stats_counters (name, value)
+            SELECT 'operations', COUNT(*) FROM operations_log
+        ''',
+        '''
+            INSERT OR REPLACE INTO stats_counters (name, value)
+            SELECT 'status:' || status, COUNT(*) FROM operations_log GROUP BY status
+        ''',
+        '''
+            INSERT OR REPLACE INTO user_stats (user_id, username, operations, successful, last_activity)
+            SELECT user_id, MAX(username), COUNT(*), SUM(status = 'completed'), MAX(created_at)
+            FROM operations_log GROUP BY user_id
+        ''',
+        '''
+            INSERT OR REPLACE INTO stats_counters (name, value)
+            SELECT 'users', COUNT(*) FROM user_stats
+        ''',
+        
+        # Дальше счетчики поддерживаются триггерами при вставке и смене статуса
+        '''
+            CREATE TRIGGER IF NOT EXISTS trg_operations_insert AFTER INSERT ON operations_log
+            BEGIN
+                INSERT INTO stats_counters (name, value) VALUES ('operations', 1)
+                    ON CONFLICT(name) DO UPDATE SET value = value + 1;
+                INSERT INTO stats_counters (name, value) VALUES ('status:' || NEW.status, 1)
+                    ON CONFLICT(name) DO UPDATE SET value = value + 1;
+                INSERT INTO user_stats (user_id, username, operations, successful, last_activity)
+                    VALUES (NEW.user_id, NEW.username, 1, NEW.status = 'completed', NEW.created_at)
+                    ON CONFLICT(user_id) DO UPDATE SET
+                        username = COALESCE(excluded.username, username),
+                        operations = operations + 1,
+                        successful = successful + excluded.successful,
+                        last_activity = MAX(COALESCE(last_activity, ''), excluded.last_activity);
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS trg_operations_status AFTER UPDATE OF status ON operations_log
+            WHEN OLD.status <> NEW.status
+            BEGIN
+                UPDATE stats_counters SET value = value - 1 WHERE name = 'status:' || OLD.status;
+                INSERT INTO stats_counters (name, value) VALUES ('status:' || NEW.status, 1)
+                    ON CONFLICT(name) DO UPDATE SET value = value + 1;
+                UPDATE user_stats
+                SET successful = successful + (NEW.status = 'completed') - (OLD.status = 'completed')
+                WHERE user_id = NEW.user_id;
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS trg_user_stats_insert AFTER INSERT ON user_stats
+            BEGIN
+                INSERT INTO stats_counters (name, value) VALUES ('users', 1)
+                    ON CONFLICT(name) DO UPDATE SET value = value + 1;
+            END
+        ''',
+    ]),
+    (3, [
+        # Снимок корзин лимитера (services/rate_limiter.py) для восстановления после рестарта
+        '''
+            CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+                user_id INTEGER NOT NULL,
+                dimension TEXT NOT NULL,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (user_id, dimension)
+            )
+        ''',
+    ]),
+    (4, [
+        # Дневные агрегаты журнала операций: история хранится в них, сырые строки удаляются
+        '''
+            CREATE TABLE IF NOT EXISTS daily_status_stats (
+                day TEXT NOT NULL,
+                operation TEXT NOT NULL,
+                status TEXT NOT NULL,
+                operations INTEGER NOT NULL,
+                total_bytes INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, operation, status)
+            )
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS daily_user_stats (
+                day TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                operations INTEGER NOT NULL,
+                successful INTEGER NOT NULL,
+                errors INTEGER NOT NULL,
+                total_bytes INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, user_id)
+            )
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS maintenance_state (
+                name TEXT PRIMARY KEY,
+                value TEXT
+            )
+        ''',
+    ]),
+    (5, [
+        # Длительности стадий конвейера по операциям (попытки стратегий - со своей стратегией)
+        '''
+            CREATE TABLE IF NOT EXISTS stage_timings (
+                operation_id INTEGER NOT NULL,
+                stage TEXT NOT NULL,
+                strategy TEXT NOT NULL DEFAULT '',
+                duration_ms INTEGER NOT NULL,
+                file_size INTEGER,
+                created_at TEXT NOT NULL,
+                PRIMARY KEY (operation_id, stage, strategy)
+            ) WITHOUT ROWID
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_stage_timings_created ON stage_timings(created_at)',
+    ]),
+]
+
 class Database:
     def __init__(self, db_path: str = "bot.db"):
         self.db_path = db_path
+        # Одно долгоживущее соединение на весь процесс (доступ сериализуется блокировкой)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
         self.init_db()
     
     def init_db(self):
@@ -51,18 +204,100 @@ class Database:
                 )
             ''')
             
+            # Таблица для долговременной очереди задач конвертации
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS conversion_jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL,
+                    username TEXT,
+                    chat_id INTEGER NOT NULL,
+                    message_id INTEGER,
+                    status_message_id INTEGER,
+                    file_id TEXT NOT NULL,
+                    file_unique_id TEXT,
+                    file_name TEXT,
+                    file_size INTEGER,
+                    operation_id INTEGER,
+                    state TEXT NOT NULL DEFAULT 'queued',
+                    cc_job_id TEXT,
+                    strategy TEXT,
+                    lease_owner TEXT,
+                    lease_expires_at REAL,
+                    attempts INTEGER DEFAULT 0,
+                    error_message TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # Таблица уже отправленных XLSX: повторная доставка по file_id Telegram без загрузки файла
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS delivered_files (
+                    source_hash TEXT PRIMARY KEY,
+                    file_unique_id TEXT,
+                    xlsx_file_id TEXT NOT NULL,
+                    caption TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_delivered_files_unique_id
+                ON delivered_files(file_unique_id)
+            ''')
+            
             conn.commit()
+            
+            self._apply_migrations(conn)
             logger.info("Database initialized successfully")
     
+    def _apply_migrations(self, conn: sqlite3.Connection):
+        """Применение миграций схемы, которые еще не применялись к этой базе"""
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        
+        for target_version, statements in MIGRATIONS:
+            if target_version <= version:
+                continue
+            
+            # Каждая миграция применяется атомарно вместе с новым номером версии
+            conn.execute('BEGIN')
+            try:
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute(f'PRAGMA user_version = {target_version}')
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            
+            logger.info(f"Applied database migration {target_version}")
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Открытие соединения: WAL журнал и synchronous=NORMAL вместо fsync на каждый commit"""
+        conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False, cached_statements=256)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+    
     @contextmanager
     def get_connection(self):
-        """Контекстный менеджер для работы с соединением"""
-        conn = sqlite3.connect(self.db_path, timeout=30)
-        conn.row_factory = sqlite3.Row
-        try:
-            yield conn
-        finally:
-            conn.close()
+        """Контекстный менеджер для работы с единственным долгоживущим соединением"""
+        with self._lock:
+            if self._conn is None:
+                self._conn = self._connect()
+            try:
+                yield self._conn
+            except Exception:
+                # Незафиксированные изменения упавшего запроса не должны попасть в следующий commit
+                self._conn.rollback()
+                raise
+    
+    def close(self):
+        """Закрытие соединения"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
     
     def log_operation(self, user_id: int, username: str, operation: str, 
                      status: str, file_name: str = None, file_size: int = None,
@@ -89,32 +324,200 @@ class Database:
             ''', (status, error_message, operation_id))
             conn.commit()
     
-    def check_user_rate_limit(self, user_id: int) -> bool:
-        """Проверка лимита запросов пользователя"""
+    def allocate_operation_ids(self, count: int) -> int:
+        """Резерв диапазона из count id журнала операций, возвращает первый id.
+        
+        Диапазоны выдаются под блокировкой записи (BEGIN IMMEDIATE), поэтому процессы,
+        работающие одновременно (старый и новый при деплое), не получают одинаковых id.
+        """
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            
-            # Получаем последний запрос пользователя
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute("SELECT value FROM maintenance_state WHERE name = 'operation_id_next'")
+            row = cursor.fetchone()
+            cursor.execute('SELECT COALESCE(MAX(id), 0) AS max_id FROM operations_log')
+            start = max(int(row['value']) if row else 0, cursor.fetchone()['max_id'] + 1)
             cursor.execute('''
-                SELECT last_request FROM user_limits WHERE user_id = ?
-            ''', (user_id,))
-            
-            result = cursor.fetchone()
-            now = datetime.now()
+                INSERT OR REPLACE INTO maintenance_state (name, value) VALUES ('operation_id_next', ?)
+            ''', (str(start + count),))
+            conn.commit()
+            return start
+    
+    def write_operation_events(self, events: List[Dict[str, Any]]):
+        """Запись пачки событий журнала операций одной транзакцией"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            for event in events:
+                if event['type'] == 'insert':
+                    cursor.execute('''
+                        INSERT INTO operations_log
+                        (id, user_id, username, operation, status, file_name, file_size,
+                         error_message, created_at)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', (event['id'], event['user_id'], event['username'], event['operation'],
+                          event['status'], event['file_name'], event['file_size'],
+                          event['error_message'], event['timestamp']))
+                elif event['type'] == 'timings':
+                    cursor.executemany('''
+                        INSERT OR REPLACE INTO stage_timings
+                        (operation_id, stage, strategy, duration_ms, file_size, created_at)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    ''', [(event['id'], stage, strategy or '', int(duration * 1000),
+                           event['file_size'], event['timestamp'])
+                          for stage, duration, strategy in event['stages']])
+                else:
+                    cursor.execute('''
+                        UPDATE operations_log
+                        SET status = ?, completed_at = ?, error_message = ?
+                        WHERE id = ?
+                    ''', (event['status'], event['timestamp'], event['error_message'], event['id']))
+            conn.commit()
+    
+    def load_rate_limit_buckets(self) -> List[Dict[str, Any]]:
+        """Сохраненное состояние лимитера"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT user_id, dimension, tokens, updated_at FROM rate_limit_buckets
+            ''')
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def save_rate_limit_buckets(self, changed: List[tuple], released: List[tuple]):
+        """Сохранение измененных корзин лимитера и удаление заполнившихся одной транзакцией"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany('''
+                INSERT OR REPLACE INTO rate_limit_buckets (user_id, dimension, tokens, updated_at)
+                VALUES (?, ?, ?, ?)
+            ''', changed)
+            cursor.executemany('''
+                DELETE FROM rate_limit_buckets WHERE user_id = ? AND dimension = ?
+            ''', released)
+            conn.commit()
+    
+    def rollup_daily_stats(self) -> int:
+        """Свертка завершенных дней журнала в дневные агрегаты, возвращает число свернутых дней.
+        
+        Сворачиваются дни старше вчерашнего (операции вчерашнего дня еще могут менять статус),
+        каждый день - отдельной короткой транзакцией.
+        """
+        until = (datetime.utcnow().date() - timedelta(days=1)).isoformat()
+        
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT value FROM maintenance_state WHERE name = 'rollup_until'")
+            row = cursor.fetchone()
+            if row:
+                day = row['value']
+            else:
+                cursor.execute('SELECT MIN(created_at) AS first FROM operations_log')
+                first = cursor.fetchone()['first']
+                if not first:
+                    return 0
+                day = first[:10]
+        
+        rolled = 0
+        while day < until:
+            next_day = (datetime.strptime(day, '%Y-%m-%d').date() + timedelta(days=1)).isoformat()
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT OR REPLACE INTO daily_status_stats (day, operation, status, operations, total_bytes)
+                    SELECT ?, operation, status, COUNT(*), COALESCE(SUM(file_size), 0)
+                    FROM operations_log
+                    WHERE created_at >= ? AND created_at < ?
+                    GROUP BY operation, status
+                ''', (day, day, next_day))
+                cursor.execute('''
+                    INSERT OR REPLACE INTO daily_user_stats
+                    (day, user_id, operations, successful, errors, total_bytes)
+                    SELECT ?, user_id, COUNT(*), SUM(status = 'completed'), SUM(status = 'error'),
+                           COALESCE(SUM(file_size), 0)
+                    FROM operations_log
+                    WHERE created_at >= ? AND created_at < ?
+                    GROUP BY user_id
+                ''', (day, day, next_day))
+                cursor.execute('''
+                    INSERT OR REPLACE INTO maintenance_state (name, value) VALUES ('rollup_until', ?)
+                ''', (next_day,))
+                conn.commit()
             
-            if result:
-                last_request = datetime.fromisoformat(result['last_request'])
-                if now - last_request < timedelta(minutes=1):
-                    return False
+            day = next_day
+            rolled += 1
+        
+        if rolled:
+            logger.info(f"Rolled up {rolled} days of operations log")
+        return rolled
+    
+    def prune_operations_log(self, before_day: str, batch_size: int = 500) -> int:
+        """Удаление одной пачки сырых строк журнала старше before_day (только из уже свернутых дней)"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT value FROM maintenance_state WHERE name = 'rollup_until'")
+            row = cursor.fetchone()
+            if not row:
+                return 0
             
-            # Обновляем время последнего запроса
+            cutoff = min(before_day, row['value'])
             cursor.execute('''
-                INSERT OR REPLACE INTO user_limits (user_id, last_request, request_count)
-                VALUES (?, ?, COALESCE((SELECT request_count + 1 FROM user_limits WHERE user_id = ?), 1))
-            ''', (user_id, now.isoformat(), user_id))
-            
+                DELETE FROM operations_log WHERE id IN (
+                    SELECT id FROM operations_log WHERE created_at < ? ORDER BY created_at LIMIT ?
+                )
+            ''', (cutoff, batch_size))
+            deleted = cursor.rowcount
+            # Тайминги стадий хранятся столько же, сколько сырой журнал
+            cursor.execute('''
+                DELETE FROM stage_timings WHERE operation_id IN (
+                    SELECT operation_id FROM stage_timings WHERE created_at < ? LIMIT ?
+                )
+            ''', (cutoff, batch_size))
+            deleted += cursor.rowcount
             conn.commit()
-            return True
+            return deleted
+    
+    def get_stage_timings(self, since: str) -> List[Dict[str, Any]]:
+        """Длительности стадий, записанные начиная с since ('YYYY-MM-DD HH:MM:SS', UTC)"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT stage, strategy, duration_ms, file_size
+                FROM stage_timings
+                WHERE created_at >= ?
+            ''', (since,))
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def get_daily_stats(self, days: int = 14) -> List[Dict[str, Any]]:
+        """История по дням из агрегатов (дни, еще не свернутые, считаются по сырому журналу)"""
+        since = (datetime.utcnow().date() - timedelta(days=days - 1)).isoformat()
+        
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT value FROM maintenance_state WHERE name = 'rollup_until'")
+            row = cursor.fetchone()
+            rollup_until = row['value'] if row else since
+            
+            cursor.execute('''
+                SELECT s.day, s.operations, s.successful, s.errors, s.total_bytes, u.users
+                FROM (
+                    SELECT day, SUM(operations) AS operations,
+                           SUM(CASE WHEN status = 'completed' THEN operations ELSE 0 END) AS successful,
+                           SUM(CASE WHEN status = 'error' THEN operations ELSE 0 END) AS errors,
+                           SUM(total_bytes) AS total_bytes
+                    FROM daily_status_stats WHERE day >= ? AND day < ? GROUP BY day
+                ) s
+                JOIN (
+                    SELECT day, COUNT(*) AS users FROM daily_user_stats
+                    WHERE day >= ? AND day < ? GROUP BY day
+                ) u ON u.day = s.day
+                UNION ALL
+                SELECT date(created_at) AS day, COUNT(*), SUM(status = 'completed'), SUM(status = 'error'),
+                       COALESCE(SUM(file_size), 0), COUNT(DISTINCT user_id)
+                FROM operations_log
+                WHERE created_at >= ?
+                GROUP BY date(created_at)
+                ORDER BY day
+            ''', (since, rollup_until, since, rollup_until, max(since, rollup_until)))
+            return [dict(row) for row in cursor.fetchall()]
     
     def save_active_task(self, user_id: int, job_id: str, file_name: str):
         """Сохранение активной задачи"""
@@ -146,26 +549,150 @@ class Database:
             ''', (user_id,))
             conn.commit()
     
-    def get_stats(self) -> Dict[str, Any]:
-        """Получение статистики"""
+    def create_job(self, user_id: int, username: str, chat_id: int, message_id: int,
+                   status_message_id: int, file_id: str, file_unique_id: str,
+                   file_name: str, file_size: int, operation_id: int = None) -> int:
+        """Создание записи задачи конвертации в состоянии queued"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO conversion_jobs
+                (user_id, username, chat_id, message_id, status_message_id, file_id,
+                 file_unique_id, file_name, file_size, operation_id, state)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'queued')
+            ''', (user_id, username, chat_id, message_id, status_message_id, file_id,
+                  file_unique_id, file_name, file_size, operation_id))
+            conn.commit()
+            return cursor.lastrowid
+    
+    def get_job(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """Получение записи задачи конвертации"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT * FROM conversion_jobs WHERE id = ?
+            ''', (job_id,))
             
-            # Общее количество операций
-            cursor.execute('SELECT COUNT(*) as total FROM operations_log')
-            total_operations = cursor.fetchone()['total']
+            result = cursor.fetchone()
+            return dict(result) if result else None
+    
+    def claim_job(self, job_id: int, owner: str, lease_seconds: float) -> bool:
+        """Захват задачи воркером: успешен, только если задача не завершена и аренда свободна или истекла"""
+        now = time.time()
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE conversion_jobs
+                SET state = CASE WHEN cc_job_id IS NULL THEN 'running' ELSE 'remote' END,
+                    lease_owner = ?, lease_expires_at = ?, attempts = attempts + 1,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND state IN ('queued', 'running', 'remote')
+                  AND (lease_expires_at IS NULL OR lease_expires_at < ? OR lease_owner = ?)
+            ''', (owner, now + lease_seconds, job_id, now, owner))
+            conn.commit()
+            return cursor.rowcount == 1
+    
+    def renew_job_lease(self, job_id: int, owner: str, lease_seconds: float) -> bool:
+        """Продление аренды задачи её текущим владельцем"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE conversion_jobs
+                SET lease_expires_at = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND lease_owner = ? AND state IN ('running', 'remote')
+            ''', (time.time() + lease_seconds, job_id, owner))
+            conn.commit()
+            return cursor.rowcount == 1
+    
+    def set_job_remote(self, job_id: int, cc_job_id: str, strategy: str):
+        """Сохранение id задачи CloudConvert: файл загружен, конвертация идет удаленно"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE conversion_jobs
+                SET state = 'remote', cc_job_id = ?, strategy = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (cc_job_id, strategy, job_id))
+            conn.commit()
+    
+    def finish_job(self, job_id: int, state: str, error_message: str = None):
+        """Завершение задачи (done/failed/cancelled) с освобождением аренды"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE conversion_jobs
+                SET state = ?, error_message = ?, lease_owner = NULL, lease_expires_at = NULL,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (state, error_message, job_id))
+            conn.commit()
+    
+    def get_recoverable_jobs(self) -> List[Dict[str, Any]]:
+        """Незавершенные задачи без действующей аренды (после рестарта или падения воркера)"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT * FROM conversion_jobs
+                WHERE state IN ('queued', 'running', 'remote')
+                  AND (lease_expires_at IS NULL OR lease_expires_at < ?)
+                ORDER BY id
+            ''', (time.time(),))
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def save_delivered_file(self, source_hash: str, file_unique_id: Optional[str],
+                            xlsx_file_id: str, caption: str):
+        """Сохранение file_id отправленного XLSX для хеша исходного PDF"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT OR REPLACE INTO delivered_files (source_hash, file_unique_id, xlsx_file_id, caption)
+                VALUES (?, ?, ?, ?)
+            ''', (source_hash, file_unique_id, xlsx_file_id, caption))
+            conn.commit()
+    
+    def get_delivered_file(self, source_hash: str = None,
+                           file_unique_id: str = None) -> Optional[Dict[str, Any]]:
+        """Поиск ранее отправленного XLSX по хешу исходного PDF или по file_unique_id Telegram"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            if source_hash:
+                cursor.execute('''
+                    SELECT * FROM delivered_files WHERE source_hash = ?
+                ''', (source_hash,))
+            else:
+                cursor.execute('''
+                    SELECT * FROM delivered_files WHERE file_unique_id = ?
+                    ORDER BY created_at DESC LIMIT 1
+                ''', (file_unique_id,))
             
-            # Успешные операции
-            cursor.execute('SELECT COUNT(*) as success FROM operations_log WHERE status = "completed"')
-            successful_operations = cursor.fetchone()['success']
+            result = cursor.fetchone()
+            return dict(result) if result else None
+    
+    def remove_delivered_file(self, source_hash: str):
+        """Удаление записи с недействительным file_id"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                DELETE FROM delivered_files WHERE source_hash = ?
+            ''', (source_hash,))
+            conn.commit()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Получение статистики"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
             
-            # Операции с ошибками
-            cursor.execute('SELECT COUNT(*) as errors FROM operations_log WHERE status = "error"')
-            error_operations = cursor.fetchone()['errors']
+            # Счетчики поддерживаются триггерами - без сканирования журнала
+            cursor.execute('''
+                SELECT name, value FROM stats_counters
+                WHERE name IN ('operations', 'status:completed', 'status:error', 'users')
+            ''')
+            counters = {row['name']: row['value'] for row in cursor.fetchall()}
             
-            # Уникальные пользователи
-            cursor.execute('SELECT COUNT(DISTINCT user_id) as users FROM operations_log')
-            unique_users = cursor.fetchone()['users']
+            total_operations = counters.get('operations', 0)
+            successful_operations = counters.get('status:completed', 0)
+            error_operations = counters.get('status:error', 0)
+            unique_users = counters.get('users', 0)
             
             return {
                 'total_operations': total_operations,
@@ -173,4 +700,48 @@ class Database:
                 'error_operations': error_operations,
                 'unique_users': unique_users,
                 'success_rate': (successful_operations / total_operations * 100) if total_operations > 0 else 0
-            } 
\ No newline at end of file
+            } 
+
+
+class AsyncDatabase:
+    """Неблокирующий доступ к Database из event loop.
+    
+    Все запросы выполняются по очереди в одном выделенном потоке на одном соединении,
+    методы Database доступны как awaitable: await db.log_operation(...)
+    """
+    
+    def __init__(self, db: Database):
+        self.db = db
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+        self.pending = 0
+    
+    def __getattr__(self, name: str):
+        method = getattr(self.db, name)
+        if not callable(method):
+            return method
+        
+        async def call(*args, **kwargs):
+            return await self.run(method, *args, **kwargs)
+        
+        call.__name__ = name
+        return call
+    
+    async def run(self, func: Callable, *args, **kwargs):
+        """Выполнение функции в потоке базы данных"""
+        loop = asyncio.get_running_loop()
+        self.pending += 1
+        started = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+        finally:
+            self.pending -= 1
+            DB_CALL_DURATION.observe(time.perf_counter() - started, method=getattr(func, '__name__', 'call'))
+    
+    async def close(self):
+        """Завершение оставшихся запросов и закрытие соединения"""
+        await self.run(self.db.close)
+        self._executor.shutdown(wait=True)
+    
+    def get_writer_stats(self) -> Dict[str, Any]:
+        """Число запросов, ожидающих выполнения в потоке базы данных"""
+        return {'pending': self.pending}
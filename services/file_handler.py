@@ -1,12 +1,26 @@
 import os
+import uuid
+import hashlib
 import tempfile
 import logging
+import aiohttp
+import aiofiles
 from typing import Optional, Tuple
 from pathlib import Path
-from config.settings import MAX_FILE_SIZE
+from config.settings import MAX_FILE_SIZE, API_TIMEOUT
+from services.pdf_inspector import inspect_pdf
 
 logger = logging.getLogger(__name__)
 
+# Размер блока при потоковом скачивании и хешировании
+CHUNK_SIZE = 64 * 1024
+
+class FileTooLargeError(Exception):
+    """Файл превысил допустимый размер во время скачивания"""
+
+class LocalFileUnavailableError(Exception):
+    """Local режим Bot API: путь к файлу на диске сервера не виден с этого хоста"""
+
 class FileHandler:
     def __init__(self):
         self.temp_dir = tempfile.gettempdir()
@@ -34,14 +48,18 @@ class FileHandler:
         
         return True, "OK"
     
-    def get_temp_file_path(self, filename: str, suffix: str = "") -> str:
-        """Получение пути для временного файла"""
+    def get_temp_file_path(self, filename: str, suffix: str = "", directory: Optional[str] = None) -> str:
+        """Получение уникального пути для временного файла (в directory, если задана)"""
         safe_filename = self.sanitize_filename(filename)
+        name, ext = os.path.splitext(safe_filename)
+        # Уникальный префикс: одинаковые имена файлов от разных пользователей не пересекаются
+        unique = uuid.uuid4().hex[:12]
         if suffix:
-            name, ext = os.path.splitext(safe_filename)
-            safe_filename = f"{name}_{suffix}{ext}"
+            safe_filename = f"{unique}_{name}_{suffix}{ext}"
+        else:
+            safe_filename = f"{unique}_{name}{ext}"
         
-        return os.path.join(self.temp_dir, safe_filename)
+        return os.path.join(directory or self.temp_dir, safe_filename)
     
     def sanitize_filename(self, filename: str) -> str:
         """Очистка имени файла от недопустимых символов"""
@@ -72,6 +90,60 @@ class FileHandler:
             logger.error(f"Error saving file {filename}: {e}")
             raise
     
+    def get_local_file_path(self, file) -> Optional[str]:
+        """Путь к файлу на диске локального сервера Bot API (local режим), иначе None"""
+        file_path = file.file_path
+        if file_path and os.path.isabs(file_path) and os.path.isfile(file_path):
+            return file_path
+        return None
+    
+    async def download_telegram_file(self, file, filename: str, max_size: int = MAX_FILE_SIZE,
+                                     directory: Optional[str] = None) -> str:
+        """Потоковое скачивание файла Telegram во временный файл с ограничением размера"""
+        if file.file_size and file.file_size > max_size:
+            raise FileTooLargeError(f"File {filename} is {file.file_size} bytes, limit is {max_size}")
+        
+        # В local режиме file_path - путь на диске сервера Bot API, а не URL: скачать его по HTTP нельзя
+        if not file.file_path.startswith(('http://', 'https://')):
+            raise LocalFileUnavailableError(
+                f"File {file.file_path} of the local Bot API server is not accessible on this host: "
+                f"mount the server's working directory at the same path or disable TELEGRAM_LOCAL_MODE"
+            )
+        
+        temp_path = self.get_temp_file_path(filename, "input", directory)
+        downloaded = 0
+        
+        try:
+            # Файл пишется блоками - память не зависит от размера файла,
+            # запись на диск выполняется вне event loop
+            timeout = aiohttp.ClientTimeout(total=None, sock_read=API_TIMEOUT)
+            async with aiohttp.ClientSession(timeout=timeout) as session:
+                async with session.get(file.file_path) as response:
+                    response.raise_for_status()
+                    async with aiofiles.open(temp_path, 'wb') as f:
+                        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                            downloaded += len(chunk)
+                            if downloaded > max_size:
+                                raise FileTooLargeError(
+                                    f"File {filename} exceeded {max_size} bytes while downloading"
+                                )
+                            await f.write(chunk)
+            
+            logger.info(f"File {filename} downloaded to {temp_path} ({downloaded} bytes)")
+            return temp_path
+        
+        except Exception:
+            self.cleanup_file(temp_path)
+            raise
+    
+    def compute_file_hash(self, file_path: str) -> str:
+        """SHA-256 содержимого файла (чтение блоками)"""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+    
     def save_converted_file(self, file_content: bytes, original_filename: str) -> str:
         """Сохранение конвертированного файла"""
         # Меняем расширение на .xlsx
@@ -121,22 +193,10 @@ class FileHandler:
             }
     
     def is_pdf_valid(self, file_path: str) -> Tuple[bool, Optional[str]]:
-        """Более детальная проверка PDF файла"""
-        try:
-            with open(file_path, 'rb') as f:
-                # Проверяем заголовок PDF
-                header = f.read(8)
-                if not header.startswith(b'%PDF'):
-                    return False, "Файл не является PDF документом"
-                
-                # Проверяем, что файл не поврежден (упрощенная проверка)
-                f.seek(-1024, 2)  # Переходим к концу файла
-                end_content = f.read()
-                if b'%%EOF' not in end_content and b'startxref' not in end_content:
-                    return False, "PDF файл может быть поврежден"
-                
-                return True, None
-        
-        except Exception as e:
-            logger.error(f"Error validating PDF {file_path}: {e}")
-            return False, f"Ошибка при проверке файла: {str(e)}" 
\ No newline at end of file
+        """Более детальная проверка PDF файла (структура и наличие страниц, см. pdf_inspector)"""
+        info = inspect_pdf(file_path)
+        if info is None:
+            return False, "Ошибка при проверке файла"
+        if not info.valid:
+            return False, f"PDF файл поврежден: {info.error}"
+        return True, None 
\ No newline at end of file
@@ -0,0 +1,265 @@
+import asyncio
+import itertools
+import logging
+import math
+import time
+from collections import deque, OrderedDict
+from typing import Optional, Dict, Any, List, Callable, Awaitable, Deque, Set
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Очередь переполнена (общий лимит или лимит пользователя)"""
+
+
+class ConversionJob:
+    """Задача конвертации в очереди"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, user_id: int, payload: Dict[str, Any]):
+        self.job_id = next(self._ids)
+        self.user_id = user_id
+        self.payload = payload
+        self.enqueued_at = time.monotonic()
+        self.started_at: Optional[float] = None
+
+
+class FairJobQueue:
+    """Очередь задач с циклическим (round-robin) обслуживанием пользователей"""
+
+    def __init__(self, max_size: int = 0, max_per_user: int = 0):
+        self.max_size = max_size
+        self.max_per_user = max_per_user
+        self._queues: "OrderedDict[int, Deque[ConversionJob]]" = OrderedDict()
+        self._size = 0
+        # Создается при первом использовании, чтобы привязаться к работающему event loop
+        self._not_empty: Optional[asyncio.Condition] = None
+
+    def _condition(self) -> asyncio.Condition:
+        if self._not_empty is None:
+            self._not_empty = asyncio.Condition()
+        return self._not_empty
+
+    def qsize(self) -> int:
+        return self._size
+
+    def user_pending(self, user_id: int) -> int:
+        return len(self._queues.get(user_id, ()))
+
+    async def put(self, job: ConversionJob, enforce_limits: bool = True) -> int:
+        """Постановка задачи, возвращает число задач впереди неё"""
+        if enforce_limits:
+            self.ensure_capacity(job.user_id)
+
+        self._queues.setdefault(job.user_id, deque()).append(job)
+        self._size += 1
+
+        condition = self._condition()
+        async with condition:
+            condition.notify()
+
+        return self.position(job)
+
+    async def get(self) -> ConversionJob:
+        """Следующая задача: по одной от каждого пользователя по кругу"""
+        condition = self._condition()
+        async with condition:
+            while not self._size:
+                await condition.wait()
+
+            # Берем пользователя из головы ротации и переносим его в конец
+            user_id, user_queue = next(iter(self._queues.items()))
+            job = user_queue.popleft()
+            self._size -= 1
+
+            if user_queue:
+                self._queues.move_to_end(user_id)
+            else:
+                del self._queues[user_id]
+
+            return job
+
+    async def wake_all(self):
+        """Пробуждение всех ожидающих get() (например, после отмены одного из них)"""
+        condition = self._condition()
+        async with condition:
+            condition.notify_all()
+
+    def ensure_capacity(self, user_id: int):
+        """Проверка лимитов очереди для новой задачи пользователя"""
+        if self.max_size and self._size >= self.max_size:
+            raise QueueFullError("Job queue is full")
+        if self.max_per_user and self.user_pending(user_id) >= self.max_per_user:
+            raise QueueFullError(f"User {user_id} already has {self.max_per_user} queued jobs")
+
+    def position(self, job: ConversionJob) -> int:
+        """Количество задач, которые будут взяты в работу раньше указанной"""
+        user_queue = self._queues.get(job.user_id)
+        if not user_queue or job not in user_queue:
+            return 0
+
+        return self._ahead(job.user_id, user_queue.index(job))
+
+    def next_position(self, user_id: int) -> int:
+        """Количество задач впереди новой задачи пользователя, если поставить её сейчас"""
+        return self._ahead(user_id, self.user_pending(user_id))
+
+    def _ahead(self, job_user_id: int, job_round: int) -> int:
+        """Подсчет задач впереди задачи пользователя, стоящей job_round-й в его очереди"""
+        # Собственные более ранние задачи пользователя
+        ahead = job_round
+        before_in_rotation = True
+        for user_id, queue in self._queues.items():
+            if user_id == job_user_id:
+                before_in_rotation = False
+                continue
+
+            # В предыдущих кругах каждый пользователь отдает по одной задаче
+            ahead += min(len(queue), job_round)
+
+            # В круге job_round раньше обслуживаются пользователи, стоящие раньше в ротации
+            # (новый пользователь встает в конец ротации)
+            if before_in_rotation and len(queue) > job_round:
+                ahead += 1
+
+        return ahead
+
+    def first_position(self, user_id: int) -> Optional[int]:
+        """Позиция ближайшей задачи пользователя (None, если задач в очереди нет)"""
+        user_queue = self._queues.get(user_id)
+        if not user_queue:
+            return None
+        return self.position(user_queue[0])
+
+    def remove_user_jobs(self, user_id: int) -> List[ConversionJob]:
+        """Удаление всех ожидающих задач пользователя"""
+        user_queue = self._queues.pop(user_id, None)
+        if not user_queue:
+            return []
+
+        self._size -= len(user_queue)
+        return list(user_queue)
+
+
+class WorkerPool:
+    """Пул фоновых воркеров, обрабатывающих задачи из FairJobQueue"""
+
+    def __init__(self, handler: Callable[[ConversionJob], Awaitable[None]], workers: int = 2,
+                 max_size: int = 0, max_per_user: int = 0, initial_job_duration: float = 60.0):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.queue = FairJobQueue(max_size, max_per_user)
+        self.in_flight: Dict[int, ConversionJob] = {}
+        self.average_job_duration = initial_job_duration
+        self._tasks: List[asyncio.Task] = []
+        # Воркеры, занятые задачей, и лишние после уменьшения пула (завершатся после задачи)
+        self._busy: Set[asyncio.Task] = set()
+        self._retiring: Set[asyncio.Task] = set()
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self):
+        """Запуск воркеров в текущем event loop"""
+        if self._tasks:
+            return
+
+        self._start_workers()
+        logger.info(f"Started {self.workers} conversion workers")
+
+    def _start_workers(self):
+        for index in range(len(self._tasks), self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(index), name=f"conversion-worker-{index}"))
+
+    async def resize(self, workers: int):
+        """Изменение числа воркеров без перезапуска.
+
+        Новые воркеры запускаются сразу; лишние свободные останавливаются,
+        занятые - после завершения текущей задачи.
+        """
+        workers = max(1, workers)
+        if workers == self.workers:
+            return
+        logger.info(f"Resizing conversion workers: {self.workers} -> {workers}")
+        self.workers = workers
+        if not self._tasks:
+            return
+
+        self._start_workers()
+        surplus = self._tasks[workers:]
+        del self._tasks[workers:]
+
+        idle = []
+        for task in surplus:
+            if task in self._busy:
+                self._retiring.add(task)
+            else:
+                task.cancel()
+                idle.append(task)
+        if idle:
+            await asyncio.gather(*idle, return_exceptions=True)
+            # Отмененный воркер мог успеть получить уведомление о новой задаче
+            await self.queue.wake_all()
+
+    async def stop(self):
+        """Остановка воркеров (задачи в работе отменяются)"""
+        tasks = self._tasks + list(self._retiring)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        self._retiring.clear()
+        logger.info("Conversion workers stopped")
+
+    async def submit(self, job: ConversionJob, enforce_limits: bool = True) -> int:
+        """Постановка задачи в очередь, возвращает число задач впереди"""
+        position = await self.queue.put(job, enforce_limits)
+        logger.info(f"Job {job.job_id} of user {job.user_id} queued, {position} ahead, "
+                    f"queue size {self.queue.qsize()}")
+        return position
+
+    def estimate_wait(self, position: int) -> float:
+        """Оценка времени до готовности задачи (секунды)"""
+        rounds = math.ceil((position + len(self.in_flight) + 1) / self.workers)
+        return rounds * self.average_job_duration
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Состояние очереди и воркеров"""
+        return {
+            'queue_depth': self.queue.qsize(),
+            'in_flight': len(self.in_flight),
+            'workers': self.workers,
+            'average_job_duration': round(self.average_job_duration, 1),
+        }
+
+    def cancel_user_jobs(self, user_id: int) -> List[ConversionJob]:
+        """Отмена ожидающих задач пользователя, возвращает снятые с очереди задачи"""
+        return self.queue.remove_user_jobs(user_id)
+
+    async def _worker(self, index: int):
+        task = asyncio.current_task()
+        # Воркер, убранный из пула при уменьшении, выходит после текущей задачи
+        while task in self._tasks:
+            job = await self.queue.get()
+            self._busy.add(task)
+            job.started_at = time.monotonic()
+            self.in_flight[job.job_id] = job
+
+            try:
+                await self.handler(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Worker {index}: job {job.job_id} failed: {e}")
+            finally:
+                self._busy.discard(task)
+                self.in_flight.pop(job.job_id, None)
+                duration = time.monotonic() - job.started_at
+                # Скользящее среднее длительности для оценки ETA
+                self.average_job_duration = 0.8 * self.average_job_duration + 0.2 * duration
+
+        self._retiring.discard(task)
+        logger.info(f"Worker {index} stopped after pool resize")
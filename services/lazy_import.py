@@ -0,0 +1,51 @@
+import importlib
+import logging
+import time
+from types import ModuleType
+from typing import Optional, Dict
+
+logger = logging.getLogger(__name__)
+
+
+class LazyModule:
+    """Модуль, который импортируется при первом обращении к его атрибуту.
+
+    Тяжелые необязательные зависимости (anthropic, openpyxl) не замедляют запуск бота:
+    импорт происходит при первой конвертации или заранее в фоне через preload().
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module: Optional[ModuleType] = None
+
+    def load(self) -> ModuleType:
+        if self._module is None:
+            # import_module потокобезопасен: параллельный вызов дождется первого импорта
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+    def __getattr__(self, attr: str):
+        return getattr(self.load(), attr)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name} ({state})>"
+
+
+def preload(*names: str) -> Dict[str, float]:
+    """Импорт модулей заранее (вызывается в отдельном потоке), возвращает время импорта каждого"""
+    timings = {}
+    for name in names:
+        started = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            logger.error(f"Error preloading {name}: {e}")
+            continue
+        timings[name] = time.perf_counter() - started
+    logger.info("Preloaded " + ", ".join(f"{name} in {duration:.2f}s" for name, duration in timings.items()))
+    return timings
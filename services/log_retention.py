@@ -0,0 +1,79 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any
+
+from services.database import AsyncDatabase
+
+logger = logging.getLogger(__name__)
+
+
+class LogRetention:
+    """Фоновое обслуживание журнала операций.
+
+    Периодически сворачивает завершенные дни в дневные агрегаты и удаляет сырые строки
+    старше retention_days пачками по batch_size, каждая в своей короткой транзакции,
+    чтобы не задерживать запись журнала работающим ботом.
+    """
+
+    def __init__(self, db: AsyncDatabase, retention_days: int = 30, interval: float = 3600.0,
+                 batch_size: int = 500, batch_pause: float = 0.05):
+        self.db = db
+        self.retention_days = retention_days
+        self.interval = interval
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self._task: Optional[asyncio.Task] = None
+
+        self.days_rolled = 0
+        self.rows_pruned = 0
+        self.last_run: Optional[str] = None
+
+    async def run_once(self) -> int:
+        """Один проход: свертка и удаление старых строк, возвращает число удаленных строк"""
+        self.days_rolled += await self.db.rollup_daily_stats()
+
+        cutoff_day = (datetime.utcnow().date() - timedelta(days=self.retention_days)).isoformat()
+        pruned = 0
+        while True:
+            deleted = await self.db.prune_operations_log(cutoff_day, self.batch_size)
+            pruned += deleted
+            if deleted < self.batch_size:
+                break
+            # Пауза между пачками пропускает запись журнала и другие запросы
+            await asyncio.sleep(self.batch_pause)
+
+        self.rows_pruned += pruned
+        self.last_run = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        if pruned:
+            logger.info(f"Pruned {pruned} operation log rows older than {cutoff_day}")
+        return pruned
+
+    async def start(self):
+        """Запуск периодического обслуживания"""
+        if self._task or self.retention_days <= 0:
+            return
+        self._task = asyncio.create_task(self._loop(), name="log-retention")
+
+    async def stop(self):
+        """Остановка обслуживания"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Error in operation log retention: {e}")
+            await asyncio.sleep(self.interval)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Счетчики обслуживания журнала"""
+        return {
+            'days_rolled': self.days_rolled,
+            'rows_pruned': self.rows_pruned,
+            'last_run': self.last_run,
+        }
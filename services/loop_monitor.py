@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import math
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Optional, Dict, Any
+
+from services.metrics import EVENT_LOOP_LAG
+
+logger = logging.getLogger(__name__)
+
+
+class LoopMonitor:
+    """Монитор задержки event loop и детектор блокирующих вызовов.
+
+    Корутина-сэмплер каждые interval секунд измеряет, насколько позже срока она проснулась.
+    Сторожевой поток следит за отметками сэмплера: если loop не отвечает дольше threshold,
+    в лог пишется текущая задача, её корутина и стек основного потока - место блокировки.
+    """
+
+    def __init__(self, interval: float = 0.1, threshold: float = 0.5, window: int = 3000):
+        self.interval = interval
+        self.threshold = threshold
+        self._samples = deque(maxlen=window)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._heartbeat = time.monotonic()
+        self._stall_reported = False
+
+        self.stalls = 0
+        self.max_lag = 0.0
+
+    async def start(self):
+        """Запуск в текущем event loop"""
+        if self._task:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._sample_loop(), name="loop-monitor")
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        """Остановка сэмплера и сторожевого потока"""
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._watchdog:
+            self._watchdog.join(timeout=1)
+            self._watchdog = None
+
+    async def _sample_loop(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self._heartbeat = now
+
+            self._samples.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+            EVENT_LOOP_LAG.observe(lag)
+
+            if self._stall_reported:
+                self._stall_reported = False
+                logger.warning(f"Event loop resumed after {lag + self.interval:.2f}s stall")
+
+    def _watch(self):
+        """Сторожевой поток: снимок стека основного потока во время блокировки"""
+        while not self._stop.wait(self.threshold / 2):
+            blocked = time.monotonic() - self._heartbeat - self.interval
+            if blocked < self.threshold or self._stall_reported:
+                continue
+
+            self._stall_reported = True
+            self.stalls += 1
+
+            frame = sys._current_frames().get(self._thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "<no frame>"
+            logger.warning(
+                f"Event loop blocked for {blocked:.2f}s in {self._describe_current_task()}\n{stack}"
+            )
+
+    def _describe_current_task(self) -> str:
+        try:
+            task = asyncio.current_task(self._loop)
+        except Exception:
+            task = None
+        if task is None:
+            return "callback outside of a task"
+        coro = task.get_coro()
+        name = getattr(coro, '__qualname__', repr(coro))
+        return f"task {task.get_name()} ({name})"
+
+    @staticmethod
+    def _percentile(values, p: float) -> float:
+        index = max(0, min(len(values) - 1, math.ceil(p / 100 * len(values)) - 1))
+        return values[index]
+
+    def recent_lag(self, window: float) -> Optional[float]:
+        """p99 задержки event loop (сек) за последние window секунд; None - замеров еще нет"""
+        count = max(1, math.ceil(window / self.interval))
+        samples = sorted(list(self._samples)[-count:])
+        if not samples:
+            return None
+        return self._percentile(samples, 99)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Перцентили задержки event loop (мс) по последним замерам"""
+        samples = sorted(list(self._samples))
+        if not samples:
+            return {'samples': 0, 'stalls': self.stalls}
+        return {
+            'samples': len(samples),
+            'p50_ms': round(self._percentile(samples, 50) * 1000, 1),
+            'p90_ms': round(self._percentile(samples, 90) * 1000, 1),
+            'p99_ms': round(self._percentile(samples, 99) * 1000, 1),
+            'max_ms': round(self.max_lag * 1000, 1),
+            'stalls': self.stalls,
+        }
@@ -0,0 +1,225 @@
+import bisect
+import logging
+import threading
+from typing import Optional, Dict, Any, List, Tuple, Callable, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Границы гистограмм длительности по умолчанию (секунды)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[Any], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """Базовая метрика: имя, описание, тип и имена меток"""
+
+    type = "untyped"
+
+    def __init__(self, name: str, description: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple:
+        return tuple(labels[name] for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """Монотонный счетчик"""
+
+    type = "counter"
+
+    def __init__(self, name: str, description: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, description, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        # list() копирует словарь под GIL: счетчики Claude увеличиваются из потоков улучшения текста,
+        # пока /metrics читается в event loop
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in list(self._values.items())]
+
+
+class Gauge(Metric):
+    """Текущее значение; может вычисляться функцией в момент чтения"""
+
+    type = "gauge"
+
+    def __init__(self, name: str, description: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, description, labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float]):
+        """Значение без меток, вычисляемое при каждом чтении"""
+        self._function = function
+
+    def _samples(self) -> List[str]:
+        if self._function is not None:
+            try:
+                return [f"{self.name} {_format_value(self._function())}"]
+            except Exception as e:
+                logger.error(f"Gauge {self.name} function failed: {e}")
+                return []
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in list(self._values.items())]
+
+
+class Histogram(Metric):
+    """Гистограмма с фиксированными границами корзин"""
+
+    type = "histogram"
+
+    def __init__(self, name: str, description: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, description, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # метки -> [счетчики корзин (последняя - +Inf), сумма, количество]
+        self._values: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in list(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), list(counts)):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Реестр метрик процесса и вывод в текстовом формате Prometheus"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: Metric) -> Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, description: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, description, labelnames))
+
+    def gauge(self, name: str, description: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, description, labelnames))
+
+    def histogram(self, name: str, description: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, description, labelnames, buckets))
+
+    def render(self) -> str:
+        """Все метрики в формате text exposition 0.0.4"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# Метрики бота. Обновление - несколько операций со словарем, без блокировок
+CONVERSIONS = REGISTRY.counter(
+    'bot_conversions_total', 'Завершенные конвертации по результату', ['outcome'])
+STAGE_DURATION = REGISTRY.histogram(
+    'bot_stage_duration_seconds', 'Длительность стадий конвейера', ['stage'])
+JOB_QUEUE_DEPTH = REGISTRY.gauge(
+    'bot_job_queue_depth', 'Задачи, ожидающие в очереди')
+JOBS_IN_FLIGHT = REGISTRY.gauge(
+    'bot_jobs_in_flight', 'Задачи, обрабатываемые воркерами')
+CACHE_REQUESTS = REGISTRY.counter(
+    'bot_cache_requests_total', 'Обращения к кешам результатов', ['cache', 'result'])
+CLOUDCONVERT_POLLS = REGISTRY.counter(
+    'cloudconvert_job_polls_total', 'Запросы статуса задач CloudConvert')
+CLAUDE_TOKENS = REGISTRY.counter(
+    'claude_tokens_total', 'Токены Claude', ['direction'])
+CLAUDE_LATENCY = REGISTRY.histogram(
+    'claude_request_duration_seconds', 'Длительность запросов к Claude', ['outcome'])
+DB_CALL_DURATION = REGISTRY.histogram(
+    'db_call_duration_seconds', 'Длительность запросов к базе с учетом ожидания потока базы', ['method'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5))
+PDF_COMPRESSIONS = REGISTRY.counter(
+    'pdf_compressions_total', 'Попытки сжатия PDF перед загрузкой по результату', ['result'])
+PDF_COMPRESSION_SAVED_BYTES = REGISTRY.counter(
+    'pdf_compression_saved_bytes_total', 'Байты, не загруженные в CloudConvert благодаря сжатию')
+TEMP_STORAGE_BYTES = REGISTRY.gauge(
+    'temp_storage_reserved_bytes', 'Объем, зарезервированный задачами во временном хранилище')
+TEMP_STORAGE_QUOTA = REGISTRY.gauge(
+    'temp_storage_quota_bytes', 'Квота временного хранилища (0 - без ограничения)')
+TEMP_STORAGE_JOBS = REGISTRY.gauge(
+    'temp_storage_jobs', 'Задачи с директорией во временном хранилище')
+TEMP_STORAGE_WAITS = REGISTRY.counter(
+    'temp_storage_waits_total', 'Ожидания места во временном хранилище')
+TEMP_STORAGE_SWEPT = REGISTRY.counter(
+    'temp_storage_swept_total', 'Брошенные файлы и директории, удаленные уборкой')
+
+EVENT_LOOP_LAG = REGISTRY.histogram(
+    'event_loop_lag_seconds', 'Задержка event loop по замерам монитора',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+
+
+def record_claude_response(response, duration: float):
+    """Учет длительности и токенов успешного ответа Claude"""
+    CLAUDE_LATENCY.observe(duration, outcome='success')
+    usage = getattr(response, 'usage', None)
+    if usage is not None:
+        CLAUDE_TOKENS.inc(getattr(usage, 'input_tokens', 0) or 0, direction='input')
+        CLAUDE_TOKENS.inc(getattr(usage, 'output_tokens', 0) or 0, direction='output')
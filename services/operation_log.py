@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import sqlite3
+from datetime import datetime
+from typing import Optional, Dict, Any, List
+
+from services.database import AsyncDatabase
+
+logger = logging.getLogger(__name__)
+
+
+class OperationLogger:
+    """Write-behind журнал операций.
+
+    События копятся в памяти и записываются одной транзакцией каждые flush_interval секунд
+    или по набору batch_size событий. id операции выдается сразу из диапазона, заранее
+    зарезервированного в базе (allocate_operation_ids), поэтому запись в журнал не входит
+    во время обработки апдейта, а одновременно работающие процессы не выдают одинаковых id.
+    В режиме sync события записываются немедленно (для тестов и отладки).
+    """
+
+    def __init__(self, db: AsyncDatabase, flush_interval: float = 0.5, batch_size: int = 100,
+                 max_queue: int = 10000, sync: bool = False, id_block_size: int = 1000):
+        self.db = db
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_queue = max_queue
+        self.sync = sync
+
+        self._events: List[Dict[str, Any]] = []
+        self.id_block_size = id_block_size
+        # Текущий диапазон id [_next_id, _block_end) и следующий, запрошенный заранее
+        self._next_id = 0
+        self._block_end = 0
+        self._next_block: Optional[int] = None
+        self._block_task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        self.flushed = 0
+        self.dropped = 0
+
+    async def log_operation(self, user_id: int, username: str, operation: str, status: str,
+                            file_name: str = None, file_size: int = None, error_message: str = None) -> int:
+        """Логирование операции, возвращает её id (ожидание возможно только при исчерпании диапазона)"""
+        operation_id = await self._allocate_id()
+        self._add({
+            'type': 'insert',
+            'id': operation_id,
+            'user_id': user_id,
+            'username': username,
+            'operation': operation,
+            'status': status,
+            'file_name': file_name,
+            'file_size': file_size,
+            'error_message': error_message,
+            'timestamp': self._timestamp(),
+        })
+        return operation_id
+
+    def update_operation_status(self, operation_id: int, status: str, error_message: str = None):
+        """Обновление статуса операции"""
+        self._add({
+            'type': 'update',
+            'id': operation_id,
+            'status': status,
+            'error_message': error_message,
+            'timestamp': self._timestamp(),
+        })
+
+    def log_stage_timings(self, operation_id: int, stages: List[tuple], file_size: int = None):
+        """Длительности стадий операции: список (стадия, секунды, стратегия)"""
+        if not stages:
+            return
+        self._add({
+            'type': 'timings',
+            'id': operation_id,
+            'stages': stages,
+            'file_size': file_size,
+            'timestamp': self._timestamp(),
+        })
+    
+    async def _allocate_id(self) -> int:
+        if self.sync:
+            # Режим sync пишет в базу напрямую - так же резервируется и диапазон
+            if self._next_id >= self._block_end:
+                self._next_id = self.db.db.allocate_operation_ids(self.id_block_size)
+                self._block_end = self._next_id + self.id_block_size
+        while self._next_id >= self._block_end:
+            if self._next_block is not None:
+                start, self._next_block = self._next_block, None
+                self._next_id, self._block_end = start, start + self.id_block_size
+                break
+            # Первый диапазон не зарезервирован в start() или следующий еще не готов -
+            # ждем резервирования в потоке базы, не блокируя event loop
+            if self._block_task is None:
+                self._block_task = asyncio.create_task(self._reserve_block())
+            # shield: отмена одного вызова не должна отменять резервирование для остальных
+            if not await asyncio.shield(self._block_task):
+                raise RuntimeError("Operation ids could not be reserved")
+
+        operation_id = self._next_id
+        self._next_id += 1
+        # Следующий диапазон резервируется в потоке базы, пока текущий не закончился
+        if (not self.sync and self._block_end - self._next_id < self.id_block_size // 2
+                and self._next_block is None and self._block_task is None):
+            self._block_task = asyncio.create_task(self._reserve_block())
+        return operation_id
+
+    async def _reserve_block(self) -> bool:
+        try:
+            self._next_block = await self.db.allocate_operation_ids(self.id_block_size)
+            return True
+        except Exception as e:
+            logger.error(f"Error reserving operation ids: {e}")
+            return False
+        finally:
+            self._block_task = None
+
+    @staticmethod
+    def _timestamp() -> str:
+        # Формат CURRENT_TIMESTAMP SQLite: время события, а не время записи пачки
+        return datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+
+    def _add(self, event: Dict[str, Any]):
+        if self.sync:
+            self.db.db.write_operation_events([event])
+            self.flushed += 1
+            return
+
+        if len(self._events) >= self.max_queue:
+            # База не успевает: ограничиваем память, теряя новые события
+            self.dropped += 1
+            logger.error(f"Operation log queue is full ({self.max_queue}), event dropped")
+            return
+
+        self._events.append(event)
+        if len(self._events) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    async def start(self):
+        """Запуск периодической записи в текущем event loop"""
+        if self.sync or self._task:
+            return
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        # Первый диапазон id резервируется заранее, чтобы первая операция не ждала базу
+        await self._reserve_block()
+        self._task = asyncio.create_task(self._flush_loop(), name="operation-log-flush")
+
+    async def stop(self):
+        """Остановка с записью всех накопленных событий"""
+        if self._task:
+            # Цикл не отменяется, а завершается после текущей записи: отмена посреди flush()
+            # теряла бы пачку, уже взятую из очереди
+            self._stopping = True
+            self._wakeup.set()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._block_task:
+            self._block_task.cancel()
+            await asyncio.gather(self._block_task, return_exceptions=True)
+        await self.flush()
+
+    async def flush(self) -> int:
+        """Запись накопленных событий одной транзакцией, возвращает их число"""
+        if not self._events:
+            return 0
+
+        batch, self._events = self._events, []
+        try:
+            await self.db.run(self.db.db.write_operation_events, batch)
+        except sqlite3.IntegrityError as e:
+            # Повтор пачки не поможет: события записываются по одному, отбрасываются только отклоненные
+            logger.error(f"Operation log batch of {len(batch)} events rejected, writing one by one: {e}")
+            return await self._write_each(batch)
+        except Exception as e:
+            logger.error(f"Error writing operation log batch of {len(batch)} events: {e}")
+            # Возвращаем события в начало очереди для следующей попытки
+            self._events = batch + self._events
+            return 0
+
+        self.flushed += len(batch)
+        return len(batch)
+
+    async def _write_each(self, batch: List[Dict[str, Any]]) -> int:
+        written = 0
+        for event in batch:
+            try:
+                await self.db.run(self.db.db.write_operation_events, [event])
+                written += 1
+            except Exception as e:
+                self.dropped += 1
+                logger.error(f"Operation log event {event['type']} for operation {event['id']} dropped: {e}")
+        self.flushed += written
+        return written
+
+    async def _flush_loop(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Состояние очереди журнала"""
+        return {
+            'queued': len(self._events),
+            'flushed': self.flushed,
+            'dropped': self.dropped,
+        }
@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import os
+import shutil
+import time
+from typing import Optional, Dict, Any, List
+
+logger = logging.getLogger(__name__)
+
+TOOL_GHOSTSCRIPT = "ghostscript"
+TOOL_QPDF = "qpdf"
+
+
+class CompressionResult:
+    """Результат сжатия одного файла"""
+
+    def __init__(self, tool: str, original_size: int, compressed_size: int, duration: float,
+                 path: Optional[str]):
+        self.tool = tool
+        self.original_size = original_size
+        self.compressed_size = compressed_size
+        self.duration = duration
+        # None - сжатие не дало выигрыша, используется исходный файл
+        self.path = path
+
+    @property
+    def saved_bytes(self) -> int:
+        return self.original_size - self.compressed_size if self.path else 0
+
+    @property
+    def ratio(self) -> float:
+        """Доля сэкономленного объема"""
+        return self.saved_bytes / self.original_size if self.original_size else 0.0
+
+    def upload_time_saved(self, bytes_per_second: float) -> float:
+        """Выигрыш по времени при заданной скорости загрузки с учетом времени сжатия (может быть < 0)"""
+        if bytes_per_second <= 0:
+            return -self.duration
+        return self.saved_bytes / bytes_per_second - self.duration
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'tool': self.tool,
+            'original_size': self.original_size,
+            'compressed_size': self.compressed_size,
+            'saved_bytes': self.saved_bytes,
+            'duration': round(self.duration, 2),
+            'used': self.path is not None,
+        }
+
+
+class PdfCompressor:
+    """Локальное сжатие PDF перед загрузкой в CloudConvert внешней утилитой.
+
+    Ghostscript уменьшает разрешение изображений страниц до dpi, нужного OCR, переписывает
+    файл без неиспользуемых объектов и линеаризует его. Если доступен только qpdf,
+    выполняются удаление неиспользуемых объектов, сжатие потоков и линеаризация.
+    Без утилит сжатие недоступно и файлы загружаются как есть.
+    """
+
+    def __init__(self, tool: str = "auto", dpi: int = 300, min_saving: float = 0.1,
+                 timeout: float = 120.0):
+        self.dpi = dpi
+        self.min_saving = min_saving
+        self.timeout = timeout
+        self.tool, self.executable = self._detect_tool(tool)
+
+    @staticmethod
+    def _detect_tool(tool: str):
+        candidates = {
+            TOOL_GHOSTSCRIPT: ("gs", "gswin64c"),
+            TOOL_QPDF: ("qpdf",),
+        }
+        names = [tool] if tool in candidates else [TOOL_GHOSTSCRIPT, TOOL_QPDF]
+        for name in names:
+            for executable in candidates[name]:
+                path = shutil.which(executable)
+                if path:
+                    return name, path
+        return None, None
+
+    @property
+    def available(self) -> bool:
+        return self.tool is not None
+
+    def _command(self, source: str, target: str) -> List[str]:
+        if self.tool == TOOL_QPDF:
+            return [
+                self.executable, "--linearize", "--object-streams=generate",
+                "--compress-streams=y", "--recompress-flate", source, target,
+            ]
+
+        # Изображения с разрешением выше dpi * 1.5 пересчитываются до dpi; черно-белые
+        # (обычно текст) оставляются в двойном разрешении - OCR к ним чувствительнее
+        return [
+            self.executable, "-q", "-dNOPAUSE", "-dBATCH", "-dSAFER",
+            "-sDEVICE=pdfwrite", "-dCompatibilityLevel=1.5", "-dFastWebView=true",
+            "-dDetectDuplicateImages=true", "-dCompressFonts=true",
+            "-dDownsampleColorImages=true", "-dColorImageDownsampleType=/Bicubic",
+            f"-dColorImageResolution={self.dpi}", "-dColorImageDownsampleThreshold=1.5",
+            "-dDownsampleGrayImages=true", "-dGrayImageDownsampleType=/Bicubic",
+            f"-dGrayImageResolution={self.dpi}", "-dGrayImageDownsampleThreshold=1.5",
+            "-dDownsampleMonoImages=true", "-dMonoImageDownsampleType=/Subsample",
+            f"-dMonoImageResolution={self.dpi * 2}", "-dMonoImageDownsampleThreshold=1.5",
+            f"-sOutputFile={target}", source,
+        ]
+
+    async def compress(self, source: str, target: str,
+                       timeout: Optional[float] = None) -> Optional[CompressionResult]:
+        """Сжатие source в target (timeout по умолчанию - self.timeout).
+
+        Возвращает None при ошибке, таймауте или недоступной утилите. Если выигрыш меньше
+        min_saving, target удаляется и в результате path=None.
+        """
+        if not self.available:
+            return None
+        timeout = self.timeout if timeout is None else timeout
+
+        started = time.perf_counter()
+        process = None
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *self._command(source, target),
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE
+            )
+            _, stderr = await asyncio.wait_for(process.communicate(), timeout=timeout)
+            duration = time.perf_counter() - started
+
+            # qpdf возвращает 3 для файлов, исправленных с предупреждениями
+            if process.returncode not in (0, 3) or not os.path.exists(target):
+                logger.error(f"{self.tool} failed for {source} (code {process.returncode}): "
+                             f"{stderr.decode(errors='replace')[:500]}")
+                self._remove(target)
+                return None
+
+            original_size = os.path.getsize(source)
+            compressed_size = os.path.getsize(target)
+            path = target
+            if compressed_size > original_size * (1 - self.min_saving):
+                self._remove(target)
+                path = None
+            return CompressionResult(self.tool, original_size, compressed_size, duration, path)
+
+        except asyncio.CancelledError:
+            # Таймаут стадии: утилита не должна продолжать работу без владельца
+            if process is not None and process.returncode is None:
+                process.kill()
+            self._remove(target)
+            raise
+        except asyncio.TimeoutError:
+            logger.error(f"{self.tool} timed out after {timeout:.1f}s for {source}")
+            process.kill()
+            await process.wait()
+            self._remove(target)
+            return None
+        except Exception as e:
+            logger.error(f"Error compressing {source}: {e}")
+            self._remove(target)
+            return None
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+        except OSError as e:
+            logger.error(f"Error removing {path}: {e}")
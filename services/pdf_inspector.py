@@ -0,0 +1,309 @@
+import logging
+import mmap
+import re
+import zlib
+from typing import Optional, Dict, Any, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Сколько байт распакованного потока содержимого страницы просматривать
+CONTENT_SNIFF_BYTES = 256 * 1024
+# Где искать %%EOF и startxref от конца файла (после них допускается мусор)
+TAIL_BYTES = 32 * 1024
+
+OBJ_RE = re.compile(rb'(\d+)\s+(\d+)\s+obj\b')
+PAGE_TYPE_RE = re.compile(rb'/Type\s*/Page(?![A-Za-z])')
+PAGES_COUNT_RE = re.compile(rb'/Type\s*/Pages\b')
+COUNT_RE = re.compile(rb'/Count\s+(\d+)')
+MEDIABOX_RE = re.compile(rb'/MediaBox\s*\[\s*([-\d.]+)\s+([-\d.]+)\s+([-\d.]+)\s+([-\d.]+)\s*\]')
+PARENT_RE = re.compile(rb'/Parent\s+(\d+)\s+\d+\s+R')
+CATALOG_RE = re.compile(rb'/Type\s*/Catalog\b')
+PAGES_REF_RE = re.compile(rb'/Pages\s+(\d+)\s+\d+\s+R')
+KIDS_REF_RE = re.compile(rb'/Kids\s+(\d+)\s+\d+\s+R')
+KIDS_ARRAY_RE = re.compile(rb'/Kids\s*\[([^\]]*)\]')
+CONTENTS_REF_RE = re.compile(rb'/Contents\s+(\d+)\s+\d+\s+R')
+CONTENTS_ARRAY_RE = re.compile(rb'/Contents\s*\[([^\]]*)\]')
+REF_RE = re.compile(rb'(\d+)\s+\d+\s+R')
+OBJSTM_RE = re.compile(rb'/Type\s*/ObjStm\b')
+FIRST_RE = re.compile(rb'/First\s+(\d+)')
+# Операторы вывода текста и изображений в потоке содержимого
+TEXT_OP_RE = re.compile(rb'(?:\)|\]|>)\s*(?:Tj|TJ|\'|")|\bBT\b')
+IMAGE_OP_RE = re.compile(rb'\bDo\b|\bBI\b')
+
+
+class PdfInfo:
+    """Результат быстрой проверки PDF"""
+
+    def __init__(self):
+        self.pages = 0
+        self.encrypted = False
+        # None - определить не удалось (например, потоки зашифрованы)
+        self.has_text_layer: Optional[bool] = None
+        # Номера страниц (с 0, в порядке документа), содержащих только изображения
+        self.image_only_pages: List[int] = []
+        self.page_sizes: List[Optional[Tuple[float, float]]] = []  # (ширина, высота) в пунктах
+        self.error: Optional[str] = None
+
+    @property
+    def valid(self) -> bool:
+        return self.error is None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'pages': self.pages,
+            'encrypted': self.encrypted,
+            'has_text_layer': self.has_text_layer,
+            'image_only_pages': len(self.image_only_pages),
+            'error': self.error,
+        }
+
+
+class _ObjectIndex:
+    """Положения объектов в файле без разбора их содержимого.
+
+    Обычные объекты ищутся сканированием 'N G obj' с пропуском тел потоков,
+    объекты из сжатых потоков объектов (/ObjStm) распаковываются отдельно.
+    Более поздние определения (инкрементальные обновления) заменяют ранние.
+    """
+
+    def __init__(self, data: mmap.mmap):
+        self.data = data
+        self.objects: Dict[int, Tuple[int, int]] = {}  # номер -> (начало тела, конец)
+        self.compressed: Dict[int, bytes] = {}  # номер -> тело из потока объектов
+        self._scan()
+
+    def _scan(self):
+        data = self.data
+        pos = 0
+        while True:
+            match = OBJ_RE.search(data, pos)
+            if not match:
+                break
+            end = data.find(b'endobj', match.end())
+            if end < 0:
+                break
+            self.objects[int(match.group(1))] = (match.end(), end)
+            pos = end + 6
+
+        for number, (start, end) in list(self.objects.items()):
+            if OBJSTM_RE.search(self._dict_part(start, end)):
+                self._load_object_stream(number)
+
+    def _dict_part(self, start: int, end: int) -> bytes:
+        stream_pos = self.data.find(b'stream', start, end)
+        return self.data[start:stream_pos if stream_pos >= 0 else end]
+
+    def stream(self, number: int, limit: int = -1) -> Optional[bytes]:
+        """Данные потока объекта (FlateDecode распаковывается, не более limit байт)"""
+        location = self.objects.get(number)
+        if location is None:
+            return None
+        start, end = location
+        stream_pos = self.data.find(b'stream', start, end)
+        if stream_pos < 0:
+            return None
+
+        header = self.data[start:stream_pos]
+        body_start = stream_pos + 6
+        if self.data[body_start:body_start + 2] == b'\r\n':
+            body_start += 2
+        elif self.data[body_start:body_start + 1] in (b'\n', b'\r'):
+            body_start += 1
+        body_end = self.data.rfind(b'endstream', body_start, end)
+        raw = self.data[body_start:body_end if body_end >= 0 else end]
+
+        if b'/Filter' not in header:
+            return raw if limit < 0 else raw[:limit]
+        if b'/FlateDecode' not in header or (b'/DecodeParms' in header and b'/Predictor' in header):
+            # Другие фильтры и предикторы не разбираем
+            return None
+        try:
+            return zlib.decompressobj().decompress(raw, limit if limit > 0 else 0)
+        except zlib.error:
+            return None
+
+    def _load_object_stream(self, number: int):
+        header = self._dict_part(*self.objects[number])
+        first = FIRST_RE.search(header)
+        content = self.stream(number)
+        if not first or not content:
+            return
+
+        first = int(first.group(1))
+        numbers = [int(value) for value in content[:first].split()]
+        pairs = list(zip(numbers[0::2], numbers[1::2]))
+        for index, (obj_number, offset) in enumerate(pairs):
+            obj_end = pairs[index + 1][1] if index + 1 < len(pairs) else len(content) - first
+            self.compressed.setdefault(obj_number, content[first + offset:first + obj_end])
+
+    def body(self, number: int) -> Optional[bytes]:
+        """Словарь объекта (без данных потока)"""
+        location = self.objects.get(number)
+        if location is not None:
+            return self._dict_part(*location)
+        return self.compressed.get(number)
+
+    def items(self):
+        for number, location in self.objects.items():
+            yield number, self._dict_part(*location)
+        for number, body in self.compressed.items():
+            if number not in self.objects:
+                yield number, body
+
+
+def _page_order(index: _ObjectIndex) -> Optional[List[bytes]]:
+    """Словари страниц в порядке документа: обход /Pages -> /Kids от каталога.
+
+    None, если дерево страниц не найдено (тогда страницы берутся в порядке объектов).
+    """
+    root = None
+    for _, body in index.items():
+        if CATALOG_RE.search(body):
+            root = PAGES_REF_RE.search(body)
+            if root:
+                break
+    if root is None:
+        return None
+
+    pages = []
+    seen = set()
+    stack = [int(root.group(1))]
+    while stack:
+        number = stack.pop()
+        if number in seen:
+            continue
+        seen.add(number)
+        body = index.body(number)
+        if body is None:
+            continue
+        if PAGE_TYPE_RE.search(body):
+            pages.append(body)
+            continue
+
+        kids = KIDS_ARRAY_RE.search(body)
+        if kids:
+            refs = REF_RE.findall(kids.group(1))
+        else:
+            # /Kids может ссылаться на отдельный объект-массив
+            kids = KIDS_REF_RE.search(body)
+            target = index.body(int(kids.group(1))) if kids else None
+            refs = REF_RE.findall(target) if target is not None else []
+        # Стек: дети добавляются в обратном порядке, чтобы обходиться слева направо
+        stack.extend(int(ref) for ref in reversed(refs))
+    return pages or None
+
+
+def _page_size(index: _ObjectIndex, body: bytes) -> Optional[Tuple[float, float]]:
+    """MediaBox страницы с учетом наследования от родительских узлов /Pages"""
+    seen = set()
+    while body is not None:
+        match = MEDIABOX_RE.search(body)
+        if match:
+            x0, y0, x1, y1 = (float(value) for value in match.groups())
+            return round(abs(x1 - x0), 1), round(abs(y1 - y0), 1)
+        parent = PARENT_RE.search(body)
+        if not parent or int(parent.group(1)) in seen:
+            return None
+        seen.add(int(parent.group(1)))
+        body = index.body(int(parent.group(1)))
+    return None
+
+
+def _page_content(index: _ObjectIndex, body: bytes) -> Optional[bytes]:
+    """Начало потока(ов) содержимого страницы; None, если прочитать не удалось"""
+    refs = []
+    single = CONTENTS_REF_RE.search(body)
+    if single:
+        target = index.body(int(single.group(1)))
+        # /Contents может ссылаться на массив ссылок
+        if target is not None and target.lstrip().startswith(b'['):
+            refs = [int(ref) for ref in REF_RE.findall(target)]
+        else:
+            refs = [int(single.group(1))]
+    else:
+        array = CONTENTS_ARRAY_RE.search(body)
+        if array:
+            refs = [int(ref) for ref in REF_RE.findall(array.group(1))]
+    if not refs:
+        return b''
+
+    parts = []
+    remaining = CONTENT_SNIFF_BYTES
+    for ref in refs:
+        data = index.stream(ref, remaining)
+        if data is None:
+            return None
+        parts.append(data)
+        remaining -= len(data)
+        if remaining <= 0:
+            break
+    return b'\n'.join(parts)
+
+
+def inspect_pdf(path: str) -> Optional[PdfInfo]:
+    """Быстрая проверка PDF через mmap без полного разбора.
+
+    Возвращает PdfInfo (с error для поврежденного файла) или None, если проверку
+    выполнить не удалось - тогда файл обрабатывается как раньше.
+    """
+    info = PdfInfo()
+    try:
+        with open(path, 'rb') as f:
+            try:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                info.error = "empty file"
+                return info
+
+            with data:
+                if data.find(b'%PDF-', 0, 1024) < 0:
+                    info.error = "missing %PDF header"
+                    return info
+
+                tail_start = max(0, len(data) - TAIL_BYTES)
+                if data.rfind(b'%%EOF', tail_start) < 0 or data.rfind(b'startxref', tail_start) < 0:
+                    info.error = "truncated file (no %%EOF/startxref)"
+                    return info
+
+                info.encrypted = data.find(b'/Encrypt') >= 0
+                index = _ObjectIndex(data)
+
+                page_count = 0
+                pages = []
+                for number, body in index.items():
+                    if PAGE_TYPE_RE.search(body):
+                        pages.append(body)
+                    elif PAGES_COUNT_RE.search(body):
+                        count = COUNT_RE.search(body)
+                        if count:
+                            # Корневой узел /Pages содержит наибольший /Count
+                            page_count = max(page_count, int(count.group(1)))
+
+                # Порядок объектов в файле не совпадает с порядком страниц
+                pages = _page_order(index) or pages
+                info.pages = page_count or len(pages)
+                if info.pages == 0:
+                    info.error = "no pages found"
+                    return info
+
+                text_pages = 0
+                for page_index, body in enumerate(pages):
+                    info.page_sizes.append(_page_size(index, body))
+                    if info.encrypted:
+                        # Потоки зашифрованы - текстовый слой не определить
+                        continue
+                    content = _page_content(index, body)
+                    if content is None:
+                        continue
+                    if TEXT_OP_RE.search(content):
+                        text_pages += 1
+                    elif IMAGE_OP_RE.search(content):
+                        info.image_only_pages.append(page_index)
+
+                if not info.encrypted:
+                    info.has_text_layer = text_pages > 0
+                return info
+
+    except Exception as e:
+        logger.error(f"Error inspecting PDF {path}: {e}")
+        return None
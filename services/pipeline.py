@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import time
+from typing import Optional, Dict, Any, List, Callable, Awaitable, Union
+
+logger = logging.getLogger(__name__)
+
+StageFunc = Callable[[Dict[str, Any]], Awaitable[None]]
+SkipRule = Callable[[Dict[str, Any]], bool]
+Fallback = Callable[[Dict[str, Any]], None]
+# Таймаут стадии: секунды или функция контекста (например, из настроек, взятых задачей)
+Timeout = Union[float, Callable[[Dict[str, Any]], Optional[float]], None]
+
+
+class StageError(Exception):
+    """Ожидаемая ошибка стадии (например, конвертация не удалась) с ключом сообщения для пользователя"""
+
+    def __init__(self, message: str, reason: str = "error"):
+        super().__init__(message)
+        self.reason = reason
+
+
+class PipelineStage:
+    """Именованная стадия конвейера с таймаутом и правилом пропуска.
+
+    Ошибка или таймаут некритичной стадии (critical=False) не останавливает конвейер:
+    вызывается fallback, и выполнение продолжается со следующей стадии.
+    """
+
+    def __init__(self, name: str, func: StageFunc, timeout: Timeout = None,
+                 skip_if: Optional[SkipRule] = None, critical: bool = True,
+                 fallback: Optional[Fallback] = None):
+        self.name = name
+        self.func = func
+        self.timeout = timeout
+        self.skip_if = skip_if
+        self.critical = critical
+        self.fallback = fallback
+
+    def get_timeout(self, context: Dict[str, Any]) -> Optional[float]:
+        return self.timeout(context) if callable(self.timeout) else self.timeout
+
+
+class PipelineRun:
+    """Результат одного прогона конвейера: тайминги стадий, пропуски и ошибка"""
+
+    def __init__(self, pipeline_name: str, context: Dict[str, Any]):
+        self.pipeline_name = pipeline_name
+        self.context = context
+        self.timings: Dict[str, float] = {}
+        self.skipped: List[str] = []
+        # Некритичные стадии, завершившиеся ошибкой
+        self.degraded: List[str] = []
+        self.failed_stage: Optional[str] = None
+        self.error: Optional[BaseException] = None
+        self.total_time = 0.0
+
+    @property
+    def succeeded(self) -> bool:
+        return self.error is None
+
+    def format_timings(self) -> str:
+        """Строка вида 'download=0.42s upload=1.10s ... total=12.3s' для логов"""
+        parts = [f"{name}={duration:.2f}s" for name, duration in self.timings.items()]
+        parts.extend(f"{name}=skipped" for name in self.skipped)
+        parts.extend(f"{name}=failed" for name in self.degraded)
+        parts.append(f"total={self.total_time:.2f}s")
+        return " ".join(parts)
+
+
+class Pipeline:
+    """Декларативный конвейер: стадии выполняются по порядку ровно один раз"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.stages: List[PipelineStage] = []
+
+    def add_stage(self, name: str, func: StageFunc, timeout: Timeout = None,
+                  skip_if: Optional[SkipRule] = None, critical: bool = True,
+                  fallback: Optional[Fallback] = None) -> 'Pipeline':
+        """Добавление стадии (возвращает сам конвейер для цепочек вызовов)"""
+        if any(stage.name == name for stage in self.stages):
+            raise ValueError(f"Stage {name} already registered in pipeline {self.name}")
+
+        self.stages.append(PipelineStage(name, func, timeout, skip_if, critical, fallback))
+        return self
+
+    async def run(self, context: Dict[str, Any]) -> PipelineRun:
+        """Прогон всех стадий; первая ошибка критичной стадии останавливает конвейер и сохраняется в PipelineRun"""
+        run = PipelineRun(self.name, context)
+        run_start = time.perf_counter()
+
+        for stage in self.stages:
+            if stage.skip_if and stage.skip_if(context):
+                run.skipped.append(stage.name)
+                logger.debug(f"Pipeline {self.name}: stage {stage.name} skipped")
+                continue
+
+            stage_start = time.perf_counter()
+            timeout = stage.get_timeout(context)
+            error: Optional[BaseException] = None
+            try:
+                if timeout:
+                    await asyncio.wait_for(stage.func(context), timeout=timeout)
+                else:
+                    await stage.func(context)
+            except asyncio.TimeoutError as e:
+                error = StageError(f"Stage {stage.name} timed out after {timeout}s", "timeout")
+                error.__cause__ = e
+            except Exception as e:
+                error = e
+            finally:
+                run.timings[stage.name] = time.perf_counter() - stage_start
+
+            if error is None:
+                continue
+
+            if not stage.critical:
+                logger.warning(f"Pipeline {self.name}: optional stage {stage.name} failed, continuing: {error}")
+                run.degraded.append(stage.name)
+                if stage.fallback:
+                    stage.fallback(context)
+                continue
+
+            run.failed_stage = stage.name
+            run.error = error
+            logger.error(f"Pipeline {self.name}: stage {stage.name} failed: {error}")
+            break
+
+        run.total_time = time.perf_counter() - run_start
+        return run
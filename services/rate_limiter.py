@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import time
+from typing import Optional, Dict, Any, List, Tuple
+
+from services.database import AsyncDatabase
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Token bucket: capacity токенов, пополнение со скоростью rate токенов в секунду"""
+
+    def __init__(self, capacity: float, rate: float, tokens: Optional[float] = None,
+                 updated_at: Optional[float] = None):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity if tokens is None else min(tokens, capacity)
+        self.updated_at = updated_at if updated_at is not None else time.time()
+
+    def refill(self, now: float):
+        if now > self.updated_at:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """Через сколько секунд будет доступно amount токенов (0 - уже доступно).
+
+        Запрос больше capacity разрешается при полной корзине и уводит её в минус.
+        """
+        needed = min(amount, self.capacity)
+        if needed <= self.tokens:
+            return 0.0
+        return (needed - self.tokens) / self.rate
+
+    @property
+    def full(self) -> bool:
+        return self.tokens >= self.capacity
+
+
+class RateLimiter:
+    """Лимиты пользователей на token bucket в памяти.
+
+    Для каждого измерения (files, bytes, pages) задается объем на окно window секунд
+    и burst - сколько можно израсходовать сразу. Состояние периодически сохраняется
+    в SQLite и восстанавливается после рестарта. Лимит 0 отключает измерение.
+    """
+
+    def __init__(self, db: AsyncDatabase, limits: Dict[str, Tuple[float, float]], window: float = 60.0,
+                 snapshot_interval: float = 30.0):
+        self.db = db
+        self.window = window
+        self.snapshot_interval = snapshot_interval
+        # измерение -> (объем на окно, burst)
+        self.limits = {name: limit for name, limit in limits.items() if limit[0] > 0}
+        self._buckets: Dict[Tuple[int, str], TokenBucket] = {}
+        self._dirty = set()
+        self._task: Optional[asyncio.Task] = None
+
+        self.allowed = 0
+        self.rejected = 0
+
+    def _bucket(self, user_id: int, dimension: str, now: float) -> TokenBucket:
+        key = (user_id, dimension)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            per_window, burst = self.limits[dimension]
+            bucket = self._buckets[key] = TokenBucket(burst, per_window / self.window, updated_at=now)
+        bucket.refill(now)
+        return bucket
+
+    def check(self, user_id: int, files: int = 1, size: int = 0, pages: int = 0) -> Tuple[bool, float]:
+        """Проверка и списание лимитов для файла; возвращает (разрешено, секунд до разрешения)"""
+        now = time.time()
+        amounts = {'files': files, 'bytes': size, 'pages': pages}
+        requested = {name: amount for name, amount in amounts.items() if amount and name in self.limits}
+
+        # Сначала проверяем все измерения, списываем только если проходят все
+        buckets = {name: self._bucket(user_id, name, now) for name in requested}
+        wait = max((buckets[name].wait_time(amount) for name, amount in requested.items()), default=0.0)
+        # Долг по измерениям, списанным позже (например, страницы после разбора PDF), тоже блокирует
+        for name in self.limits:
+            if name not in requested and (user_id, name) in self._buckets:
+                wait = max(wait, self._bucket(user_id, name, now).wait_time(0))
+        if wait > 0:
+            self.rejected += 1
+            return False, wait
+
+        for name, amount in requested.items():
+            buckets[name].tokens -= amount
+            self._dirty.add((user_id, name))
+
+        self.allowed += 1
+        return True, 0.0
+
+    def refund(self, user_id: int, files: int = 0, size: int = 0, pages: int = 0):
+        """Возврат списанного объема, если файл все же не был принят"""
+        now = time.time()
+        for name, amount in (('files', files), ('bytes', size), ('pages', pages)):
+            if amount and name in self.limits:
+                bucket = self._bucket(user_id, name, now)
+                bucket.tokens = min(bucket.tokens + amount, bucket.capacity)
+                self._dirty.add((user_id, name))
+
+    def restore(self, rows: List[Dict[str, Any]]):
+        """Восстановление сохраненного состояния (строки rate_limit_buckets)"""
+        for row in rows:
+            dimension = row['dimension']
+            if dimension not in self.limits:
+                continue
+            per_window, burst = self.limits[dimension]
+            self._buckets[(row['user_id'], dimension)] = TokenBucket(
+                burst, per_window / self.window, row['tokens'], row['updated_at']
+            )
+        logger.info(f"Restored {len(rows)} rate limit buckets")
+
+    def _collect_snapshot(self) -> Tuple[List[Tuple[int, str, float, float]], List[Tuple[int, str]]]:
+        """Измененные корзины: неполные сохраняются, полные удаляются из базы и из памяти"""
+        now = time.time()
+        changed, released = [], []
+        for key in list(self._buckets):
+            bucket = self._buckets[key]
+            bucket.refill(now)
+            if bucket.full:
+                # Полная корзина равнозначна отсутствующей
+                del self._buckets[key]
+                released.append(key)
+            elif key in self._dirty:
+                changed.append((key[0], key[1], bucket.tokens, bucket.updated_at))
+        self._dirty.clear()
+        return changed, released
+
+    async def snapshot(self):
+        """Сохранение состояния в SQLite"""
+        changed, released = self._collect_snapshot()
+        if changed or released:
+            await self.db.save_rate_limit_buckets(changed, released)
+
+    async def start(self):
+        """Восстановление состояния и запуск периодического сохранения"""
+        if self._task:
+            return
+        self.restore(await self.db.load_rate_limit_buckets())
+        self._task = asyncio.create_task(self._snapshot_loop(), name="rate-limit-snapshot")
+
+    async def stop(self):
+        """Остановка с сохранением состояния"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.snapshot()
+
+    async def _snapshot_loop(self):
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            try:
+                await self.snapshot()
+            except Exception as e:
+                logger.error(f"Error saving rate limit snapshot: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Счетчики лимитера"""
+        return {
+            'buckets': len(self._buckets),
+            'allowed': self.allowed,
+            'rejected': self.rejected,
+        }
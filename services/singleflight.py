@@ -0,0 +1,81 @@
+import asyncio
+import logging
+from typing import Optional, Dict, Any
+
+from services.metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Дедупликация одинаковых конвертаций, выполняющихся одновременно.
+
+    Первая задача (лидер) выполняет работу, остальные ждут тот же future.
+    Один future может быть зарегистрирован под несколькими ключами
+    (file_unique_id Telegram и хеш содержимого). Лидер может ждать воркера в очереди,
+    поэтому начало его работы отмечается отдельно (mark_started).
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, asyncio.Future] = {}
+        self._started: Dict[asyncio.Future, asyncio.Event] = {}
+        self.leaders = 0
+        self.hits = 0
+
+    def get(self, key: str) -> Optional[asyncio.Future]:
+        """Незавершенный future по ключу (None, если такой работы сейчас нет)"""
+        future = self._flights.get(key)
+        if future is None or future.done():
+            return None
+        return future
+
+    def lead(self, key: str) -> asyncio.Future:
+        """Регистрация новой работы под ключом"""
+        future = asyncio.get_running_loop().create_future()
+        self._flights[key] = future
+        self._started[future] = asyncio.Event()
+        self.leaders += 1
+        CACHE_REQUESTS.inc(cache='in_flight', result='miss')
+        return future
+
+    def add_key(self, future: asyncio.Future, key: str):
+        """Дополнительный ключ для уже выполняющейся работы"""
+        if not future.done():
+            self._flights[key] = future
+
+    def mark_started(self, future: asyncio.Future):
+        """Лидер начал выполнять работу (взят воркером)"""
+        started = self._started.get(future)
+        if started is not None:
+            started.set()
+
+    async def wait_started(self, future: asyncio.Future):
+        """Ожидание начала работы лидера или её завершения без старта (например, отмены)"""
+        started = self._started.get(future)
+        if started is not None and not future.done():
+            await started.wait()
+
+    async def join(self, future: asyncio.Future) -> Optional[Dict[str, Any]]:
+        """Ожидание результата лидера (None, если лидер завершился ошибкой)"""
+        self.hits += 1
+        CACHE_REQUESTS.inc(cache='in_flight', result='hit')
+        return await asyncio.shield(future)
+
+    def resolve(self, future: asyncio.Future, result: Optional[Dict[str, Any]]):
+        """Передача результата ожидающим и удаление всех ключей этой работы"""
+        if not future.done():
+            future.set_result(result)
+        started = self._started.pop(future, None)
+        if started is not None:
+            started.set()
+
+        for key in [key for key, value in self._flights.items() if value is future]:
+            del self._flights[key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Счетчики дедупликации"""
+        return {
+            'in_flight_keys': len(self._flights),
+            'leaders': self.leaders,
+            'hits': self.hits,
+        }
@@ -0,0 +1,98 @@
+import logging
+import sys
+import time
+from typing import Optional, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class _TimedLoader:
+    """Обертка загрузчика модуля, измеряющая выполнение его кода"""
+
+    def __init__(self, loader, profiler: 'StartupProfiler'):
+        self._loader = loader
+        self._profiler = profiler
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        profiler = self._profiler
+        profiler._stack.append(0.0)
+        started = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            total = time.perf_counter() - started
+            nested = profiler._stack.pop()
+            if profiler._stack:
+                profiler._stack[-1] += total
+            profiler.imports.append((module.__name__, total - nested, total, len(profiler._stack)))
+            # Модуль должен видеть свой настоящий загрузчик
+            if getattr(module, '__loader__', None) is self:
+                module.__loader__ = self._loader
+            spec = getattr(module, '__spec__', None)
+            if spec is not None and spec.loader is self:
+                spec.loader = self._loader
+
+    def __getattr__(self, attr):
+        return getattr(self._loader, attr)
+
+
+class StartupProfiler:
+    """Профиль холодного старта: время импорта каждого модуля и этапы запуска до первого апдейта.
+
+    Устанавливается первым в sys.meta_path до импорта тяжелых модулей, отчет пишется в лог
+    при получении первого апдейта.
+    """
+
+    def __init__(self, started: Optional[float] = None):
+        self.started = started if started is not None else time.perf_counter()
+        # (модуль, собственное время, время с вложенными импортами, глубина)
+        self.imports: List[Tuple[str, float, float, int]] = []
+        self.phases: List[Tuple[str, float]] = []
+        self._stack: List[float] = []
+        self._reported = False
+
+    def install(self):
+        if self not in sys.meta_path:
+            sys.meta_path.insert(0, self)
+
+    def uninstall(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def find_spec(self, name, path=None, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+                    spec.loader = _TimedLoader(spec.loader, self)
+                return spec
+        return None
+
+    def mark(self, phase: str):
+        """Отметка этапа запуска (секунды от старта процесса)"""
+        self.phases.append((phase, time.perf_counter() - self.started))
+
+    def report(self, top: int = 25) -> str:
+        """Самые медленные импорты верхнего уровня и этапы запуска"""
+        lines = ["Startup profile", "Phases:"]
+        lines.extend(f"  {elapsed:8.3f}s  {phase}" for phase, elapsed in self.phases)
+
+        lines.append(f"Slowest imports (cumulative / self, {len(self.imports)} modules):")
+        slowest = sorted(self.imports, key=lambda item: item[2], reverse=True)[:top]
+        for name, own, total, depth in slowest:
+            lines.append(f"  {total * 1000:8.1f}ms {own * 1000:8.1f}ms  {'  ' * min(depth, 6)}{name}")
+        return "\n".join(lines)
+
+    def first_update(self):
+        """Первый апдейт получен: отчет пишется один раз"""
+        if self._reported:
+            return
+        self._reported = True
+        self.mark("first update")
+        self.uninstall()
+        logger.info(self.report())
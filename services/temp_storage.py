@@ -0,0 +1,197 @@
+import asyncio
+import logging
+import os
+import shutil
+import time
+import uuid
+from typing import Optional, Dict, Any, Hashable, Set
+
+from services.metrics import TEMP_STORAGE_WAITS, TEMP_STORAGE_SWEPT
+
+logger = logging.getLogger(__name__)
+
+
+class StorageQuotaExceeded(Exception):
+    """Место под временные файлы не освободилось за отведенное время"""
+
+
+class TempStorage:
+    """Временные файлы задач конвертации.
+
+    Каждая задача получает свою директорию внутри root. Перед записью задача резервирует
+    объем; если общий резерв превысил бы quota_bytes, задача ждет освобождения места
+    (backpressure для воркеров). Периодическая уборка удаляет директории, оставшиеся
+    от задач, которых нет в этом процессе (например, после падения).
+    """
+
+    def __init__(self, root: str, quota_bytes: int = 0, sweep_interval: float = 600.0,
+                 max_age: float = 3600.0, wait_timeout: float = 60.0):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.sweep_interval = sweep_interval
+        self.max_age = max_age
+        self.wait_timeout = wait_timeout
+
+        self._dirs: Dict[Hashable, str] = {}
+        self._reserved: Dict[Hashable, int] = {}
+        self.used = 0
+        # Создается при первом использовании, чтобы привязаться к работающему event loop
+        self._released: Optional[asyncio.Condition] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.waits = 0
+        self.swept = 0
+        self.disk_bytes = 0
+
+    @property
+    def jobs(self) -> int:
+        """Число задач с директорией в хранилище"""
+        return len(self._dirs)
+
+    def _condition(self) -> asyncio.Condition:
+        if self._released is None:
+            self._released = asyncio.Condition()
+        return self._released
+
+    async def reserve(self, key: Hashable, size: int, timeout: Optional[float] = None) -> str:
+        """Резерв size байт для задачи key, возвращает её директорию.
+
+        Повторный вызов для той же задачи только увеличивает резерв при необходимости,
+        прирост проходит ту же проверку квоты.
+        Если места нет дольше timeout (по умолчанию wait_timeout), выбрасывает StorageQuotaExceeded.
+        """
+        timeout = self.wait_timeout if timeout is None else timeout
+        condition = self._condition()
+        async with condition:
+            current = self._reserved.get(key, 0)
+            growth = max(size - current, 0)
+
+            def fits() -> bool:
+                # Файл больше всей квоты допускается, только когда других файлов нет
+                others = self.used - current
+                return not self.quota_bytes or others == 0 or self.used + growth <= self.quota_bytes
+
+            if growth and not fits():
+                self.waits += 1
+                TEMP_STORAGE_WAITS.inc()
+                logger.info(f"Temp storage is full ({self.used}/{self.quota_bytes} bytes), job {key} waits")
+                try:
+                    await asyncio.wait_for(condition.wait_for(fits), timeout=timeout)
+                except asyncio.TimeoutError:
+                    raise StorageQuotaExceeded(
+                        f"No temp storage for {size} bytes within {timeout:.1f}s"
+                    ) from None
+
+            self._reserved[key] = current + growth
+            self.used += growth
+
+        if key in self._dirs:
+            return self._dirs[key]
+
+        directory = os.path.join(self.root, f"job-{key}-{uuid.uuid4().hex[:8]}")
+        await asyncio.to_thread(os.makedirs, directory, exist_ok=True)
+        self._dirs[key] = directory
+        return directory
+
+    async def adjust(self, key: Hashable, size: int):
+        """Уточнение резерва по фактическому размеру файлов задачи"""
+        condition = self._condition()
+        async with condition:
+            if key not in self._reserved:
+                return
+            self.used += size - self._reserved[key]
+            self._reserved[key] = size
+            condition.notify_all()
+
+    async def release(self, key: Hashable):
+        """Удаление директории задачи и освобождение резерва"""
+        directory = self._dirs.pop(key, None)
+        size = self._reserved.pop(key, 0)
+        if directory is None:
+            return
+
+        await asyncio.to_thread(shutil.rmtree, directory, True)
+        condition = self._condition()
+        async with condition:
+            self.used -= size
+            condition.notify_all()
+
+    def sweep(self, active: Optional[Set[str]] = None) -> int:
+        """Удаление чужих и брошенных директорий старше max_age, возвращает их число.
+
+        active - директории живых задач; при запуске в потоке снимок берется в event loop,
+        так как _dirs меняется воркерами.
+        """
+        if active is None:
+            active = set(self._dirs.values())
+        if not os.path.isdir(self.root):
+            return 0
+
+        now = time.time()
+        removed = 0
+        disk_bytes = 0
+        for entry in os.scandir(self.root):
+            try:
+                if entry.path in active or now - entry.stat().st_mtime < self.max_age:
+                    disk_bytes += self._size_on_disk(entry)
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                else:
+                    os.remove(entry.path)
+                removed += 1
+            except OSError as e:
+                logger.error(f"Error sweeping {entry.path}: {e}")
+
+        self.disk_bytes = disk_bytes
+        self.swept += removed
+        TEMP_STORAGE_SWEPT.inc(removed)
+        if removed:
+            logger.info(f"Temp storage sweep removed {removed} orphaned entries")
+        return removed
+
+    @staticmethod
+    def _size_on_disk(entry: os.DirEntry) -> int:
+        if not entry.is_dir(follow_symlinks=False):
+            return entry.stat().st_size
+        total = 0
+        for root, _, files in os.walk(entry.path):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
+
+    async def start(self):
+        """Создание корневой директории и запуск периодической уборки"""
+        if self._task:
+            return
+        await asyncio.to_thread(os.makedirs, self.root, exist_ok=True)
+        self._task = asyncio.create_task(self._sweep_loop(), name="temp-storage-sweep")
+
+    async def stop(self):
+        """Остановка уборки"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _sweep_loop(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.sweep, set(self._dirs.values()))
+            except Exception as e:
+                logger.error(f"Error in temp storage sweep: {e}")
+            await asyncio.sleep(self.sweep_interval)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Занятость временного хранилища"""
+        return {
+            'reserved_bytes': self.used,
+            'quota_bytes': self.quota_bytes,
+            'disk_bytes': self.disk_bytes,
+            'jobs': self.jobs,
+            'waits': self.waits,
+            'swept': self.swept,
+        }
@@ -1,11 +1,16 @@
 import logging
 import re
 import asyncio
-from typing import Optional, List, Dict, Tuple
-from io import BytesIO
-import openpyxl
-import anthropic
-from config.settings import CLAUDE_API_KEY, CLAUDE_MODEL, CLAUDE_ENABLED
+import threading
+import time
+from typing import Optional, List, Dict, Tuple, Callable, Awaitable
+from config.settings import CLAUDE_API_KEY, CLAUDE_MODEL
+from config.runtime import runtime
+from services.metrics import CLAUDE_LATENCY, record_claude_response
+from services.lazy_import import LazyModule
+
+# Тяжелая зависимость импортируется при первом использовании
+anthropic = LazyModule('anthropic')
 
 logger = logging.getLogger(__name__)
 
@@ -13,9 +18,19 @@ class TextEnhancer:
     """Сервис для улучшения качества OCR распознавания с помощью Claude AI"""
     
     def __init__(self):
-        self.claude_client = None
-        if CLAUDE_ENABLED and CLAUDE_API_KEY:
-            self.claude_client = anthropic.Anthropic(api_key=CLAUDE_API_KEY)
+        self._claude_client = None
+    
+    @property
+    def claude_client(self):
+        """Клиент Anthropic (создается при первом обращении), None без ключа API.
+
+        Включен ли Claude, решает вызывающая сторона по настройкам, с которыми началась задача.
+        """
+        if not CLAUDE_API_KEY:
+            return None
+        if self._claude_client is None:
+            self._claude_client = anthropic.Anthropic(api_key=CLAUDE_API_KEY)
+        return self._claude_client
     
     def analyze_text_quality(self, text: str) -> Dict[str, any]:
         """Анализирует качество распознанного текста"""
@@ -257,6 +272,10 @@ class TextEnhancer:
 
     async def enhance_russian_text(self, text: str, context: str = "") -> str:
         """Улучшает русский текст с помощью Claude AI"""
+        return await asyncio.to_thread(self.enhance_russian_text_sync, text, context)
+
+    def enhance_russian_text_sync(self, text: str, context: str = "") -> str:
+        """Синхронный запрос к Claude AI (выполняется вне event loop)"""
         if not self.claude_client:
             logger.warning("Claude AI not available for text enhancement")
             return text
@@ -325,114 +344,131 @@ class TextEnhancer:
 
 Верни ТОЛЬКО исправленный текст в том же формате (строка за строкой), без дополнительных комментариев."""
 
+        started = time.perf_counter()
         try:
-            response = await asyncio.to_thread(
-                self.claude_client.messages.create,
+            response = self.claude_client.messages.create(
                 model=CLAUDE_MODEL,
                 max_tokens=8192,
                 messages=[{"role": "user", "content": prompt}]
             )
+            record_claude_response(response, time.perf_counter() - started)
             
             enhanced_text = response.content[0].text.strip()
             logger.info("Text enhanced successfully with Claude AI")
             return enhanced_text
             
         except Exception as e:
+            CLAUDE_LATENCY.observe(time.perf_counter() - started, outcome='error')
             logger.error(f"Claude AI enhancement failed: {e}")
             return text
     
-    async def process_xlsx_file(self, xlsx_data: bytes, file_name: str = "") -> Optional[bytes]:
-        """Обрабатывает XLSX файл, улучшая качество текста"""
-        if not CLAUDE_ENABLED:
-            logger.info("Claude AI not enabled, returning original file")
-            return xlsx_data
-        
+    async def enhance_workbook(self, workbook, file_name: str = "",
+                               progress_callback: Optional[Callable[[int], Awaitable[None]]] = None,
+                               batch_size: Optional[int] = None) -> Tuple[bool, str]:
+        """Улучшает текст всех листов уже загруженной книги на месте, возвращает (изменения, итоговый текст).
+
+        Обход ячеек openpyxl, анализ текста и запросы к Claude выполняются в отдельном потоке,
+        прогресс передается в event loop. batch_size - ячеек в одном запросе к Claude
+        (по умолчанию текущая настройка CLAUDE_BATCH_SIZE).
+        """
+        batch_size = max(1, runtime.claude_batch_size if batch_size is None else batch_size)
+        loop = asyncio.get_running_loop()
+        cancelled = threading.Event()
+
+        def report_progress(percent: int):
+            if progress_callback:
+                loop.call_soon_threadsafe(lambda: loop.create_task(progress_callback(percent)))
+
         try:
-            # Загружаем файл
-            workbook = openpyxl.load_workbook(BytesIO(xlsx_data))
-            enhancement_performed = False
-            
-            logger.info(f"Processing {len(workbook.sheetnames)} sheets for text enhancement")
-            
-            for sheet_name in workbook.sheetnames:
-                sheet = workbook[sheet_name]
-                logger.info(f"Analyzing sheet: {sheet_name}")
-                
-                # Собираем все ячейки с текстом
-                text_cells = []
-                for row_idx, row in enumerate(sheet.iter_rows(min_row=1), 1):
-                    for col_idx, cell in enumerate(row, 1):
-                        if cell.value and isinstance(cell.value, str):
-                            text_cells.append({
-                                'row': row_idx,
-                                'col': col_idx,
-                                'value': cell.value,
-                                'cell': cell
-                            })
-                
-                if not text_cells:
-                    logger.info(f"No text cells found in sheet {sheet_name}")
-                    continue
-                
-                # Анализируем качество текста для листа
-                all_text = " ".join([cell['value'] for cell in text_cells])
-                quality_analysis = self.analyze_text_quality(all_text)
-                
-                logger.info(f"Sheet {sheet_name} quality score: {quality_analysis['confidence_score']}")
-                
-                # Обрабатываем ВСЕ листы независимо от качества
-                logger.info(f"Enhancing sheet {sheet_name} with {len(text_cells)} text cells")
-                
-                # Группируем ячейки для обработки (по 30 ячеек для соблюдения лимита токенов)
-                batch_size = 30
-                for i in range(0, len(text_cells), batch_size):
-                    batch = text_cells[i:i + batch_size]
-                    
-                    # Объединяем текст из ячеек
-                    batch_text = "\n".join([f"Ячейка {cell['row']},{cell['col']}: {cell['value']}" 
-                                          for cell in batch])
-                    
-                    # Улучшаем текст
-                    enhanced_text = await self.enhance_russian_text(
-                        batch_text, 
-                        f"Таблица '{sheet_name}' из файла '{file_name}'"
-                    )
-                    
-                    # Разбираем результат и обновляем ячейки
-                    enhanced_lines = enhanced_text.split('\n')
-                    for j, line in enumerate(enhanced_lines):
-                        if j >= len(batch):
-                            break
-                        
-                        # Извлекаем новое значение ячейки
-                        if ': ' in line:
-                            new_value = line.split(': ', 1)[1].strip()
-                            if new_value and new_value != batch[j]['value']:
-                                batch[j]['cell'].value = new_value
-                                enhancement_performed = True
-                                logger.debug(f"Enhanced cell {batch[j]['row']},{batch[j]['col']}: "
-                                           f"'{batch[j]['value']}' -> '{new_value}'")
-                
-                logger.info(f"Completed enhancement for sheet {sheet_name}")
-            
-            if enhancement_performed:
-                # Сохраняем улучшенный файл
-                output_buffer = BytesIO()
-                workbook.save(output_buffer)
-                enhanced_data = output_buffer.getvalue()
-                logger.info("XLSX file enhancement completed successfully")
-                return enhanced_data
-            else:
-                logger.info("No enhancement was needed")
-                return xlsx_data
-                
-        except ImportError as e:
-            logger.error(f"Required package not available: {e}")
-            return xlsx_data
-        except Exception as e:
-            logger.error(f"Error processing XLSX file: {e}")
-            return xlsx_data
-    
+            return await asyncio.to_thread(
+                self._enhance_workbook_sync, workbook, file_name, report_progress, batch_size, cancelled
+            )
+        except asyncio.CancelledError:
+            # Таймаут стадии: поток прекращает запросы к Claude после текущего пакета
+            cancelled.set()
+            raise
+
+    def _enhance_workbook_sync(self, workbook, file_name: str, report_progress: Callable[[int], None],
+                               batch_size: int, cancelled: threading.Event) -> Tuple[bool, str]:
+        enhancement_performed = False
+        final_text_parts: List[str] = []
+        sheet_count = len(workbook.sheetnames)
+
+        logger.info(f"Processing {len(workbook.sheetnames)} sheets for text enhancement")
+
+        for sheet_index, sheet_name in enumerate(workbook.sheetnames):
+            sheet = workbook[sheet_name]
+            logger.info(f"Analyzing sheet: {sheet_name}")
+
+            # Собираем все ячейки с текстом
+            text_cells = []
+            for row_idx, row in enumerate(sheet.iter_rows(min_row=1), 1):
+                for col_idx, cell in enumerate(row, 1):
+                    if cell.value and isinstance(cell.value, str):
+                        text_cells.append({
+                            'row': row_idx,
+                            'col': col_idx,
+                            'value': cell.value,
+                            'cell': cell
+                        })
+
+            if not text_cells:
+                logger.info(f"No text cells found in sheet {sheet_name}")
+                continue
+
+            # Анализируем качество текста для листа
+            all_text = " ".join([cell['value'] for cell in text_cells])
+            quality_analysis = self.analyze_text_quality(all_text)
+
+            logger.info(f"Sheet {sheet_name} quality score: {quality_analysis['confidence_score']}")
+
+            # Обрабатываем ВСЕ листы независимо от качества
+            logger.info(f"Enhancing sheet {sheet_name} with {len(text_cells)} text cells")
+
+            # Группируем ячейки для обработки (размер пакета ограничен лимитом токенов)
+            for i in range(0, len(text_cells), batch_size):
+                if cancelled.is_set():
+                    logger.info(f"Enhancement of {file_name} cancelled")
+                    return enhancement_performed, " ".join(final_text_parts)
+                batch = text_cells[i:i + batch_size]
+
+                # Объединяем текст из ячеек
+                batch_text = "\n".join([f"Ячейка {cell['row']},{cell['col']}: {cell['value']}"
+                                      for cell in batch])
+
+                # Улучшаем текст
+                enhanced_text = self.enhance_russian_text_sync(
+                    batch_text,
+                    f"Таблица '{sheet_name}' из файла '{file_name}'"
+                )
+
+                # Разбираем результат и обновляем ячейки
+                enhanced_lines = enhanced_text.split('\n')
+                for j, line in enumerate(enhanced_lines):
+                    if j >= len(batch):
+                        break
+
+                    # Извлекаем новое значение ячейки
+                    if ': ' in line:
+                        new_value = line.split(': ', 1)[1].strip()
+                        if new_value and new_value != batch[j]['value']:
+                            batch[j]['cell'].value = new_value
+                            enhancement_performed = True
+                            logger.debug(f"Enhanced cell {batch[j]['row']},{batch[j]['col']}: "
+                                       f"'{batch[j]['value']}' -> '{new_value}'")
+
+                # Прогресс: доля обработанных пакетов с учетом уже пройденных листов
+                sheet_done = min(i + batch_size, len(text_cells)) / len(text_cells)
+                report_progress(int((sheet_index + sheet_done) * 100 / sheet_count))
+
+            # Итоговый текст листа собираем здесь же, чтобы не разбирать файл повторно
+            final_text_parts.extend(cell['cell'].value for cell in text_cells
+                                    if isinstance(cell['cell'].value, str))
+
+            logger.info(f"Completed enhancement for sheet {sheet_name}")
+
+        return enhancement_performed, " ".join(final_text_parts)
+
     def get_enhancement_stats(self, original_text: str, enhanced_text: str) -> Dict[str, any]:
         """Возвращает статистику улучшений"""
         original_analysis = self.analyze_text_quality(original_text)
@@ -0,0 +1,270 @@
+import re
+import logging
+from io import BytesIO
+from typing import Optional, Dict, Any, List, Callable, Awaitable
+
+from services.lazy_import import LazyModule
+
+# openpyxl нужен только при обработке результата - не при запуске бота
+openpyxl = LazyModule('openpyxl')
+
+logger = logging.getLogger(__name__)
+
+# Максимально расширенный словарь замен украинских символов
+UKRAINIAN_TO_RUSSIAN_CHARS = {
+    # Основные украинские символы
+    'ї': 'и', 'Ї': 'И',
+    'і': 'и', 'І': 'И',
+    'є': 'е', 'Є': 'Е',
+    'ґ': 'г', 'Ґ': 'Г',
+    'ў': 'у', 'Ў': 'У',
+
+    # Дополнительные символы
+    'ъ': 'ь',  # твердый знак
+    'ы': 'и',  # ы не используется в украинском
+    'э': 'е',  # э редко используется
+
+    # Возможные искажения при OCR
+    'ѐ': 'е',  # е с ударением
+    'ѓ': 'г', 'Ѓ': 'Г',  # г с ударением
+    'ќ': 'к', 'Ќ': 'К',  # к с ударением
+}
+
+# Максимально расширенный словарь украинских слов и конструкций
+UKRAINIAN_TO_RUSSIAN_WORDS = {
+    # Основные административные термины
+    'Муніципальне': 'Муниципальное',
+    'муніципальне': 'муниципальное',
+    'Муніципальний': 'Муниципальный',
+    'муніципальний': 'муниципальный',
+    'Свідетельство': 'Свидетельство',
+    'свідетельство': 'свидетельство',
+    'свідоцтво': 'свидетельство',
+    'Свідоцтво': 'Свидетельство',
+
+    # Документооборот
+    'ІНН': 'ИНН', 'іНН': 'ИНН', 'інн': 'ИНН',
+    'КПП': 'КПП', 'кпп': 'КПП',
+    'ОГРН': 'ОГРН', 'огрн': 'ОГРН',
+    'БІК': 'БИК', 'бік': 'БИК',
+    'реєстраційний': 'регистрационный',
+    'Реєстраційний': 'Регистрационный',
+    'реєстрація': 'регистрация',
+    'Реєстрація': 'Регистрация',
+
+    # Временные конструкции
+    'року': 'года', 'Року': 'Года',
+    'рік': 'год', 'Рік': 'Год',
+    'місяць': 'месяц', 'Місяць': 'Месяц',
+    'день': 'день', 'День': 'День',
+    'жовтня': 'октября', 'Жовтня': 'Октября',
+    'березня': 'марта', 'Березня': 'Марта',
+    'квітня': 'апреля', 'Квітня': 'Апреля',
+    'травня': 'мая', 'Травня': 'Мая',
+    'червня': 'июня', 'Червня': 'Июня',
+    'липня': 'июля', 'Липня': 'Июля',
+    'серпня': 'августа', 'Серпня': 'Августа',
+    'вересня': 'сентября', 'Вересня': 'Сентября',
+    'листопада': 'ноября', 'Листопада': 'Ноября',
+    'грудня': 'декабря', 'Грудня': 'Декабря',
+    'січня': 'января', 'Січня': 'Января',
+    'лютого': 'февраля', 'Лютого': 'Февраля',
+
+    # Украинские окончания и суффиксы
+    'українськ': 'русск', 'Українськ': 'Русск',
+    'ський': 'ский', 'Ський': 'Ский',
+    'цький': 'цкий', 'Цький': 'Цкий',
+    'тися': 'ться', 'Тися': 'Ться',
+    'ння': 'ние', 'Ння': 'Ние',
+    'ення': 'ение', 'Ення': 'Ение',
+    'ання': 'ание', 'Ання': 'Ание',
+    'ування': 'ование', 'Ування': 'Ование',
+
+    # Предлоги и союзы
+    'з дня': 'с дня', 'З дня': 'С дня',
+    'до дня': 'до дня', 'До дня': 'До дня',
+    'від': 'от', 'Від': 'От',
+    'для': 'для', 'Для': 'Для',
+    'при': 'при', 'При': 'При',
+    'під': 'под', 'Під': 'Под',
+    'над': 'над', 'Над': 'Над',
+    'через': 'через', 'Через': 'Через',
+
+    # Образовательные термины
+    'учреждение': 'учреждение',
+    'установа': 'учреждение', 'Установа': 'Учреждение',
+    'заклад': 'учреждение', 'Заклад': 'Учреждение',
+    'общеобразовательное': 'общеобразовательное',
+    'загальноосвітнє': 'общеобразовательное',
+    'Загальноосвітнє': 'Общеобразовательное',
+    'аккредитации': 'аккредитации',
+    'акредитації': 'аккредитации',
+    'Акредитації': 'Аккредитации',
+    'школа': 'школа', 'Школа': 'Школа',
+    'середня': 'средняя', 'Середня': 'Средняя',
+    'гімназія': 'гимназия', 'Гімназія': 'Гимназия',
+    'ліцей': 'лицей', 'Ліцей': 'Лицей',
+
+    # Географические термины
+    'область': 'область', 'Область': 'Область',
+    'район': 'район', 'Район': 'Район',
+    'місто': 'город', 'Місто': 'Город',
+    'село': 'село', 'Село': 'Село',
+    'вулиця': 'улица', 'Вулиця': 'Улица',
+    'будинок': 'дом', 'Будинок': 'Дом',
+    'квартира': 'квартира', 'Квартира': 'Квартира',
+
+    # Банковские термины
+    'банк': 'банк', 'Банк': 'Банк',
+    'рахунок': 'счет', 'Рахунок': 'Счет',
+    'розрахунковий': 'расчетный', 'Розрахунковий': 'Расчетный',
+    'кореспондентський': 'корреспондентский',
+    'Кореспондентський': 'Корреспондентский',
+
+    # Конкретные названия из документа
+    'Волгоградська': 'Волгоградская',
+    'Серафимовичський': 'Серафимовичский',
+    'Бобровська': 'Бобровская',
+    'Центральна': 'Центральная',
+    'казенне': 'казенное', 'Казенне': 'Казенное',
+    'державне': 'государственное', 'Державне': 'Государственное',
+
+    # Дополнительные часто встречающиеся слова
+    'директор': 'директор', 'Директор': 'Директор',
+    'керівник': 'руководитель', 'Керівник': 'Руководитель',
+    'завідувач': 'заведующий', 'Завідувач': 'Заведующий',
+    'працівник': 'работник', 'Працівник': 'Работник',
+    'співробітник': 'сотрудник', 'Співробітник': 'Сотрудник',
+}
+
+# Замены украинских слов с границами слов (компилируются один раз)
+_WORD_BOUNDARY_PATTERNS = [
+    (re.compile(r'\b' + re.escape(ukr_word) + r'\b', re.IGNORECASE), rus_word)
+    for ukr_word, rus_word in UKRAINIAN_TO_RUSSIAN_WORDS.items()
+]
+
+# Дополнительные паттерны для украинских конструкций
+_CONSTRUCTION_PATTERNS = [
+    (re.compile(pattern, re.IGNORECASE), replacement)
+    for pattern, replacement in [
+        # Временные конструкции
+        (r'\bна\s+(\d+)\s+року\b', r'на \1 года'),
+        (r'\bу\s+(\d+)\s+році\b', r'в \1 году'),
+        (r'\b(\d+)\s+року\b', r'\1 года'),
+        (r'\b(\d+)\s+рік\b', r'\1 год'),
+
+        # Украинские предлоги
+        (r'\bз\s+(\d+)', r'с \1'),
+        (r'\bдо\s+(\d+)', r'до \1'),
+        (r'\bвід\s+(\d+)', r'от \1'),
+
+        # Украинские падежные окончания
+        (r'([а-яё]+)ський\b', r'\1ский'),
+        (r'([а-яё]+)цький\b', r'\1цкий'),
+        (r'([а-яё]+)ння\b', r'\1ние'),
+        (r'([а-яё]+)ення\b', r'\1ение'),
+        (r'([а-яё]+)ання\b', r'\1ание'),
+    ]
+]
+
+
+def replace_ukrainian_text(value: str) -> str:
+    """Принудительная замена украинских символов и слов на русские в строке"""
+    new_value = value
+
+    # Заменяем украинские символы
+    for ukr_char, rus_char in UKRAINIAN_TO_RUSSIAN_CHARS.items():
+        new_value = new_value.replace(ukr_char, rus_char)
+
+    # Заменяем украинские слова (точная замена)
+    for ukr_word, rus_word in UKRAINIAN_TO_RUSSIAN_WORDS.items():
+        new_value = new_value.replace(ukr_word, rus_word)
+
+    # Заменяем украинские слова с границами слов
+    for pattern, rus_word in _WORD_BOUNDARY_PATTERNS:
+        new_value = pattern.sub(rus_word, new_value)
+
+    # Дополнительные паттерны для украинских конструкций
+    for pattern, replacement in _CONSTRUCTION_PATTERNS:
+        new_value = pattern.sub(replacement, new_value)
+
+    return new_value
+
+
+class WorkbookProcessor:
+    """Обработка XLSX в памяти: одна загрузка, все проходы над одной книгой, одна сериализация"""
+
+    def __init__(self, xlsx_data: bytes, file_name: str = ""):
+        self.original_data = xlsx_data
+        self.file_name = file_name
+        self.workbook = openpyxl.load_workbook(BytesIO(xlsx_data))
+        self.modified = False
+        self.replacements_made = 0
+        self.enhancement_performed = False
+
+        # Тексты для статистики собираются во время проходов, без повторного разбора файла
+        self.original_text = ""
+        self.enhanced_text: Optional[str] = None
+
+    def apply_forced_replacement(self) -> int:
+        """Проход принудительной замены украинских символов по всем текстовым ячейкам"""
+        logger.info(f"Принудительная замена украинских символов в файле {self.file_name}")
+
+        original_parts: List[str] = []
+        replacements_made = 0
+
+        for sheet in self.workbook.worksheets:
+            for row in sheet.iter_rows():
+                for cell in row:
+                    if cell.value and isinstance(cell.value, str):
+                        original_value = cell.value
+                        original_parts.append(original_value)
+
+                        new_value = replace_ukrainian_text(original_value)
+
+                        # Если были изменения, обновляем ячейку
+                        if new_value != original_value:
+                            cell.value = new_value
+                            replacements_made += 1
+                            logger.debug(f"Заменено: '{original_value}' → '{new_value}'")
+
+        self.original_text = " ".join(original_parts)
+        self.replacements_made += replacements_made
+
+        if replacements_made > 0:
+            self.modified = True
+            logger.info(f"Выполнено {replacements_made} замен украинских символов/слов")
+        else:
+            logger.info("Украинские символы не найдены")
+
+        return replacements_made
+
+    async def enhance(self, enhancer, progress_callback: Optional[Callable[[int], Awaitable[None]]] = None,
+                      batch_size: Optional[int] = None) -> bool:
+        """Проход улучшения текста с помощью TextEnhancer над той же книгой"""
+        performed, enhanced_text = await enhancer.enhance_workbook(
+            self.workbook, self.file_name, progress_callback, batch_size
+        )
+        self.enhanced_text = enhanced_text
+
+        if performed:
+            self.enhancement_performed = True
+            self.modified = True
+
+        return performed
+
+    def get_enhancement_stats(self, enhancer) -> Optional[Dict[str, Any]]:
+        """Статистика улучшений по текстам, собранным во время проходов"""
+        if self.enhanced_text is None or not self.enhancement_performed:
+            return None
+
+        return enhancer.get_enhancement_stats(self.original_text, self.enhanced_text)
+
+    def to_bytes(self) -> bytes:
+        """Единственная сериализация книги (если изменений не было - исходные данные)"""
+        if not self.modified:
+            return self.original_data
+
+        output_buffer = BytesIO()
+        self.workbook.save(output_buffer)
+        return output_buffer.getvalue()
@@ -4,6 +4,8 @@
 """
 
 import sys
+import math
+import time
 import sqlite3
 from pathlib import Path
 from datetime import datetime, timedelta
@@ -14,6 +16,26 @@ sys.path.insert(0, str(root_dir))
 
 from services.database import Database
 
+# Границы групп размера файла (МБ) для отчета по стадиям
+SIZE_BUCKETS_MB = [1, 5, 20, 100]
+
+def size_bucket(file_size) -> str:
+    """Группа размера файла для отчета"""
+    if not file_size:
+        return "?"
+    size_mb = file_size / (1024 * 1024)
+    lower = 0
+    for upper in SIZE_BUCKETS_MB:
+        if size_mb < upper:
+            return f"{lower}-{upper} МБ"
+        lower = upper
+    return f">{lower} МБ"
+
+def percentile(values, p: float) -> float:
+    """Перцентиль по ближайшему рангу (values отсортированы)"""
+    index = max(0, min(len(values) - 1, math.ceil(p / 100 * len(values)) - 1))
+    return values[index]
+
 class AdminUtils:
     def __init__(self, db_path: str = "bot.db"):
         self.db = Database(db_path)
@@ -83,34 +105,72 @@ class AdminUtils:
             print(f"⏰ Started: {created_at}")
             print()
     
-    def clean_old_logs(self, days: int = 30):
-        """Очистка старых логов"""
-        cutoff_date = datetime.now() - timedelta(days=days)
+    def clean_old_logs(self, days: int = 30, batch_size: int = 500):
+        """Свертка старых логов в дневные агрегаты и удаление сырых записей небольшими пачками"""
+        rolled = self.db.rollup_daily_stats()
+        if rolled:
+            print(f"📦 Свернуто дней в агрегаты: {rolled}")
         
-        with self.db.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Подсчитываем количество записей для удаления
-            cursor.execute('''
-                SELECT COUNT(*) FROM operations_log 
-                WHERE created_at < ?
-            ''', (cutoff_date.isoformat(),))
-            
-            count = cursor.fetchone()[0]
-            
-            if count == 0:
-                print(f"Нет записей старше {days} дней для удаления")
-                return
-            
-            # Удаляем старые записи
-            cursor.execute('''
-                DELETE FROM operations_log 
-                WHERE created_at < ?
-            ''', (cutoff_date.isoformat(),))
-            
-            conn.commit()
-            
-            print(f"🗑️ Удалено {count} записей старше {days} дней")
+        cutoff_day = (datetime.utcnow().date() - timedelta(days=days)).isoformat()
+        
+        # Короткие транзакции не блокируют запись работающего бота
+        total = 0
+        while True:
+            deleted = self.db.prune_operations_log(cutoff_day, batch_size)
+            total += deleted
+            if deleted < batch_size:
+                break
+            time.sleep(0.05)
+        
+        if total == 0:
+            print(f"Нет записей старше {days} дней для удаления")
+            return
+        
+        print(f"🗑️ Удалено {total} записей старше {days} дней (история сохранена в агрегатах)")
+    
+    def show_stage_timings(self, hours: int = 24, by: str = None):
+        """Показать p50/p90/p99 длительности стадий за окно (с разбивкой по размеру или стратегии)"""
+        since = (datetime.utcnow() - timedelta(hours=hours)).strftime('%Y-%m-%d %H:%M:%S')
+        rows = self.db.get_stage_timings(since)
+        
+        groups = {}
+        for row in rows:
+            if by == 'size':
+                group = size_bucket(row['file_size'])
+            elif by == 'strategy':
+                group = row['strategy'] or '-'
+            else:
+                group = ''
+            groups.setdefault((row['stage'], group), []).append(row['duration_ms'] / 1000)
+        
+        print(f"\n⏱ Длительность стадий за {hours} ч")
+        print("=" * 80)
+        
+        if not groups:
+            print("Нет данных")
+            return
+        
+        print(f"{'Стадия':<20} {'Группа':<24} {'N':>6} {'p50':>8} {'p90':>8} {'p99':>8}")
+        for (stage, group), values in sorted(groups.items()):
+            values.sort()
+            print(f"{stage:<20} {group:<24} {len(values):>6} {percentile(values, 50):>7.2f}s "
+                  f"{percentile(values, 90):>7.2f}s {percentile(values, 99):>7.2f}s")
+    
+    def show_history(self, days: int = 14):
+        """Показать статистику по дням"""
+        history = self.db.get_daily_stats(days)
+        
+        print(f"\n📅 Статистика за {days} дней")
+        print("=" * 70)
+        
+        if not history:
+            print("Нет данных")
+            return
+        
+        for day in history:
+            size_mb = (day['total_bytes'] or 0) / (1024 * 1024)
+            print(f"{day['day']} | Операций: {day['operations']} | ✅ {day['successful']} | "
+                  f"❌ {day['errors']} | 👥 {day['users']} | {size_mb:.1f} МБ")
     
     def clear_active_tasks(self):
         """Очистка всех активных задач"""
@@ -133,13 +193,11 @@ class AdminUtils:
         """Показать топ пользователей по активности"""
         with self.db.get_connection() as conn:
             cursor = conn.cursor()
+            # Агрегаты по пользователям поддерживаются триггерами (см. user_stats)
             cursor.execute('''
-                SELECT user_id, username, COUNT(*) as operations,
-                       SUM(CASE WHEN status = 'completed' THEN 1 ELSE 0 END) as successful,
-                       MAX(created_at) as last_activity
-                FROM operations_log 
-                GROUP BY user_id 
-                ORDER BY operations DESC 
+                SELECT user_id, username, operations, successful, last_activity
+                FROM user_stats
+                ORDER BY operations DESC
                 LIMIT ?
             ''', (limit,))
             
@@ -185,6 +243,15 @@ def main():
     users_parser = subparsers.add_parser('users', help='Показать топ пользователей')
     users_parser.add_argument('--limit', type=int, default=10, help='Количество пользователей')
     
+    # Команда timings
+    timings_parser = subparsers.add_parser('timings', help='Показать перцентили длительности стадий')
+    timings_parser.add_argument('--hours', type=int, default=24, help='Окно в часах')
+    timings_parser.add_argument('--by', choices=['size', 'strategy'], help='Разбивка по размеру файла или стратегии')
+    
+    # Команда history
+    history_parser = subparsers.add_parser('history', help='Показать статистику по дням')
+    history_parser.add_argument('--days', type=int, default=14, help='Количество дней')
+    
     args = parser.parse_args()
     
     if not args.command:
@@ -213,6 +280,12 @@ def main():
         
         elif args.command == 'users':
             admin.show_top_users(args.limit)
+        
+        elif args.command == 'timings':
+            admin.show_stage_timings(args.hours, args.by)
+        
+        elif args.command == 'history':
+            admin.show_history(args.days)
     
     except Exception as e:
         print(f"❌ Ошибка: {e}")